@@ -1,14 +1,132 @@
 import streamlit as st
 import os
 import sys
+import time
 
 # Make sure Python can find models/ and config/
 sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '../..')))
 
-from models.llm import get_chatgroq_model
-from models.embeddings import EmbeddingClient
-from utils.rag import build_knowledge_base
+from models.llm import get_chat_model
+from config.config import get_config
+from utils.rag import build_knowledge_base, pin_vectorstore, unpin_vectorstore
+from utils.build_jobs import BuildJob, BuildJobs
+from utils.index_manager import IndexManager, index_build_kwargs, index_manager_from_config
+from utils.watcher import DocsWatcher
 from utils.assistant import answer_query
+from utils.accounting import default_ledger, hour_key
+from utils.hot_cache import HotCaches
+from utils.prefetch import Prefetcher, load_sessions
+
+
+@st.cache_resource
+def get_index_manager() -> IndexManager:
+    """One index manager per process: tenants' indexes shared by all sessions."""
+    return index_manager_from_config()
+
+
+@st.cache_resource
+def get_build_jobs() -> BuildJobs:
+    """Background knowledge-base builds, at most one per tenant."""
+    return BuildJobs()
+
+
+def start_build_job(manager: IndexManager, tenant: str) -> BuildJob:
+    """Build the tenant's index in the background; the result replaces its snapshot."""
+
+    def make_job() -> BuildJob:
+        job = BuildJob(
+            manager.docs_dir(tenant),
+            manager.embed_client(tenant),
+            build_kwargs=manager.build_kwargs_for(tenant),
+        )
+        job.on_done = lambda vectorstore: manager.install(
+            tenant, vectorstore, job.progress()["elapsed_s"] * 1000
+        )
+        return job
+
+    return get_build_jobs().start(tenant, make_job)
+
+
+@st.fragment(run_every=1.0)
+def build_progress(tenant: str):
+    """Live progress of the tenant's background build (refreshes every second)."""
+    job = get_build_jobs().get(tenant)
+    if job is None:
+        return
+
+    p = job.progress()
+    if job.running:
+        eta = f" · ETA {p['eta_s']:.0f}s" if p["eta_s"] is not None else ""
+        st.progress(
+            p["fraction"],
+            text=(
+                f"{p['state'].capitalize()}: {p['docs_read']}/{p['docs_total']} docs, "
+                f"{p['chunks_embedded']}/{p['chunks_total']} chunks{eta}"
+            ),
+        )
+        if p["partial_chunks"]:
+            st.caption(f"Answering from the {p['partial_chunks']} chunks indexed so far.")
+        if st.button("✖ Cancel build"):
+            job.cancel()
+    elif p["state"] == "done" and p["finish_error"]:
+        st.warning(f"Built in {p['elapsed_s']:.1f}s, but saving the index failed: {p['finish_error']}")
+    elif p["state"] == "done":
+        st.caption(f"Built in {p['elapsed_s']:.1f}s.")
+    elif p["state"] == "cancelled":
+        st.caption("Build cancelled.")
+    elif p["state"] == "failed":
+        st.error(f"Build failed: {p['error']}")
+
+
+@st.cache_resource
+def get_docs_watcher(docs_dir: str, _embed_client) -> DocsWatcher:
+    """One background docs watcher per docs directory, shared by all sessions."""
+    config = get_config()
+    return DocsWatcher(
+        docs_dir,
+        _embed_client,
+        store_backend=config.get("VECTORSTORE_BACKEND", "numpy"),
+        store_dir=config.get("VECTORSTORE_DIR") or None,
+        **index_build_kwargs(config),
+    ).start()
+
+
+@st.cache_resource
+def get_prefetcher() -> Prefetcher:
+    """Follow-up prefetcher shared by all sessions, seeded from past sessions if configured."""
+    config = get_config()
+    path = config.get("PREFETCH_SESSIONS_PATH")
+    sessions = load_sessions(path) if path and os.path.isfile(path) else []
+    return Prefetcher(sessions, max_follow_ups=config.get("PREFETCH_FOLLOW_UPS", 3))
+
+
+@st.cache_resource
+def get_hot_caches() -> HotCaches:
+    """Embedding, retrieval and web caches shared by all sessions, reloaded from the last snapshot."""
+    config = get_config()
+    caches = HotCaches(
+        max_entries=config.get("HOT_CACHE_ENTRIES", 2048),
+        web_ttl_s=config.get("WEB_CACHE_TTL_S", 300.0),
+    )
+    path = config.get("CACHE_SNAPSHOT_PATH")
+    if not path:
+        caches.ready.set()
+        return caches
+
+    manager = get_index_manager()
+
+    def valid_versions():
+        # Loading the embedding models here also warms them up
+        models = {manager.embed_client(t).model_name for t in manager.tenants}
+        return manager.index_versions(), models
+
+    caches.rehydrate_async(path, valid_versions)
+    caches.start_snapshots(
+        path,
+        interval_s=config.get("CACHE_SNAPSHOT_INTERVAL_S", 300.0),
+        top=config.get("CACHE_SNAPSHOT_TOP", 500),
+    )
+    return caches
 
 
 def instructions_page():
@@ -61,13 +179,13 @@ def chat_page():
     # Load selected response mode from sidebar
     mode = st.session_state.get("mode", "Concise")
 
-    # Get Groq chat model
-    chat_model = get_chatgroq_model()
+    # Get chat model (single provider, or a router over several)
+    chat_model = get_chat_model()
 
     # If no model (e.g., no API key), show info and exit
     if chat_model is None:
         st.info(
-            "🔧 No Groq API key found. Please set GROQ_API_KEY in your environment, then reload the app."
+            "🔧 No LLM API key found. Please set GROQ_API_KEY (or OPENAI_API_KEY / GOOGLE_API_KEY) in your environment, then reload the app."
         )
         return
 
@@ -89,25 +207,88 @@ def chat_page():
         with st.chat_message("user"):
             st.markdown(prompt)
 
-        # Check if Knowledge Base is built
-        if "embed_client" not in st.session_state or "vectorstore" not in st.session_state:
-            with st.chat_message("assistant"):
-                st.error("❌ Knowledge Base not built yet. Click '📚 Build Knowledge Base' in the sidebar.")
-            return
-
-        embed_client = st.session_state["embed_client"]
-        vectorstore = st.session_state["vectorstore"]
+        # Auto-update mode: always use the latest published index
+        watcher = st.session_state.get("docs_watcher")
+        if watcher is not None and watcher.vectorstore is not None:
+            st.session_state["embed_client"] = watcher.embed_client
+            st.session_state["vectorstore"] = watcher.vectorstore
+
+        if "embed_client" in st.session_state and "vectorstore" in st.session_state:
+            embed_client = st.session_state["embed_client"]
+            vectorstore = st.session_state["vectorstore"]
+        else:
+            # Shared per-tenant index: loaded from its snapshot on demand. With
+            # no snapshot yet, it is built in the background and queries are
+            # answered from the part embedded so far.
+            manager = get_index_manager()
+            tenant = st.session_state.get("tenant", next(iter(manager.tenants)))
+            vectorstore = manager.get_resident(tenant)
+            try:
+                if vectorstore is None:
+                    job = get_build_jobs().get(tenant)
+                    if (job is None or not job.running) and not manager.has_snapshot(tenant):
+                        job = start_build_job(manager, tenant)
+                    if job is not None and job.running:
+                        vectorstore = job.vectorstore
+                    else:
+                        with st.spinner("Loading knowledge base..."):
+                            vectorstore = manager.get(tenant)
+                embed_client = manager.embed_client(tenant)
+            except Exception as e:
+                with st.chat_message("assistant"):
+                    st.error(f"❌ Could not load the knowledge base: {e}")
+                return
+
+            if vectorstore is None:
+                with st.chat_message("assistant"):
+                    st.info("⏳ The knowledge base is still being built. Please try again in a few seconds.")
+                return
+
+        # Keep this version's store open until the answer is done, even if
+        # an eviction or a rebuild replaces it meanwhile
+        while not pin_vectorstore(vectorstore):
+            # Closed since it was looked up: use the current version
+            if watcher is not None and watcher.vectorstore is not None:
+                vectorstore = st.session_state["vectorstore"] = watcher.vectorstore
+            else:
+                manager = get_index_manager()
+                vectorstore = manager.get(st.session_state.get("tenant", next(iter(manager.tenants))))
+
+        # Per-conversation cache of retrieval prefetched for likely follow-ups
+        prefetch = None
+        if get_config().get("PREFETCH_ENABLED", False):
+            if "prefetch" not in st.session_state:
+                st.session_state["prefetch"] = get_prefetcher().session()
+            prefetch = st.session_state["prefetch"]
+
+        # Right after a restart, give the cache reload a moment to finish
+        caches = get_hot_caches()
+        if not caches.ready.is_set():
+            with st.spinner("Warming up caches..."):
+                caches.wait_ready(get_config().get("CACHE_REHYDRATE_WAIT_S", 10.0))
+
+        # Earlier turns (the prompt itself was just appended)
+        num_history = get_config().get("CHAT_HISTORY_MESSAGES", 6)
+        history = st.session_state["messages"][:-1][-num_history:] if num_history > 0 else []
 
         # Get RAG + Web Search answer
         with st.chat_message("assistant"):
             with st.spinner("Thinking..."):
-                result = answer_query(
-                    user_query=prompt,
-                    mode=mode.lower(),
-                    chat_model=chat_model,
-                    embed_client=embed_client,
-                    vectorstore=vectorstore,
-                )
+                try:
+                    result = answer_query(
+                        user_query=prompt,
+                        mode=mode.lower(),
+                        chat_model=chat_model,
+                        embed_client=embed_client,
+                        vectorstore=vectorstore,
+                        filters=st.session_state.get("filters"),
+                        history=history,
+                        deadline=get_config()["ANSWER_DEADLINE_MS"],
+                        prefetch=prefetch,
+                        caches=caches,
+                    )
+                finally:
+                    unpin_vectorstore(vectorstore)
 
                 st.markdown(result["answer"])
 
@@ -116,13 +297,39 @@ def chat_page():
                     if result["rag_results"]:
                         st.markdown("### 🔧 Internal Docs")
                         for r in result["rag_results"]:
-                            st.write(f"- **{r['source']}** (score: {r['score']:.2f})")
+                            also = [src for src in r.get("sources", []) if src != r["source"]]
+                            extra = f" · also in {', '.join(also)}" if also else ""
+                            st.write(f"- **{r['source']}** (score: {r['score']:.2f}){extra}")
 
                     if result["web_results"]:
                         st.markdown("### 🌐 Web Results")
                         for w in result["web_results"]:
                             st.write(f"- [{w['title']}]({w['url']})")
 
+                    if result.get("degradations"):
+                        st.markdown("### ⏱️ Deadline & Budget")
+                        st.write(
+                            "Degraded to meet the deadline or budget: "
+                            + ", ".join(result["degradations"])
+                        )
+
+                    acct = result["accounting"]
+                    st.markdown("### 💰 Cost")
+                    st.write(
+                        f"{acct['input_tokens']} prompt + {acct['output_tokens']} completion tokens, "
+                        f"{acct['web_search_calls']} web searches · ${acct['usd']:.5f} · prompt: "
+                        + ", ".join(f"{name} {n}" for name, n in acct["prompt_tokens"].items() if n)
+                    )
+
+                    if "shards" in vectorstore and vectorstore["shards"].last_report:
+                        report = vectorstore["shards"].last_report
+                        st.markdown("### 🧩 Shards")
+                        st.write(
+                            f"Slowest shard: #{report['slowest_shard']} "
+                            f"({report['slowest_ms']:.1f} ms) · per shard: "
+                            + ", ".join(f"{ms:.1f} ms" for ms in report["per_shard_ms"])
+                        )
+
         # Add assistant response to chat history
         st.session_state["messages"].append(
             {"role": "assistant", "content": result["answer"]}
@@ -154,23 +361,148 @@ def main():
 
         st.divider()
 
-        # Build Knowledge Base Button
+        # Knowledge base of the selected product line (tenant)
         st.markdown("### Knowledge Base")
+        manager = get_index_manager()
+        tenants = list(manager.tenants)
+        tenant = st.selectbox("Product line:", tenants) if len(tenants) > 1 else tenants[0]
+        if st.session_state.get("tenant") != tenant:
+            st.session_state["tenant"] = tenant
+            for key in ("vectorstore", "embed_client", "filters"):
+                st.session_state.pop(key, None)
+        docs_dir = manager.docs_dir(tenant)
+
         if st.button("📚 Build Knowledge Base"):
             try:
-                embed_client = EmbeddingClient()
-                vectorstore = build_knowledge_base("data/docs", embed_client)
-
-                st.session_state["embed_client"] = embed_client
-                st.session_state["vectorstore"] = vectorstore
-                st.success("Knowledge Base built successfully!")
+                # Stop worker processes of a previously built sharded store
+                old_store = st.session_state.pop("vectorstore", None)
+                st.session_state.pop("embed_client", None)
+                if old_store and "shards" in old_store:
+                    old_store["shards"].close()
+
+                config = get_config()
+                if config.get("VECTORSTORE_SHARDS", 0) > 0:
+                    # Sharded stores live in this session's worker processes
+                    embed_client = manager.embed_client(tenant)
+                    st.session_state["vectorstore"] = build_knowledge_base(
+                        docs_dir,
+                        embed_client,
+                        num_shards=config["VECTORSTORE_SHARDS"],
+                        dedup=config.get("DEDUP_ENABLED", False),
+                        chunking=config["CHUNKING"],
+                    )
+                    st.session_state["embed_client"] = embed_client
+                    st.success("Knowledge Base built successfully!")
+                else:
+                    # Rebuild in the background; the result is snapshotted
+                    # and shared with every session
+                    start_build_job(manager, tenant)
             except Exception as e:
                 st.error(f"Error building KB: {e}")
 
+        build_progress(tenant)
+
+        with st.expander("Index residency"):
+            for row in manager.stats():
+                load = (
+                    f"loaded from {row['last_load_from']} in {row['last_load_ms']:.0f} ms"
+                    if row["last_load_ms"] is not None
+                    else "not loaded yet"
+                )
+                state = f"resident, {row['bytes'] / 1e6:.1f} MB" if row["resident"] else "on disk"
+                if row["shared_generation"] is not None:
+                    state = f"shared generation {row['shared_generation']}"
+                st.caption(f"**{row['tenant']}**: {state} · {load} · {row['hits']} hits")
+
+        with st.expander("Usage & cost"):
+            summary = default_ledger().summary()
+            hour = summary["by_hour"].get(hour_key())
+            if hour:
+                budget = get_config().get("COST_BUDGET_USD_PER_HOUR", 0.0)
+                limit = f" of ${budget:.2f}" if budget > 0 else ""
+                st.caption(f"This hour: {hour['requests']} requests · ${hour['usd']:.4f}{limit}")
+            for mode_name, t in sorted(summary["by_mode"].items()):
+                st.caption(
+                    f"**{mode_name}**: {t['requests']} requests · "
+                    f"{t['input_tokens'] + t['output_tokens']} tokens · "
+                    f"{t['web_search_calls']} web searches · ${t['usd']:.4f}"
+                )
+
+        with st.expander("Caches"):
+            caches = get_hot_caches()
+            if not caches.ready.is_set():
+                st.caption("Reloading from the last snapshot...")
+            for name, cs in caches.stats().items():
+                st.caption(
+                    f"**{name}**: {cs['entries']} entries · hit rate {cs['hit_rate']:.0%} · "
+                    f"{cs['rehydrated']} reloaded ({cs['rehydrated_hits']} hits)"
+                )
+            if caches.last_snapshot:
+                age = time.time() - caches.last_snapshot["at"]
+                st.caption(
+                    f"Last snapshot {age:.0f}s ago, {caches.last_snapshot['bytes'] / 1024:.0f} KB"
+                )
+
+        if get_config().get("PREFETCH_ENABLED", False):
+            with st.expander("Follow-up prefetch"):
+                session = st.session_state.get("prefetch")
+                if session is not None:
+                    ps = session.stats()
+                    st.caption(
+                        f"This chat: {ps['hits']}/{ps['lookups']} questions prefetched "
+                        f"({ps['hit_rate']:.0%}), {ps['cached']} cached"
+                    )
+                ps = get_prefetcher().stats()
+                st.caption(
+                    f"All chats: hit rate {ps['hit_rate']:.0%} · {ps['prefetched']} prefetched, "
+                    f"{ps['wasted']} unused ({ps['waste_rate']:.0%}, {ps['wasted_ms']:.0f} ms) · "
+                    f"{ps['known_questions']} known questions"
+                )
+
+        # Background re-indexing when files in the docs directory change
+        if st.checkbox(f"🔄 Auto-update from {docs_dir}"):
+            watcher = get_docs_watcher(docs_dir, manager.embed_client(tenant))
+            st.session_state["docs_watcher"] = watcher
+
+            status = watcher.status()
+            if status["error"]:
+                st.error(f"Auto-update failed: {status['error']}")
+            elif status["version"] == 0:
+                st.caption("Building index in the background...")
+            else:
+                stale = (
+                    f"changes pending for {status['stale_seconds']:.0f}s"
+                    if status["stale_seconds"]
+                    else "up to date"
+                )
+                st.caption(
+                    f"Index v{status['version']} · built {status['age_seconds']:.0f}s ago · {stale}"
+                )
+                last = status["last_rebuild"]
+                if last.get("docs_reembedded") and status["version"] > 1:
+                    st.caption(
+                        f"Last update: {last['chunks_reembedded']} chunks re-embedded, "
+                        f"{last['chunks_reused']} reused ({last['chunk_reuse_rate']:.0%})"
+                    )
+        else:
+            st.session_state.pop("docs_watcher", None)
+
+        # Optional metadata filter (e.g., user is on the billing page)
+        current = st.session_state.get("vectorstore") or manager.get_resident(tenant)
+        if current is not None:
+            postings = current.get("postings", {})
+            sources = st.multiselect(
+                "Search only these sources:",
+                sorted(postings.get("source", {})),
+            )
+            st.session_state["filters"] = {"source": sources} if sources else None
+
         st.divider()
         if page == "Chat":
             if st.button("🗑 Clear Chat History", use_container_width=True):
                 st.session_state["messages"] = []
+                if "prefetch" in st.session_state:
+                    st.session_state.pop("prefetch").clear()
                 st.rerun()
 
     # Route to appropriate page
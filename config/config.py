@@ -25,12 +25,102 @@ def get_config():
         "GROQ_API_KEY": os.getenv("GROQ_API_KEY", ""),
         "GROQ_MODEL_NAME": os.getenv("GROQ_MODEL_NAME", "llama-3.1-8b-instant"),
 
-        # Embeddings (local)
+        # OpenAI (chat LLM, optional)
+        "OPENAI_API_KEY": os.getenv("OPENAI_API_KEY", ""),
+        "OPENAI_MODEL_NAME": os.getenv("OPENAI_MODEL_NAME", "gpt-4o-mini"),
+
+        # Gemini (chat LLM, optional)
+        "GOOGLE_API_KEY": os.getenv("GOOGLE_API_KEY", ""),
+        "GEMINI_MODEL_NAME": os.getenv("GEMINI_MODEL_NAME", "gemini-1.5-flash"),
+
+        # LLM router (used when more than one provider is configured)
+        "LLM_PROVIDERS": os.getenv("LLM_PROVIDERS", "groq,openai,gemini"),
+        "LLM_HEDGE_REQUESTS": os.getenv("LLM_HEDGE_REQUESTS", "false").lower() == "true",
+        "LLM_ROUTER_WINDOW": int(os.getenv("LLM_ROUTER_WINDOW", "50")),
+        "LLM_MAX_ERROR_RATE": float(os.getenv("LLM_MAX_ERROR_RATE", "0.5")),
+
+        # Pricing (USD), for cost reporting
+        "LLM_PRICE_PER_1K_INPUT": float(os.getenv("LLM_PRICE_PER_1K_INPUT", "0.00005")),
+        "LLM_PRICE_PER_1K_OUTPUT": float(os.getenv("LLM_PRICE_PER_1K_OUTPUT", "0.00008")),
+        "TAVILY_PRICE_PER_CALL": float(os.getenv("TAVILY_PRICE_PER_CALL", "0.008")),
+
+        # Budgets (0 = none): spend per hour and prompt tokens per request.
+        # Over budget: "warn" logs, "concise" also switches to concise mode
+        "COST_BUDGET_USD_PER_HOUR": float(os.getenv("COST_BUDGET_USD_PER_HOUR", "0")),
+        "PROMPT_TOKEN_BUDGET": int(os.getenv("PROMPT_TOKEN_BUDGET", "0")),
+        "BUDGET_ACTION": os.getenv("BUDGET_ACTION", "warn"),
+
+        # Embeddings (local): a sentence-transformers model, "hashing[-dim]"
+        # or "static:<file.npz>" (see models/embeddings.py)
         "EMBEDDING_MODEL_NAME": os.getenv(
             "EMBEDDING_MODEL_NAME",
             "all-MiniLM-L6-v2",
         ),
 
+        # Vectorstore: 0 = single in-process store, N > 0 = N worker shards
+        "VECTORSTORE_SHARDS": int(os.getenv("VECTORSTORE_SHARDS", "0")),
+
+        # Storage engine for embeddings: "numpy" (in memory), "mmap", "sqlite"
+        # or "segmented" (in memory, append-friendly with background compaction)
+        "VECTORSTORE_BACKEND": os.getenv("VECTORSTORE_BACKEND", "numpy"),
+        "VECTORSTORE_DIR": os.getenv("VECTORSTORE_DIR", ""),  # on-disk backends; "" = temp
+        # mmap backend: rows per block of its out-of-core exact scan
+        "MMAP_BLOCK_ROWS": int(os.getenv("MMAP_BLOCK_ROWS", "4096")),
+
+        # Tenants: "name=docs_dir[@embedding_model],...", each with its own index.
+        # Indexes are snapshotted to SNAPSHOT_DIR and loaded on demand; resident
+        # ones are kept within the memory budget, least recently used evicted.
+        "TENANTS": os.getenv("TENANTS", "default=data/docs"),
+        "SNAPSHOT_DIR": os.getenv("SNAPSHOT_DIR", "snapshots"),
+        "INDEX_MEMORY_BUDGET_MB": float(os.getenv("INDEX_MEMORY_BUDGET_MB", "512")),
+        # Share tenants' indexes with every worker process on the host through
+        # this directory, e.g. /dev/shm/smartassist ("" = each process loads its own)
+        "SHARED_INDEX_DIR": os.getenv("SHARED_INDEX_DIR", ""),
+
+        # Chunking: "cdc" (content-defined, edits re-embed only nearby chunks)
+        # or "fixed" (800-char windows with 200-char overlap)
+        "CHUNKING": os.getenv("CHUNKING", "cdc"),
+
+        # Index-time removal of exact / near-duplicate chunks (opt-in)
+        "DEDUP_ENABLED": os.getenv("DEDUP_ENABLED", "false").lower() == "true",
+
+        # Two-stage search: 0 = off, else keep this many dims for the coarse pass
+        "PROJECTION_DIMS": int(os.getenv("PROJECTION_DIMS", "0")),
+        "PROJECTION_METHOD": os.getenv("PROJECTION_METHOD", "pca"),  # or "truncate"
+
+        # Earlier chat messages sent with each question (0 = none)
+        "CHAT_HISTORY_MESSAGES": int(os.getenv("CHAT_HISTORY_MESSAGES", "6")),
+
+        # Keep only the retrieved sentences most relevant to the query (opt-in)
+        "CONTEXT_COMPRESSION": os.getenv("CONTEXT_COMPRESSION", "false").lower() == "true",
+
+        # Prefetch retrieval for likely follow-up questions while the user reads,
+        # learned from live chats and optionally from a JSONL session log (opt-in)
+        "PREFETCH_ENABLED": os.getenv("PREFETCH_ENABLED", "false").lower() == "true",
+        "PREFETCH_SESSIONS_PATH": os.getenv("PREFETCH_SESSIONS_PATH", ""),
+        "PREFETCH_FOLLOW_UPS": int(os.getenv("PREFETCH_FOLLOW_UPS", "3")),
+
+        # Caches of query embeddings, retrieval and web results (entries per
+        # cache, 0 = off); web results expire after WEB_CACHE_TTL_S seconds
+        "HOT_CACHE_ENTRIES": int(os.getenv("HOT_CACHE_ENTRIES", "2048")),
+        "WEB_CACHE_TTL_S": float(os.getenv("WEB_CACHE_TTL_S", "300")),
+        # Their hottest entries are snapshotted here at shutdown and every
+        # interval, and reloaded at startup ("" = no snapshots); the first
+        # request waits up to CACHE_REHYDRATE_WAIT_S for the reload
+        "CACHE_SNAPSHOT_PATH": os.getenv("CACHE_SNAPSHOT_PATH", "snapshots/hot_caches.npz"),
+        "CACHE_SNAPSHOT_INTERVAL_S": float(os.getenv("CACHE_SNAPSHOT_INTERVAL_S", "300")),
+        "CACHE_SNAPSHOT_TOP": int(os.getenv("CACHE_SNAPSHOT_TOP", "500")),
+        "CACHE_REHYDRATE_WAIT_S": float(os.getenv("CACHE_REHYDRATE_WAIT_S", "10")),
+
+        # Per-request latency budget in ms (0 = none); stages degrade to fit it
+        "ANSWER_DEADLINE_MS": float(os.getenv("ANSWER_DEADLINE_MS", "0")),
+
+        # Per-request profiling (cProfile + tracemalloc dumps)
+        "PROFILE_ENABLED": os.getenv("PROFILE_ENABLED", "false").lower() == "true",
+        "PROFILE_SAMPLE_RATE": float(os.getenv("PROFILE_SAMPLE_RATE", "0.1")),
+        "PROFILE_DIR": os.getenv("PROFILE_DIR", "profiles"),
+        "PROFILE_TOP_ALLOCATIONS": int(os.getenv("PROFILE_TOP_ALLOCATIONS", "25")),
+
         # Web search (Tavily)
         "TAVILY_API_KEY": os.getenv("TAVILY_API_KEY", ""),
     }
@@ -1,32 +1,59 @@
 # models/embeddings.py
+"""
+Embedding backends. Pick one with EMBEDDING_MODEL_NAME (or per tenant):
 
-from typing import List
+    all-MiniLM-L6-v2        sentence-transformers model (needs torch)
+    hashing / hashing-512   feature-hashing embedder, pure NumPy
+    static:vectors.npz      static token vectors with mean pooling, pure NumPy
+
+Usage:
+    python -m models.embeddings bench --models hashing,all-MiniLM-L6-v2
+    python -m models.embeddings distill --model all-MiniLM-L6-v2 --out static.npz
+"""
+
+from functools import lru_cache
+from typing import List, Tuple
+import argparse
 import os
+import re
 import sys
+import time
+import zlib
 
 import numpy as np
-from sentence_transformers import SentenceTransformer
 
 sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '../..')))
 from config.config import get_config
+from utils.profiling import profiled
+
+
+HASHING_DIM = 384
+STATIC_PREFIX = "static:"
+
+_WORD_RE = re.compile(r"\w+")
+
 
+def tokenize(text: str) -> List[str]:
+    return _WORD_RE.findall(text.lower())
 
-class EmbeddingClient:
+
+class EmbeddingBackend:
     """
-    Thin wrapper around a SentenceTransformer model.
+    Common interface of all embedding backends.
 
-    Used for:
+    Subclasses implement encode(texts) -> float32 matrix with L2-normalized
+    rows and set model_name and dim.
     - embed_documents(list[str]) -> list[list[float]]
     - embed_query(str) -> list[float]
     """
 
-    def __init__(self, model_name: str | None = None):
-        config = get_config()
-        self.model_name = model_name or config.get(
-            "EMBEDDING_MODEL_NAME", "all-MiniLM-L6-v2"
-        )
-        self.model = SentenceTransformer(self.model_name)
+    model_name: str = ""
+    dim: int = 0
 
+    def encode(self, texts: List[str]) -> np.ndarray:
+        raise NotImplementedError
+
+    @profiled("embed_documents")
     def embed_documents(self, texts: List[str]) -> List[List[float]]:
         """
         Compute embeddings for multiple texts.
@@ -34,24 +61,224 @@ class EmbeddingClient:
         """
         if not texts:
             return []
+        return self.encode(texts).tolist()
+
+    @profiled("embed_query")
+    def embed_query(self, text: str) -> List[float]:
+        """
+        Convenience method for a single query string.
+        """
+        if not text:
+            return []
+        return self.encode([text])[0].tolist()
 
+
+class EmbeddingClient(EmbeddingBackend):
+    """
+    Thin wrapper around a SentenceTransformer model.
+
+    sentence_transformers (and torch) are imported on first use, so the
+    pure-NumPy backends never load them.
+    """
+
+    def __init__(self, model_name: str | None = None):
+        from sentence_transformers import SentenceTransformer
+
+        config = get_config()
+        self.model_name = model_name or config.get(
+            "EMBEDDING_MODEL_NAME", "all-MiniLM-L6-v2"
+        )
+        self.model = SentenceTransformer(self.model_name)
+        self.dim = self.model.get_sentence_embedding_dimension()
+
+    def encode(self, texts: List[str]) -> np.ndarray:
         embeddings = self.model.encode(
             texts,
             show_progress_bar=False,
             convert_to_numpy=True,
             normalize_embeddings=True,  # cosine similarity works better
         )
-        # Ensure we return a list of lists (not NumPy array)
-        if isinstance(embeddings, np.ndarray):
-            embeddings = embeddings.tolist()
-        return embeddings
+        return np.asarray(embeddings, dtype="float32")
+
+
+def _normalize_rows(matrix: np.ndarray) -> np.ndarray:
+    norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+    norms[norms == 0] = 1.0
+    return matrix / norms
+
+
+class HashingEmbedder(EmbeddingBackend):
+    """
+    Feature-hashing embedder: words, word bigrams and character trigrams
+    are hashed (crc32, stable across processes) into `dim` signed buckets,
+    with sublinear term frequency.
+
+    No model file and no torch: loads instantly, encodes a query in tens
+    of microseconds and is fully deterministic. Retrieval quality is
+    lexical (shared words and word parts), below a transformer model.
+    """
+
+    WORD_WEIGHT = 1.0
+    BIGRAM_WEIGHT = 0.5
+    TRIGRAM_WEIGHT = 0.25
+
+    def __init__(self, dim: int = HASHING_DIM):
+        self.dim = dim
+        self.model_name = f"hashing-{dim}"
+        self._word_features = lru_cache(maxsize=100_000)(self._features)
+
+    def _bucket(self, feature: str) -> Tuple[int, float]:
+        h = zlib.crc32(feature.encode("utf-8"))
+        return h % self.dim, 1.0 if h & 0x80000000 else -1.0
+
+    def _features(self, word: str) -> Tuple[np.ndarray, np.ndarray]:
+        # Buckets and signed weights of one word: the word and its trigrams
+        buckets, weights = [], []
+        b, s = self._bucket(word)
+        buckets.append(b)
+        weights.append(s * self.WORD_WEIGHT)
+        padded = f"<{word}>"
+        for i in range(len(padded) - 2):
+            b, s = self._bucket(padded[i : i + 3])
+            buckets.append(b)
+            weights.append(s * self.TRIGRAM_WEIGHT)
+        return np.array(buckets, dtype=np.int64), np.array(weights, dtype="float32")
+
+    def _embed(self, text: str, out: np.ndarray) -> None:
+        words = tokenize(text)
+        if not words:
+            return
+        features = [self._word_features(word) for word in words]
+        bigrams = [self._bucket(f"{a} {b}") for a, b in zip(words, words[1:])]
+        buckets = np.concatenate(
+            [f[0] for f in features] + [np.array([b for b, _ in bigrams], dtype=np.int64)]
+        )
+        weights = np.concatenate(
+            [f[1] for f in features]
+            + [np.array([s * self.BIGRAM_WEIGHT for _, s in bigrams], dtype="float32")]
+        )
+        counts = np.bincount(buckets, weights=weights, minlength=self.dim)
+        out[:] = np.sign(counts) * np.log1p(np.abs(counts))
+
+    def encode(self, texts: List[str]) -> np.ndarray:
+        matrix = np.zeros((len(texts), self.dim), dtype="float32")
+        for i, text in enumerate(texts):
+            self._embed(text, matrix[i])
+        return _normalize_rows(matrix)
+
+
+class StaticEmbedder(EmbeddingBackend):
+    """
+    Static token vectors with mean pooling (Model2Vec-style).
+
+    `path` is an .npz with "tokens" (str array) and "vectors" (float32,
+    tokens x dim), e.g. written by distill_static_vectors. Encoding is a
+    dictionary lookup per word and one mean; unknown words are skipped.
+    """
+
+    def __init__(self, path: str):
+        with np.load(path) as data:
+            tokens = data["tokens"]
+            self.vectors = _normalize_rows(data["vectors"].astype("float32"))
+        self.vocab = {str(t): i for i, t in enumerate(tokens)}
+        self.dim = self.vectors.shape[1]
+        self.model_name = f"{STATIC_PREFIX}{path}"
+
+    def encode(self, texts: List[str]) -> np.ndarray:
+        matrix = np.zeros((len(texts), self.dim), dtype="float32")
+        for i, text in enumerate(texts):
+            ids = [self.vocab[w] for w in tokenize(text) if w in self.vocab]
+            if ids:
+                matrix[i] = self.vectors[ids].mean(axis=0)
+        return _normalize_rows(matrix)
+
+
+def create_embedding_client(model_name: str | None = None) -> EmbeddingBackend:
+    """
+    Embedding backend for a model name (default: EMBEDDING_MODEL_NAME).
+    See the module docstring for the accepted names.
+    """
+    name = model_name or get_config().get("EMBEDDING_MODEL_NAME", "all-MiniLM-L6-v2")
+    if name == "hashing" or name.startswith("hashing-"):
+        _, _, dim = name.partition("-")
+        return HashingEmbedder(int(dim) if dim else HASHING_DIM)
+    if name.startswith(STATIC_PREFIX):
+        return StaticEmbedder(name[len(STATIC_PREFIX) :])
+    return EmbeddingClient(name)
+
+
+def distill_static_vectors(model_name: str, out_path: str, batch_size: int = 512) -> int:
+    """
+    Embed every whole-word token of a sentence-transformers model's
+    vocabulary once and save them for StaticEmbedder. Returns the number
+    of tokens written.
+    """
+    client = EmbeddingClient(model_name)
+    vocab = client.model.tokenizer.get_vocab()
+    tokens = sorted(t for t in vocab if _WORD_RE.fullmatch(t) and t == t.lower())
+    print(f"[distill_static_vectors] Embedding {len(tokens)} tokens with {model_name}")
+
+    vectors = np.zeros((len(tokens), client.dim), dtype="float32")
+    for start in range(0, len(tokens), batch_size):
+        vectors[start : start + batch_size] = client.encode(tokens[start : start + batch_size])
+
+    with open(out_path, "wb") as f:
+        np.savez(f, tokens=np.array(tokens), vectors=vectors)
+    return len(tokens)
+
+
+SAMPLE_QUERIES = [
+    "How do I reset my password?",
+    "My invoice shows the wrong billing address",
+    "Can I export my data to CSV?",
+    "The mobile app crashes when I upload a photo",
+    "What is your refund policy for annual plans?",
+]
+
+
+def benchmark(model_name: str, repeats: int = 200) -> dict:
+    start = time.perf_counter()
+    client = create_embedding_client(model_name)
+    load_ms = (time.perf_counter() - start) * 1000
+
+    client.embed_query(SAMPLE_QUERIES[0])  # warm up
+    latencies = []
+    for i in range(repeats):
+        start = time.perf_counter()
+        client.embed_query(SAMPLE_QUERIES[i % len(SAMPLE_QUERIES)])
+        latencies.append((time.perf_counter() - start) * 1e6)
+    return {
+        "model": client.model_name,
+        "dim": client.dim,
+        "load_ms": load_ms,
+        "p50_us": float(np.percentile(latencies, 50)),
+        "p99_us": float(np.percentile(latencies, 99)),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Embedding backends: benchmark and distill.")
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    bench = sub.add_parser("bench", help="load time and query encoding latency")
+    bench.add_argument("--models", default="hashing", help="comma-separated model names")
+    bench.add_argument("--repeats", type=int, default=200)
+
+    distill = sub.add_parser("distill", help="write static token vectors for static:<path>")
+    distill.add_argument("--model", default="all-MiniLM-L6-v2")
+    distill.add_argument("--out", required=True)
+    args = parser.parse_args()
+
+    if args.command == "distill":
+        count = distill_static_vectors(args.model, args.out)
+        print(f"Wrote {count} token vectors to {args.out}; use EMBEDDING_MODEL_NAME=static:{args.out}")
+        return
+
+    print(f"{'model':<32}{'dim':>6}{'load ms':>10}{'p50 us':>10}{'p99 us':>10}")
+    for name in args.models.split(","):
+        r = benchmark(name.strip(), args.repeats)
+        print(f"{r['model']:<32}{r['dim']:>6}{r['load_ms']:>10.1f}{r['p50_us']:>10.1f}{r['p99_us']:>10.1f}")
 
-    def embed_query(self, text: str) -> List[float]:
-        """
-        Convenience method for a single query string.
-        """
-        if not text:
-            return []
 
-        emb = self.embed_documents([text])[0]
-        return emb
+if __name__ == "__main__":
+    main()
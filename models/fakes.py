@@ -0,0 +1,145 @@
+# models/fakes.py
+
+from typing import Callable, Dict, List, Tuple
+import random
+import threading
+import time
+
+from langchain_core.messages import AIMessage
+
+from models.embeddings import HashingEmbedder
+
+
+LatencySpec = float | Tuple[float, float] | Callable[[], float]
+
+
+def sample_latency_ms(spec: LatencySpec, rng: random.Random) -> float:
+    """
+    Draw one latency (ms) from a latency spec:
+      - a number -> fixed latency
+      - (mean, stddev) -> normally distributed latency (clipped at 0)
+      - a callable -> called with no args, returns latency in ms
+    """
+    if callable(spec):
+        return max(0.0, float(spec()))
+    if isinstance(spec, tuple):
+        mean, std = spec
+        return max(0.0, rng.gauss(mean, std))
+    return max(0.0, float(spec))
+
+
+def _sleep_or_time_out(latency_ms: float, timeout_s: float | None, name: str) -> None:
+    """
+    Simulate a call of latency_ms under a client timeout: raises
+    TimeoutError after timeout_s if the call would take longer.
+    """
+    if timeout_s is not None and latency_ms / 1000.0 > timeout_s:
+        time.sleep(max(0.0, timeout_s))
+        raise TimeoutError(f"{name}: request timed out after {timeout_s * 1000:.0f} ms")
+    time.sleep(latency_ms / 1000.0)
+
+
+class FakeChatModel:
+    """
+    Local stand-in for a LangChain chat model, for offline testing.
+
+    latency_ms: see sample_latency_ms.
+    error_rate: probability that a call raises RuntimeError.
+    reply: text returned as AIMessage.content.
+
+    invoke(messages, timeout=seconds) behaves like a provider client with
+    a request timeout: a call slower than that raises TimeoutError after
+    timeout seconds.
+    """
+
+    def __init__(
+        self,
+        name: str = "fake",
+        latency_ms: LatencySpec = 0.0,
+        error_rate: float = 0.0,
+        reply: str = "This is a fake answer.",
+        seed: int | None = None,
+    ):
+        self.name = name
+        self.latency_ms = latency_ms
+        self.error_rate = error_rate
+        self.reply = reply
+        self.calls = 0
+        self._rng = random.Random(seed)
+        self._lock = threading.Lock()
+
+    def invoke(self, messages, timeout: float | None = None, **kwargs) -> AIMessage:
+        with self._lock:
+            self.calls += 1
+            fail = self._rng.random() < self.error_rate
+            latency = sample_latency_ms(self.latency_ms, self._rng)
+
+        _sleep_or_time_out(latency, timeout, self.name)
+        if fail:
+            raise RuntimeError(f"{self.name}: simulated provider error")
+        return AIMessage(content=f"[{self.name}] {self.reply}")
+
+
+class FakeWebSearch:
+    """
+    Local stand-in for utils.search.web_search, for offline testing.
+
+    Call it like web_search(query, k=3, timeout_s=None). Raises RuntimeError
+    with probability error_rate (answer_query records it as a web_search
+    error), and TimeoutError when slower than timeout_s.
+    """
+
+    def __init__(
+        self,
+        latency_ms: LatencySpec = 0.0,
+        error_rate: float = 0.0,
+        seed: int | None = None,
+    ):
+        self.latency_ms = latency_ms
+        self.error_rate = error_rate
+        self.calls = 0
+        self._rng = random.Random(seed)
+        self._lock = threading.Lock()
+
+    def __call__(
+        self, query: str, k: int = 3, timeout_s: float | None = None, **kwargs
+    ) -> List[Dict]:
+        with self._lock:
+            self.calls += 1
+            fail = self._rng.random() < self.error_rate
+            latency = sample_latency_ms(self.latency_ms, self._rng)
+
+        _sleep_or_time_out(latency, timeout_s, "fake web search")
+        if fail:
+            raise RuntimeError("fake web search: simulated error")
+
+        return [
+            {
+                "title": f"Fake result {i + 1} for: {query}",
+                "snippet": f"Simulated snippet {i + 1} about {query}.",
+                "url": f"https://example.com/search/{i + 1}",
+            }
+            for i in range(k)
+        ]
+
+
+class FakeEmbeddingClient(HashingEmbedder):
+    """
+    Deterministic, torch-free stand-in for EmbeddingClient: the hashing
+    backend plus simulated latency per embed_documents call.
+    """
+
+    def __init__(self, dim: int = 384, latency_ms: LatencySpec = 0.0, seed: int | None = None):
+        super().__init__(dim)
+        self.model_name = f"fake-hashing-{dim}"
+        self.latency_ms = latency_ms
+        self._rng = random.Random(seed)
+        self._lock = threading.Lock()
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        if not texts:
+            return []
+        with self._lock:
+            latency = sample_latency_ms(self.latency_ms, self._rng)
+        time.sleep(latency / 1000.0)
+        return self.encode(texts).tolist()
@@ -46,3 +46,87 @@ def get_chatgroq_model():
     except Exception as e:
         # Let the caller handle showing errors
         raise RuntimeError(f"Failed to initialize Groq model: {str(e)}")
+
+
+def get_openai_model():
+    """Initialize and return the OpenAI chat model, or None if no API key."""
+    try:
+        config = get_config()
+        api_key = config.get("OPENAI_API_KEY", "")
+        model_name = config.get("OPENAI_MODEL_NAME", "gpt-4o-mini")
+
+        if not api_key:
+            return None
+
+        # Imported lazily so a Groq-only deployment does not need the package
+        from langchain_openai import ChatOpenAI
+
+        return ChatOpenAI(api_key=api_key, model=model_name)
+
+    except Exception as e:
+        raise RuntimeError(f"Failed to initialize OpenAI model: {str(e)}")
+
+
+def get_gemini_model():
+    """Initialize and return the Gemini chat model, or None if no API key."""
+    try:
+        config = get_config()
+        api_key = config.get("GOOGLE_API_KEY", "")
+        model_name = config.get("GEMINI_MODEL_NAME", "gemini-1.5-flash")
+
+        if not api_key:
+            return None
+
+        from langchain_google_genai import ChatGoogleGenerativeAI
+
+        return ChatGoogleGenerativeAI(google_api_key=api_key, model=model_name)
+
+    except Exception as e:
+        raise RuntimeError(f"Failed to initialize Gemini model: {str(e)}")
+
+
+PROVIDER_FACTORIES = {
+    "groq": get_chatgroq_model,
+    "openai": get_openai_model,
+    "gemini": get_gemini_model,
+}
+
+
+def get_chat_model():
+    """
+    Return the chat model the app should use.
+
+    - No provider configured -> None (UI shows a friendly message)
+    - One provider configured -> that provider's chat model
+    - Several providers -> an LLMRouter over all of them
+    """
+    from models.router import LLMRouter
+
+    config = get_config()
+    names = [
+        n.strip().lower()
+        for n in config.get("LLM_PROVIDERS", "groq").split(",")
+        if n.strip()
+    ]
+
+    providers = {}
+    for name in names:
+        factory = PROVIDER_FACTORIES.get(name)
+        if factory is None:
+            print(f"[get_chat_model] Unknown provider in LLM_PROVIDERS: {name}")
+            continue
+        model = factory()
+        if model is not None:
+            providers[name] = model
+
+    if not providers:
+        return None
+    if len(providers) == 1:
+        return next(iter(providers.values()))
+
+    return LLMRouter(
+        providers,
+        hedge=config.get("LLM_HEDGE_REQUESTS", False),
+        window=config.get("LLM_ROUTER_WINDOW", 50),
+        max_error_rate=config.get("LLM_MAX_ERROR_RATE", 0.5),
+    )
@@ -0,0 +1,202 @@
+# models/router.py
+
+from collections import deque
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from typing import Dict, List
+import threading
+import time
+
+from utils.deadline import is_timeout
+
+
+class ProviderStats:
+    """
+    Moving window of latencies (seconds) and outcomes for one provider.
+    """
+
+    def __init__(self, window: int = 50):
+        self.latencies: deque = deque(maxlen=window)
+        self.outcomes: deque = deque(maxlen=window)  # True = success
+        self.lock = threading.Lock()
+
+    def record(self, latency: float, ok: bool) -> None:
+        with self.lock:
+            if ok:
+                self.latencies.append(latency)
+            self.outcomes.append(ok)
+
+    def percentile(self, pct: float) -> float | None:
+        with self.lock:
+            values = sorted(self.latencies)
+        if not values:
+            return None
+        idx = min(len(values) - 1, int(round(pct / 100.0 * (len(values) - 1))))
+        return values[idx]
+
+    def error_rate(self) -> float:
+        with self.lock:
+            if not self.outcomes:
+                return 0.0
+            return 1.0 - sum(self.outcomes) / len(self.outcomes)
+
+    def num_calls(self) -> int:
+        with self.lock:
+            return len(self.outcomes)
+
+
+class LLMRouter:
+    """
+    Routes chat requests across several LangChain chat models.
+
+    - Each request goes to the healthy provider with the lowest moving p50.
+      Providers without calls yet are tried first so they get measured;
+      providers whose calls in the window all failed are tried last.
+    - A provider is unhealthy once its error rate over the window exceeds
+      max_error_rate (after min_samples calls). If every provider is
+      unhealthy, all of them are considered again.
+    - With hedge=True, a duplicate request is sent to the next provider once
+      the primary has been running longer than its p95; whichever answers
+      first wins.
+    - On error, the request fails over to the next provider in order.
+
+    Exposes .invoke(messages, **kwargs), so it can be passed anywhere a chat
+    model is; kwargs are passed to the provider's invoke. A timeout= covers
+    the whole request: failovers and hedges get what is left of it.
+    """
+
+    def __init__(
+        self,
+        providers: Dict,
+        hedge: bool = False,
+        window: int = 50,
+        max_error_rate: float = 0.5,
+        min_samples: int = 5,
+        default_hedge_after: float = 2.0,
+        max_workers: int = 8,
+    ):
+        if not providers:
+            raise ValueError("LLMRouter needs at least one provider.")
+
+        self.providers = dict(providers)
+        self.hedge = hedge
+        self.max_error_rate = max_error_rate
+        self.min_samples = min_samples
+        self.default_hedge_after = default_hedge_after
+        self.stats_by_provider = {
+            name: ProviderStats(window) for name in self.providers
+        }
+        self._executor = ThreadPoolExecutor(
+            max_workers=max_workers, thread_name_prefix="llm-router"
+        )
+
+    def _is_healthy(self, name: str) -> bool:
+        st = self.stats_by_provider[name]
+        if st.num_calls() < self.min_samples:
+            return True
+        return st.error_rate() <= self.max_error_rate
+
+    def ranked_providers(self) -> List[str]:
+        """
+        Provider names, best candidate first.
+        """
+        healthy = [n for n in self.providers if self._is_healthy(n)]
+        candidates = healthy or list(self.providers)
+
+        def sort_key(name: str):
+            st = self.stats_by_provider[name]
+            p50 = st.percentile(50)
+            # Unmeasured providers first, then by p50, then only-failed ones
+            if p50 is None:
+                return (0 if st.num_calls() == 0 else 2, 0.0)
+            return (1, p50)
+
+        return sorted(candidates, key=sort_key)
+
+    def _call(self, name: str, messages, **kwargs):
+        """
+        Invoke one provider and record its latency/outcome.
+        """
+        start = time.perf_counter()
+        try:
+            response = self.providers[name].invoke(messages, **kwargs)
+        except Exception:
+            self.stats_by_provider[name].record(time.perf_counter() - start, False)
+            raise
+        self.stats_by_provider[name].record(time.perf_counter() - start, True)
+        return response
+
+    def _hedge_delay(self, name: str) -> float:
+        p95 = self.stats_by_provider[name].percentile(95)
+        return p95 if p95 is not None else self.default_hedge_after
+
+    def invoke(self, messages, **kwargs):
+        """
+        Send messages to the best provider (hedging / failing over as needed).
+        Returns the provider's response object unchanged.
+        """
+        order = self.ranked_providers()
+        last_error: Exception | None = None
+
+        timeout = kwargs.pop("timeout", None)
+        expires = None if timeout is None else time.perf_counter() + timeout
+
+        def call_kwargs() -> Dict:
+            if expires is None:
+                return kwargs
+            return {**kwargs, "timeout": max(0.0, expires - time.perf_counter())}
+
+        i = 0
+        while i < len(order):
+            primary = order[i]
+            secondary = order[i + 1] if i + 1 < len(order) else None
+
+            if not self.hedge or secondary is None:
+                try:
+                    return self._call(primary, messages, **call_kwargs())
+                except Exception as e:
+                    last_error = e
+                    i += 1
+                    continue
+
+            # Hedged request: start primary, add secondary after primary's p95
+            pending = {self._executor.submit(self._call, primary, messages, **call_kwargs())}
+            done, pending = wait(pending, timeout=self._hedge_delay(primary))
+            hedged = False
+            if not done:
+                pending.add(self._executor.submit(self._call, secondary, messages, **call_kwargs()))
+                hedged = True
+
+            while True:
+                for fut in done:
+                    if fut.exception() is None:
+                        # Loser keeps running in the background; its latency
+                        # is still recorded by _call.
+                        return fut.result()
+                    last_error = fut.exception()
+                if not pending:
+                    break
+                done, pending = wait(pending, return_when=FIRST_COMPLETED)
+
+            # Primary failed before the hedge fired -> secondary is next in line
+            i += 2 if hedged else 1
+
+        if last_error is not None and is_timeout(last_error):
+            raise TimeoutError(f"All LLM providers timed out: {last_error}") from last_error
+        raise RuntimeError(f"All LLM providers failed: {last_error}")
+
+    def stats(self) -> Dict[str, Dict]:
+        """
+        Per-provider routing stats (latencies in milliseconds).
+        """
+        report: Dict[str, Dict] = {}
+        for name, st in self.stats_by_provider.items():
+            p50 = st.percentile(50)
+            p95 = st.percentile(95)
+            report[name] = {
+                "p50_ms": None if p50 is None else p50 * 1000,
+                "p95_ms": None if p95 is None else p95 * 1000,
+                "error_rate": st.error_rate(),
+                "calls": st.num_calls(),
+                "healthy": self._is_healthy(name),
+            }
+        return report
@@ -0,0 +1,150 @@
+# test_router.py
+"""
+Routing checks for LLMRouter against fake providers (no network).
+
+Usage:
+    python test_router.py
+"""
+import time
+
+from langchain_core.messages import HumanMessage
+
+from models.fakes import FakeChatModel
+from models.router import LLMRouter
+
+
+MESSAGES = [HumanMessage(content="hello")]
+
+
+def provider_of(response) -> str:
+    # FakeChatModel replies "[<name>] ..."
+    return response.content[1 : response.content.index("]")]
+
+
+def check_p50_ordering() -> None:
+    """
+    Measured providers are ranked by p50, unmeasured ones first and ones
+    that have only failed last.
+    """
+    router = LLMRouter(
+        {
+            "slow": FakeChatModel("slow", latency_ms=40),
+            "fast": FakeChatModel("fast", latency_ms=5),
+            "broken": FakeChatModel("broken", error_rate=1.0),
+            "new": FakeChatModel("new"),
+        },
+        min_samples=100,  # keep everyone healthy
+    )
+    for name in ("slow", "fast"):
+        for _ in range(3):
+            router._call(name, MESSAGES)
+    try:
+        router._call("broken", MESSAGES)
+    except RuntimeError:
+        pass
+
+    order = router.ranked_providers()
+    assert order == ["new", "fast", "slow", "broken"], f"ranking {order}"
+
+    # With no unmeasured provider left, the fastest one serves the request
+    router.providers.pop("new")
+    router.stats_by_provider.pop("new")
+    served = provider_of(router.invoke(MESSAGES))
+    assert served == "fast", f"served by {served}, expected fast"
+
+
+def check_hedge() -> None:
+    """
+    The hedge goes to the next provider once the primary has run for its
+    hedge delay, and the first answer wins.
+    """
+    primary = FakeChatModel("primary", latency_ms=500)
+    backup = FakeChatModel("backup", latency_ms=10)
+    router = LLMRouter(
+        {"primary": primary, "backup": backup}, hedge=True, default_hedge_after=0.05
+    )
+
+    start = time.perf_counter()
+    served = provider_of(router.invoke(MESSAGES))
+    elapsed_ms = (time.perf_counter() - start) * 1000
+    assert served == "backup", f"served by {served}, expected backup"
+    assert backup.calls == 1, f"backup called {backup.calls} times"
+    assert 50 <= elapsed_ms < 400, f"hedged request took {elapsed_ms:.0f} ms"
+
+    # A primary that answers before the delay is never hedged
+    fast = FakeChatModel("fast", latency_ms=5)
+    spare = FakeChatModel("spare", latency_ms=5)
+    router = LLMRouter({"fast": fast, "spare": spare}, hedge=True, default_hedge_after=0.2)
+    served = provider_of(router.invoke(MESSAGES))
+    assert served == "fast" and spare.calls == 0, f"served by {served}, spare calls {spare.calls}"
+
+
+def check_failover() -> None:
+    """
+    Errors fail over to the next provider; once a provider's error rate
+    exceeds max_error_rate it is no longer tried, even if it is the fastest.
+    """
+    flaky = FakeChatModel("flaky", latency_ms=1)
+    steady = FakeChatModel("steady", latency_ms=20)
+    router = LLMRouter({"flaky": flaky, "steady": steady}, max_error_rate=0.5, min_samples=5)
+
+    # Both get measured, then the faster one takes the traffic
+    served = [provider_of(router.invoke(MESSAGES)) for _ in range(6)]
+    assert served == ["flaky", "steady"] + ["flaky"] * 4, f"served by {served}"
+
+    # flaky goes down: requests fail over to steady until flaky's error
+    # rate passes 0.5 (6 errors after 5 successes), then it is skipped
+    flaky.error_rate = 1.0
+    calls = flaky.calls
+    served = [provider_of(router.invoke(MESSAGES)) for _ in range(20)]
+    assert served == ["steady"] * 20, f"served by {served}"
+    assert flaky.calls - calls == 6, f"flaky called {flaky.calls - calls} times while down"
+    stats = router.stats()
+    assert not stats["flaky"]["healthy"], f"flaky still healthy: {stats['flaky']}"
+
+
+def check_timeout() -> None:
+    """
+    timeout= reaches the providers and covers failovers too; a request
+    that runs out of it raises TimeoutError.
+    """
+    router = LLMRouter(
+        {
+            "slow": FakeChatModel("slow", latency_ms=300),
+            "slower": FakeChatModel("slower", latency_ms=300),
+        }
+    )
+    start = time.perf_counter()
+    try:
+        router.invoke(MESSAGES, timeout=0.1)
+        raise AssertionError("no TimeoutError")
+    except TimeoutError:
+        pass
+    elapsed_ms = (time.perf_counter() - start) * 1000
+    assert elapsed_ms < 250, f"timed out after {elapsed_ms:.0f} ms, budget 100 ms"
+
+
+CHECKS = {
+    "p50 ordering": check_p50_ordering,
+    "hedge": check_hedge,
+    "failover": check_failover,
+    "timeout": check_timeout,
+}
+
+
+def main():
+    failed = 0
+    for name, check in CHECKS.items():
+        try:
+            check()
+            print(f"[router] {name}: PASS")
+        except AssertionError as e:
+            failed += 1
+            print(f"[router] {name}: FAIL - {e}")
+
+    if failed:
+        raise SystemExit(1)
+
+
+if __name__ == "__main__":
+    main()
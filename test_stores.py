@@ -0,0 +1,278 @@
+# test_stores.py
+"""
+Conformance checks and a small benchmark for every vector store backend.
+
+Usage:
+    python test_stores.py
+    python test_stores.py --n 50000 --dim 384 --queries 200
+"""
+from typing import Dict
+import argparse
+import os
+import tempfile
+import time
+
+import numpy as np
+
+from utils.vector_store import STORE_BACKENDS, NumpyStore, SegmentedStore, create_store, load_store
+
+
+def brute_force(vectors: np.ndarray, ids: np.ndarray, q_vec: np.ndarray, k: int):
+    sims = vectors @ q_vec / (
+        (np.linalg.norm(vectors, axis=1) + 1e-8) * (np.linalg.norm(q_vec) + 1e-8)
+    )
+    order = np.argsort(-sims)[:k]
+    return ids[order], sims[order]
+
+
+def assert_same(got, expected, what: str) -> None:
+    got_ids, got_scores = got
+    exp_ids, exp_scores = expected
+    assert list(got_ids) == list(exp_ids), f"{what}: ids {list(got_ids)} != {list(exp_ids)}"
+    assert np.allclose(got_scores, exp_scores, atol=1e-5), f"{what}: scores differ"
+
+
+def check_store(backend: str, workdir: str, dim: int = 32, seed: int = 0) -> None:
+    """
+    Run the shared conformance checks against one backend. Raises
+    AssertionError on the first mismatch.
+    """
+    rng = np.random.RandomState(seed)
+    vectors = rng.randn(500, dim).astype("float32")
+    ids = np.arange(500)
+    queries = rng.randn(5, dim).astype("float32")
+
+    path = os.path.join(workdir, backend)
+    store = create_store(backend, dim, path if backend != "numpy" else None)
+    if backend == "mmap":
+        store.block_rows = 64  # scan in several blocks
+
+    # Empty store
+    assert len(store) == 0, "new store is not empty"
+    found_ids, _ = store.search(queries[0], 5)
+    assert len(found_ids) == 0, "empty store returned results"
+
+    # Add (in two batches, second one out of order) and search
+    store.add(ids[250:], vectors[250:])
+    store.add(ids[:250][::-1], vectors[:250][::-1])
+    assert len(store) == 500, f"len {len(store)} != 500"
+    for q in queries:
+        assert_same(store.search(q, 10), brute_force(vectors, ids, q, 10), "search")
+
+    # top_k larger than the store, and top_k = 0
+    assert len(store.search(queries[0], 1000)[0]) == 500, "top_k > size"
+    assert len(store.search(queries[0], 0)[0]) == 0, "top_k = 0"
+
+    # Row filters: selective (pre-filter) and broad (post-filter)
+    for rows in (np.array([3, 17, 42, 499]), np.arange(0, 500, 2)):
+        expected = brute_force(vectors[rows], ids[rows], queries[1], 5)
+        assert_same(store.search(queries[1], 5, rows=rows), expected, f"filter ({len(rows)} rows)")
+    assert len(store.search(queries[1], 5, rows=np.array([10_000]))[0]) == 0, "unknown row in filter"
+
+    # Batch search == single searches
+    batch = store.search_batch(queries, 7)
+    for q, got in zip(queries, batch):
+        assert_same(got, store.search(q, 7), "search_batch")
+
+    # Replace existing ids
+    store.add(ids[:10], -vectors[:10])
+    vectors = vectors.copy()
+    vectors[:10] = -vectors[:10]
+    assert len(store) == 500, "replace changed the count"
+    assert_same(store.search(queries[2], 10), brute_force(vectors, ids, queries[2], 10), "replace")
+
+    # Delete (unknown ids ignored)
+    removed = store.delete(np.array([0, 1, 2, 9999]))
+    assert removed == 3, f"delete removed {removed}, expected 3"
+    keep = ids >= 3
+    assert len(store) == 497, "count after delete"
+    assert_same(
+        store.search(queries[3], 10),
+        brute_force(vectors[keep], ids[keep], queries[3], 10),
+        "search after delete",
+    )
+    assert_same(
+        store.search(queries[3], 5, rows=np.array([0, 1, 3, 4])),
+        brute_force(vectors[3:5], ids[3:5], queries[3], 5),
+        "filter on deleted ids",
+    )
+
+    # Stats
+    stats = store.stats()
+    assert stats["backend"] == backend and stats["count"] == 497 and stats["dim"] == dim, stats
+
+    # Save / load round trip
+    saved = os.path.join(workdir, f"{backend}-saved")
+    store.save(saved)
+    reloaded = load_store(backend, saved)
+    if backend == "mmap":
+        reloaded.block_rows = 100
+    assert len(reloaded) == 497, "count after load"
+    for q in queries:
+        assert_same(reloaded.search(q, 10), store.search(q, 10), "search after load")
+    reloaded.close()
+    store.close()
+
+
+def check_segmented(dim: int = 16, seed: int = 0) -> Dict:
+    """
+    Random adds / replaces / deletes on a SegmentedStore with a tiny
+    memtable (many segments, tombstones, compactions), checked against
+    NumpyStore after every step. Returns the store's final stats.
+    """
+    rng = np.random.RandomState(seed)
+    store = SegmentedStore(dim, memtable_rows=32, fanin=3, background=False)
+    reference = NumpyStore(dim)
+    queries = rng.randn(3, dim).astype("float32")
+
+    for step in range(60):
+        op = rng.rand()
+        if op < 0.6:
+            ids = rng.choice(400, size=rng.randint(1, 50), replace=False)
+            vectors = rng.randn(len(ids), dim).astype("float32")
+            store.add(ids, vectors)
+            reference.add(ids, vectors)
+        else:
+            ids = rng.choice(400, size=rng.randint(1, 20), replace=False)
+            assert store.delete(ids) == reference.delete(ids), f"step {step}: delete count"
+        if step % 10 == 9:
+            store.compact()
+
+        assert len(store) == len(reference), f"step {step}: len {len(store)} != {len(reference)}"
+        for q in queries:
+            assert_same(store.search(q, 10), reference.search(q, 10), f"step {step}: search")
+        rows = np.arange(0, 400, 7)
+        assert_same(
+            store.search(queries[0], 5, rows=rows),
+            reference.search(queries[0], 5, rows=rows),
+            f"step {step}: filtered search",
+        )
+
+    stats = store.stats()
+    assert stats["compactions"] > 0, "no compaction ran"
+    assert stats["write_amplification"] >= 1.0 or stats["count"] == 0, stats
+
+    store.compact(force=True)
+    assert store.stats()["segments"] <= 1, "force compaction left several segments"
+    for q in queries:
+        assert_same(store.search(q, 10), reference.search(q, 10), "after full compaction")
+    store.close()
+    return stats
+
+
+def benchmark(
+    backend: str,
+    workdir: str,
+    n: int,
+    dim: int,
+    num_queries: int,
+    top_k: int = 5,
+    block_rows: int | None = None,
+) -> dict:
+    rng = np.random.RandomState(1)
+    vectors = rng.randn(n, dim).astype("float32")
+    queries = rng.randn(num_queries, dim).astype("float32")
+
+    path = os.path.join(workdir, f"bench-{backend}")
+    store = create_store(backend, dim, path if backend != "numpy" else None)
+    if backend == "mmap" and block_rows:
+        store.block_rows = block_rows
+
+    start = time.perf_counter()
+    store.add(np.arange(n), vectors)
+    add_s = time.perf_counter() - start
+
+    store.search(queries[0], top_k)  # warm caches / page in
+    latencies = []
+    for q in queries:
+        start = time.perf_counter()
+        store.search(q, top_k)
+        latencies.append((time.perf_counter() - start) * 1000)
+
+    start = time.perf_counter()
+    store.search_batch(queries, top_k)
+    batch_s = time.perf_counter() - start
+
+    # Continuous ingestion: small batches of new ids on top of the full store
+    append_batches, append_rows = 50, 20
+    extra = rng.randn(append_batches * append_rows, dim).astype("float32")
+    start = time.perf_counter()
+    for b in range(append_batches):
+        rows = slice(b * append_rows, (b + 1) * append_rows)
+        store.add(np.arange(n + rows.start, n + rows.stop), extra[rows])
+    append_ms = (time.perf_counter() - start) * 1000 / append_batches
+
+    stats = store.stats()
+    store.close()
+    return {
+        "backend": backend,
+        "add_s": add_s,
+        "p50_ms": float(np.percentile(latencies, 50)),
+        "p99_ms": float(np.percentile(latencies, 99)),
+        "batch_qps": num_queries / batch_s if batch_s else 0.0,
+        "append_ms": append_ms,
+        "memory_mb": stats["memory_bytes"] / 1e6,
+        "disk_mb": stats["disk_bytes"] / 1e6,
+        "scan": stats.get("scan"),
+        "block_bytes": stats.get("block_bytes"),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Vector store conformance and benchmark.")
+    parser.add_argument("--n", type=int, default=20000, help="vectors in the benchmark")
+    parser.add_argument("--dim", type=int, default=384)
+    parser.add_argument("--queries", type=int, default=100)
+    parser.add_argument("--block-rows", type=int, help="mmap scan block size (default: MMAP_BLOCK_ROWS)")
+    args = parser.parse_args()
+
+    failed = 0
+    with tempfile.TemporaryDirectory() as workdir:
+        for backend in STORE_BACKENDS:
+            try:
+                check_store(backend, workdir)
+                print(f"[conformance] {backend}: PASS")
+            except AssertionError as e:
+                failed += 1
+                print(f"[conformance] {backend}: FAIL - {e}")
+
+        try:
+            stats = check_segmented()
+            print(
+                f"[conformance] segmented workload: PASS ({stats['compactions']} compactions, "
+                f"write amplification {stats['write_amplification']:.2f}, "
+                f"fan-out {stats['avg_fanout']:.1f} segments/query)"
+            )
+        except AssertionError as e:
+            failed += 1
+            print(f"[conformance] segmented workload: FAIL - {e}")
+
+        print(f"\nBenchmark: {args.n} x {args.dim}-d vectors, {args.queries} queries, top-5")
+        print(
+            f"{'backend':<10}{'add s':>9}{'p50 ms':>9}{'p99 ms':>9}{'batch q/s':>11}"
+            f"{'append ms':>11}{'mem MB':>9}{'disk MB':>9}"
+        )
+        scans = {}
+        for backend in STORE_BACKENDS:
+            r = benchmark(backend, workdir, args.n, args.dim, args.queries, block_rows=args.block_rows)
+            print(
+                f"{r['backend']:<10}{r['add_s']:>9.2f}{r['p50_ms']:>9.2f}{r['p99_ms']:>9.2f}"
+                f"{r['batch_qps']:>11.0f}{r['append_ms']:>11.2f}{r['memory_mb']:>9.1f}{r['disk_mb']:>9.1f}"
+            )
+            if r["scan"]:
+                scans[backend] = r
+
+        for backend, r in scans.items():
+            scan = r["scan"]
+            print(
+                f"\n{backend} out-of-core scan: {scan['searches']} searches, {scan['blocks']} blocks "
+                f"of {r['block_bytes'] / 1e6:.1f} MB, {scan['bytes_read'] / 1e9:.2f} GB read in "
+                f"{scan['io_ms']:.0f} ms, {scan['compute_ms']:.0f} ms compute"
+            )
+
+    if failed:
+        raise SystemExit(1)
+
+
+if __name__ == "__main__":
+    main()
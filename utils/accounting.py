@@ -0,0 +1,260 @@
+# utils/accounting.py
+"""
+Token and cost accounting, with budgets.
+
+Every answered request gets an accounting record: prompt and completion
+tokens (as reported by the provider's usage metadata, else counted with
+the tokenizer), the prompt tokens spent on each part of the prompt, web
+search calls and the cost in USD. A CostLedger keeps running totals per
+mode and per hour, which the budgets are checked against:
+
+    COST_BUDGET_USD_PER_HOUR   spend in the current (UTC) hour, 0 = no limit
+    PROMPT_TOKEN_BUDGET        prompt tokens of one request, 0 = no limit
+    BUDGET_ACTION              "warn" (log only) or "concise" (switch the
+                               request to concise mode; an oversized
+                               prompt also has its context trimmed)
+"""
+
+from collections import OrderedDict
+from typing import Dict, Tuple
+import copy
+import os
+import sys
+import threading
+import time
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '../..')))
+from config.config import get_config
+
+
+CHARS_PER_TOKEN = 4  # estimate when no tokenizer is installed
+PROMPT_SECTIONS = ["system", "history", "question", "docs", "web"]
+LEDGER_HOURS = 48  # hourly buckets kept by a CostLedger
+
+_encoding = None  # tiktoken encoding once loaded; False if unavailable
+
+
+def count_tokens(text: str) -> int:
+    """
+    Tokens in text: tiktoken's cl100k_base if installed (close to the
+    Llama / GPT tokenizers), else ~4 chars per token.
+    """
+    global _encoding
+    if not text:
+        return 0
+    if _encoding is None:
+        try:
+            import tiktoken
+
+            _encoding = tiktoken.get_encoding("cl100k_base")
+        except Exception:
+            _encoding = False
+    if _encoding:
+        return len(_encoding.encode(text, disallowed_special=()))
+    return -(-len(text) // CHARS_PER_TOKEN)
+
+
+def _scale(counts: Dict[str, int], total: int) -> Dict[str, int]:
+    """
+    Integer counts proportional to counts that sum to total (largest remainder).
+    """
+    estimated = sum(counts.values())
+    if not estimated:
+        return dict(counts)
+    exact = {k: v * total / estimated for k, v in counts.items()}
+    scaled = {k: int(x) for k, x in exact.items()}
+    short = total - sum(scaled.values())
+    for k in sorted(exact, key=lambda k: exact[k] - scaled[k], reverse=True)[:short]:
+        scaled[k] += 1
+    return scaled
+
+
+def request_cost(input_tokens: int, output_tokens: int, web_search_calls: int) -> Dict:
+    """
+    USD cost from the LLM_PRICE_PER_1K_* and TAVILY_PRICE_PER_CALL settings.
+    """
+    config = get_config()
+    llm_usd = (
+        input_tokens / 1000 * config.get("LLM_PRICE_PER_1K_INPUT", 0.0)
+        + output_tokens / 1000 * config.get("LLM_PRICE_PER_1K_OUTPUT", 0.0)
+    )
+    search_usd = web_search_calls * config.get("TAVILY_PRICE_PER_CALL", 0.0)
+    return {"llm_usd": llm_usd, "search_usd": search_usd, "usd": llm_usd + search_usd}
+
+
+def account_request(
+    mode: str,
+    sections: Dict[str, str],
+    llm_called: bool,
+    answer: str = "",
+    usage: Dict | None = None,
+    web_search_calls: int = 0,
+) -> Dict:
+    """
+    Accounting record of one request.
+
+    sections: prompt text by PROMPT_SECTIONS name. With provider usage,
+    its token counts are exact and the per-section tokens are the
+    tokenizer counts scaled to them; otherwise both are tokenizer counts.
+    A call that failed or timed out is charged for its prompt only; a
+    call that was never made is not charged.
+    """
+    prompt_tokens = {name: count_tokens(sections.get(name, "")) for name in PROMPT_SECTIONS}
+    if usage:
+        input_tokens, output_tokens = usage["input_tokens"], usage["output_tokens"]
+        prompt_tokens = _scale(prompt_tokens, input_tokens)
+        source = "provider"
+    else:
+        input_tokens = sum(prompt_tokens.values()) if llm_called else 0
+        output_tokens = count_tokens(answer)
+        source = "tokenizer" if _encoding else "estimate"
+
+    return {
+        "mode": mode,
+        "llm_calls": int(llm_called),
+        "input_tokens": input_tokens,
+        "output_tokens": output_tokens,
+        "prompt_tokens": prompt_tokens,
+        "token_source": source,
+        "web_search_calls": web_search_calls,
+        **request_cost(input_tokens, output_tokens, web_search_calls),
+    }
+
+
+def hour_key(at: float | None = None) -> str:
+    return time.strftime("%Y-%m-%d %H:00", time.gmtime(at))
+
+
+def _empty_totals() -> Dict:
+    return {
+        "requests": 0,
+        "llm_calls": 0,
+        "input_tokens": 0,
+        "output_tokens": 0,
+        "prompt_tokens": {name: 0 for name in PROMPT_SECTIONS},
+        "web_search_calls": 0,
+        "llm_usd": 0.0,
+        "search_usd": 0.0,
+        "usd": 0.0,
+    }
+
+
+def _add(totals: Dict, accounting: Dict) -> None:
+    totals["requests"] += 1
+    for key in ("llm_calls", "input_tokens", "output_tokens", "web_search_calls",
+                "llm_usd", "search_usd", "usd"):
+        totals[key] += accounting[key]
+    for name, tokens in accounting["prompt_tokens"].items():
+        totals["prompt_tokens"][name] = totals["prompt_tokens"].get(name, 0) + tokens
+
+
+class CostLedger:
+    """
+    Thread-safe running totals of accounting records: overall, per mode
+    and per UTC hour (the last `hours` hours).
+    """
+
+    def __init__(self, hours: int = LEDGER_HOURS):
+        self.hours = hours
+        self._lock = threading.Lock()
+        self._total = _empty_totals()
+        self._by_mode: Dict[str, Dict] = {}
+        self._by_hour: "OrderedDict[str, Dict]" = OrderedDict()
+        self._warned_hours = set()
+
+    def record(self, accounting: Dict, at: float | None = None) -> None:
+        hour = hour_key(at)
+        with self._lock:
+            _add(self._total, accounting)
+            _add(self._by_mode.setdefault(accounting["mode"], _empty_totals()), accounting)
+            if hour not in self._by_hour:
+                self._by_hour[hour] = _empty_totals()
+                while len(self._by_hour) > self.hours:
+                    old, _ = self._by_hour.popitem(last=False)
+                    self._warned_hours.discard(old)
+            _add(self._by_hour[hour], accounting)
+
+    def hour_usd(self, at: float | None = None) -> float:
+        """
+        Spend in the hour containing `at` (default: now).
+        """
+        with self._lock:
+            bucket = self._by_hour.get(hour_key(at))
+            return bucket["usd"] if bucket else 0.0
+
+    def warn_once(self, hour: str) -> bool:
+        """
+        True the first time it is called for an hour.
+        """
+        with self._lock:
+            if hour in self._warned_hours:
+                return False
+            self._warned_hours.add(hour)
+            return True
+
+    def summary(self) -> Dict:
+        with self._lock:
+            return copy.deepcopy(
+                {"total": self._total, "by_mode": self._by_mode, "by_hour": dict(self._by_hour)}
+            )
+
+
+_default_ledger = CostLedger()
+
+
+def default_ledger() -> CostLedger:
+    """
+    Process-wide ledger used by answer_query unless one is passed.
+    """
+    return _default_ledger
+
+
+def check_hourly_budget(ledger: CostLedger, mode: str) -> Tuple[str, bool]:
+    """
+    Mode to answer in, and whether the hourly budget is exceeded. Over
+    budget, logs a warning (once per hour) and, with BUDGET_ACTION
+    "concise", returns "concise".
+    """
+    config = get_config()
+    limit = config.get("COST_BUDGET_USD_PER_HOUR", 0.0)
+    if limit <= 0:
+        return mode, False
+    spent = ledger.hour_usd()
+    if spent < limit:
+        return mode, False
+
+    action = config.get("BUDGET_ACTION", "warn")
+    if ledger.warn_once(hour_key()):
+        print(
+            f"[check_hourly_budget] Spent ${spent:.4f} this hour, over the "
+            f"${limit:.4f} budget" + ("; answering in concise mode" if action == "concise" else "")
+        )
+    return ("concise" if action == "concise" else mode), True
+
+
+def format_summary(summary: Dict) -> str:
+    """
+    Plain-text table of a CostLedger summary (per mode, then per hour).
+    """
+    lines = [f"{'':<18}{'requests':>9}{'in tok':>10}{'out tok':>10}{'web':>6}{'usd':>11}"]
+
+    def row(label: str, t: Dict) -> str:
+        return (
+            f"{label:<18}{t['requests']:>9}{t['input_tokens']:>10}{t['output_tokens']:>10}"
+            f"{t['web_search_calls']:>6}{t['usd']:>11.5f}"
+        )
+
+    for mode, t in sorted(summary["by_mode"].items()):
+        lines.append(row(f"mode {mode}", t))
+    for hour, t in summary["by_hour"].items():
+        lines.append(row(hour, t))
+    lines.append(row("total", summary["total"]))
+
+    prompt = summary["total"]["prompt_tokens"]
+    total_prompt = sum(prompt.values())
+    if total_prompt:
+        lines.append(
+            "prompt tokens: "
+            + ", ".join(f"{name} {tokens / total_prompt:.0%}" for name, tokens in prompt.items())
+        )
+    return "\n".join(lines)
@@ -1,11 +1,42 @@
 # utils/assistant.py
 
-from typing import Dict, List
+from contextlib import nullcontext
+from typing import Callable, Dict, List, Tuple
+import json
+import os
+import sys
+import time
+import uuid
 
-from langchain_core.messages import SystemMessage, HumanMessage
+import numpy as np
+from langchain_core.messages import AIMessage, HumanMessage, SystemMessage
 
-from models.embeddings import EmbeddingClient
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '../..')))
+from config.config import get_config
+from models.embeddings import EmbeddingBackend
+from utils.accounting import (
+    CHARS_PER_TOKEN,
+    CostLedger,
+    account_request,
+    check_hourly_budget,
+    count_tokens,
+    default_ledger,
+)
+from utils.compression import compress_chunks
+from utils.deadline import (
+    CONTEXT_CHARS_PER_MS,
+    LOW_BUDGET_MS,
+    MIN_CONTEXT_CHARS,
+    MIN_WEB_SEARCH_MS,
+    WEB_SEARCH_SHARE,
+    Deadline,
+    DeadlineExceeded,
+    is_timeout,
+)
+from utils.hot_cache import HotCache, HotCaches, index_version, web_key
+from utils.prefetch import PrefetchCache
 from utils.rag import retrieve_relevant_chunks
+from utils.profiling import profile_request, should_profile
 from utils.search import web_search
 
 
@@ -73,6 +104,38 @@ def build_context_block(rag_results: List[Dict], web_results: List[Dict]) -> str
     return "\n\n".join(parts).strip()
 
 
+def fit_context(
+    rag_results: List[Dict],
+    web_results: List[Dict],
+    max_chars: int,
+    min_tail_chars: int = 200,
+) -> Tuple[List[Dict], List[Dict], bool]:
+    """
+    Keep RAG results (best first), then web results, until max_chars of
+    text is used. The last kept item may be truncated if at least
+    min_tail_chars of it fit.
+
+    Returns (rag_results, web_results, trimmed).
+    """
+    budget = max_chars
+    kept: Dict[str, List[Dict]] = {"rag": [], "web": []}
+    trimmed = False
+
+    for kind, items, field in (("rag", rag_results, "text"), ("web", web_results, "snippet")):
+        for item in items:
+            size = len(item[field])
+            if size <= budget:
+                kept[kind].append(item)
+                budget -= size
+                continue
+            trimmed = True
+            if budget >= min_tail_chars:
+                kept[kind].append(dict(item, **{field: item[field][:budget]}))
+            budget = 0
+
+    return kept["rag"], kept["web"], trimmed
+
+
 def build_system_prompt(mode: str) -> str:
     """
     Build system prompt based on response mode: 'concise' or 'detailed'.
@@ -103,59 +166,432 @@ def answer_query(
     user_query: str,
     mode: str,
     chat_model,
-    embed_client: EmbeddingClient,
+    embed_client: EmbeddingBackend,
+    vectorstore: Dict,
+    top_k: int = 5,
+    filters: Dict | None = None,
+    web_search_fn: Callable[..., List[Dict]] = web_search,
+    request_id: str | None = None,
+    profile: bool | None = None,
+    deadline: Deadline | float | None = None,
+    compress: bool | None = None,
+    history: List[Dict] | None = None,
+    ledger: CostLedger | None = None,
+    prefetch: PrefetchCache | None = None,
+    caches: HotCaches | None = None,
+) -> Dict:
+    """
+    Run the pipeline (see _answer_query), optionally under the profiler.
+
+    profile=True/False forces profiling for this request; None samples
+    according to PROFILE_ENABLED / PROFILE_SAMPLE_RATE. Profile dumps are
+    keyed by request_id (generated if not given).
+
+    deadline: a Deadline, or a budget in ms from now (None / 0 = no limit).
+    The stages then degrade to fit it; result["degradations"] lists what
+    was cut and result["deadline"] whether the budget was met.
+
+    compress: extractive compression of the retrieved chunks before
+    prompting (None = CONTEXT_COMPRESSION setting); result["compression"]
+    reports the token reduction.
+
+    history: earlier turns of the conversation, as {"role": "user" |
+    "assistant", "content": ...}.
+
+    result["accounting"] has the request's tokens and cost (see
+    utils.accounting); it is added to ledger (default: the process-wide
+    one). Over COST_BUDGET_USD_PER_HOUR or PROMPT_TOKEN_BUDGET, a warning
+    is logged and, with BUDGET_ACTION "concise", the request is answered
+    in concise mode.
+
+    prefetch: the conversation's PrefetchCache (see utils.prefetch). A
+    question prefetched after the previous turn skips embedding and/or
+    search (result["prefetch"] says which); likely follow-ups of this one
+    are prefetched once no request is in flight.
+
+    caches: the process's HotCaches (see utils.hot_cache). The query
+    embedding, retrieval results and web results are reused from them
+    when cached; result["cache"] says which were.
+    """
+    request_id = request_id or uuid.uuid4().hex[:12]
+    deadline = Deadline.coerce(deadline)
+    config = get_config()
+    if compress is None:
+        compress = config.get("CONTEXT_COMPRESSION", False)
+    ledger = ledger if ledger is not None else default_ledger()
+    requested_mode = mode
+    mode, over_budget = check_hourly_budget(ledger, mode)
+
+    foreground = prefetch.prefetcher.foreground() if prefetch is not None else nullcontext()
+    with foreground, profile_request(
+        request_id, "answer_query", enabled=should_profile(profile)
+    ) as profile_info:
+        result = _answer_query(
+            user_query=user_query,
+            mode=mode,
+            chat_model=chat_model,
+            embed_client=embed_client,
+            vectorstore=vectorstore,
+            top_k=top_k,
+            filters=filters,
+            web_search_fn=web_search_fn,
+            deadline=deadline,
+            compress=compress,
+            history=history,
+            prompt_token_budget=config.get("PROMPT_TOKEN_BUDGET", 0),
+            budget_action=config.get("BUDGET_ACTION", "warn"),
+            prefetch=prefetch,
+            caches=caches,
+        )
+
+    result["request_id"] = request_id
+    if over_budget and mode != requested_mode:
+        result["degradations"].append("hourly_budget_concise")
+    ledger.record(result["accounting"])
+    if deadline is not None:
+        result["deadline"] = {
+            "budget_ms": deadline.budget_ms,
+            "elapsed_ms": deadline.elapsed_ms(),
+            "met": not deadline.expired,
+        }
+    if profile_info:
+        result["profile"] = profile_info
+    return result
+
+
+def _answer_query(
+    user_query: str,
+    mode: str,
+    chat_model,
+    embed_client: EmbeddingBackend,
     vectorstore: Dict,
     top_k: int = 5,
+    filters: Dict | None = None,
+    web_search_fn: Callable[..., List[Dict]] = web_search,
+    deadline: Deadline | None = None,
+    compress: bool = False,
+    history: List[Dict] | None = None,
+    prompt_token_budget: int = 0,
+    budget_action: str = "warn",
+    prefetch: PrefetchCache | None = None,
+    caches: HotCaches | None = None,
 ) -> Dict:
     """
     End-to-end pipeline:
 
-    1. Get RAG results from vectorstore.
+    1. Get RAG results from vectorstore (optionally filtered by metadata),
+       optionally compressed to the sentences most relevant to the query.
+    2-5. generate_answer: web search if needed, build context, call the LLM.
+
+    Returns answer + metadata (sources, per-stage timings, errors, usage,
+    degradations). web_search_fn can be swapped (e.g. for a fake backend
+    in load tests).
+    """
+    t_start = time.perf_counter()
+    degradations: List[str] = []
+
+    # Short on time: fewer chunks means less to score, format and prompt
+    if deadline is not None and deadline.remaining_ms() < LOW_BUDGET_MS and top_k > 1:
+        top_k = max(1, top_k // 2)
+        degradations.append("top_k_reduced")
+
+    # 1. Retrieve from internal docs (the query embedding is reused below),
+    # unless this question was prefetched
+    hit = None
+    cached = {"embedding": False, "retrieval": False, "web": False}
+    if prefetch is not None and user_query:
+        request_key = prefetch.request_key(vectorstore, top_k, filters)
+        hit = prefetch.lookup(user_query, request_key)
+
+    if hit is not None:
+        q_vec, rag_results = hit["q_vec"], hit["rag_results"]
+    else:
+        if caches is not None and user_query:
+            q_vec, cached["embedding"] = caches.embed_query(embed_client, user_query)
+        else:
+            q_emb = embed_client.embed_query(user_query) if user_query else []
+            q_vec = np.array(q_emb, dtype="float32")
+        q_vec = q_vec if len(q_vec) else None
+        rag_results = []
+        if q_vec is not None and prefetch is not None:
+            hit = prefetch.lookup_similar(q_vec, request_key)
+
+        # Retrieval results are cached per index version
+        retrieval_key = (user_query, top_k, json.dumps(filters, sort_keys=True))
+        version = index_version(vectorstore) if caches is not None else None
+        if hit is not None:
+            rag_results = hit["rag_results"]
+        elif q_vec is not None:
+            cached_results = caches.retrieval.get(retrieval_key, version) if version else None
+            if cached_results is not None:
+                rag_results = [dict(r) for r in cached_results]
+                cached["retrieval"] = True
+            else:
+                rag_results = retrieve_relevant_chunks(
+                    query=user_query,
+                    embed_client=embed_client,
+                    vectorstore=vectorstore,
+                    top_k=top_k,
+                    filters=filters,
+                    query_vec=q_vec,
+                )
+                if version:
+                    caches.retrieval.put(retrieval_key, [dict(r) for r in rag_results], version)
+    retrieve_ms = (time.perf_counter() - t_start) * 1000
+
+    compression = None
+    if compress and rag_results:
+        rag_results, compression = compress_chunks(q_vec, rag_results, embed_client)
+
+    result = generate_answer(
+        user_query,
+        mode,
+        chat_model,
+        rag_results,
+        web_search_fn,
+        deadline=deadline,
+        history=history,
+        prompt_token_budget=prompt_token_budget,
+        budget_action=budget_action,
+        web_cache=caches.web if caches is not None else None,
+    )
+    result["degradations"] = degradations + result["degradations"]
+    result["timings_ms"]["retrieve_ms"] = retrieve_ms
+    if compression is not None:
+        result["timings_ms"]["compress_ms"] = compression["ms"]
+        result["compression"] = compression
+    if caches is not None:
+        result["cache"] = dict(cached, web=result["web_cached"])
+    if prefetch is not None:
+        result["prefetch"] = {
+            "hit": hit["kind"] if hit is not None else None,
+            "matched": hit["query"] if hit is not None else None,
+        }
+        if q_vec is not None:
+            prefetch.prefetcher.after_answer(
+                prefetch, user_query, q_vec, embed_client, vectorstore, top_k, filters
+            )
+    result["timings_ms"]["total_ms"] = (time.perf_counter() - t_start) * 1000
+    return result
+
+
+def _response_usage(response) -> Dict | None:
+    """
+    Token usage reported by the provider (LangChain usage_metadata), if any.
+    """
+    usage = getattr(response, "usage_metadata", None)
+    if not usage:
+        return None
+    return {
+        "input_tokens": int(usage.get("input_tokens", 0)),
+        "output_tokens": int(usage.get("output_tokens", 0)),
+    }
+
+
+def history_messages(history: List[Dict] | None) -> List:
+    """
+    LangChain messages for earlier turns ({"role": "user" | "assistant", "content": ...}).
+    """
+    messages = []
+    for turn in history or []:
+        if turn["role"] == "assistant":
+            messages.append(AIMessage(content=turn["content"]))
+        else:
+            messages.append(HumanMessage(content=turn["content"]))
+    return messages
+
+
+def build_question_message(user_query: str, context_block: str) -> str:
+    return (
+        f"User question:\n{user_query}\n\n"
+        f"Here is the available context from internal docs and web (if any):\n{context_block}\n\n"
+        "Using ONLY this information, answer the question. "
+        "If the context does not contain enough information, say that explicitly."
+    )
+
+
+def prompt_sections(
+    system_prompt: str,
+    history: List[Dict] | None,
+    user_query: str,
+    rag_results: List[Dict],
+    web_results: List[Dict],
+) -> Dict[str, str]:
+    """
+    Prompt text by part (see utils.accounting.PROMPT_SECTIONS): the
+    question section is the user message without its context.
+    """
+    return {
+        "system": system_prompt,
+        "history": "\n".join(turn["content"] for turn in history or []),
+        "question": build_question_message(user_query, ""),
+        "docs": build_context_block(rag_results, []),
+        "web": build_context_block([], web_results),
+    }
+
+
+def generate_answer(
+    user_query: str,
+    mode: str,
+    chat_model,
+    rag_results: List[Dict],
+    web_search_fn: Callable[..., List[Dict]] | None = web_search,
+    deadline: Deadline | None = None,
+    history: List[Dict] | None = None,
+    prompt_token_budget: int = 0,
+    budget_action: str = "warn",
+    web_cache: HotCache | None = None,
+) -> Dict:
+    """
+    Answer a query from already retrieved RAG results
+    (web_search_fn=None disables web search):
+
     2. Decide if web search is needed.
     3. Build combined context block.
-    4. Call chat_model with system + user messages.
-    5. Return answer + metadata (sources).
-    """
-    # 1. Retrieve from internal docs
-    rag_results = retrieve_relevant_chunks(
-        query=user_query,
-        embed_client=embed_client,
-        vectorstore=vectorstore,
-        top_k=top_k,
-    )
+    4. Call chat_model with system + history + user messages.
+    5. Return answer + metadata (sources, timings, errors, usage, accounting).
+
+    With a deadline, web search gets WEB_SEARCH_SHARE of the remaining time
+    (or is skipped), the context is trimmed to what the LLM can read in the
+    time left, and the LLM call times out at the deadline. Each call gets
+    its slice as the client's request timeout (web_search_fn(..., timeout_s=),
+    chat_model.invoke(..., timeout=)), so a call that runs over is cut
+    off rather than abandoned while still running.
+
+    A prompt over prompt_token_budget tokens (0 = no limit) is logged;
+    with budget_action "concise" the answer is concise and the context
+    is trimmed to fit the budget.
+
+    With web_cache, fresh cached web results are used instead of a search
+    (even when the deadline leaves no time for one).
+    """
+    timings: Dict[str, float] = {}
+    errors: Dict[str, str] = {}
+    degradations: List[str] = []
 
     # 2. Decide web search usage
-    use_web = should_use_web_search(user_query, rag_results)
+    use_web = web_search_fn is not None and should_use_web_search(user_query, rag_results)
+    cached_web = None
+    if use_web and web_cache is not None:
+        cached_web = web_cache.get(web_key(user_query, 3))
+
+    web_budget_ms = deadline.slice_ms(WEB_SEARCH_SHARE) if deadline is not None else None
+    if (
+        use_web
+        and cached_web is None
+        and web_budget_ms is not None
+        and web_budget_ms < MIN_WEB_SEARCH_MS
+    ):
+        use_web = False
+        degradations.append("web_search_skipped")
 
     # 3. Web search if needed
-    web_results: List[Dict] = web_search(user_query, k=3) if use_web else []
+    web_results: List[Dict] = []
+    web_search_calls = 0
+    if cached_web is not None:
+        web_results = [dict(w) for w in cached_web]
+    elif use_web:
+        t_web = time.perf_counter()
+        web_search_calls = 1
+        try:
+            if web_budget_ms is None:
+                web_results = web_search_fn(user_query, k=3)
+            else:
+                web_results = web_search_fn(user_query, k=3, timeout_s=web_budget_ms / 1000)
+        except Exception as e:
+            if web_budget_ms is not None and is_timeout(e):
+                degradations.append("web_search_timed_out")
+            else:
+                errors["web_search"] = str(e)
+        else:
+            if web_cache is not None and web_results:
+                web_cache.put(web_key(user_query, 3), [dict(w) for w in web_results])
+        timings["web_search_ms"] = (time.perf_counter() - t_web) * 1000
+
+    # Prompt length drives LLM latency: shrink the context to the time left
+    if deadline is not None:
+        max_chars = max(MIN_CONTEXT_CHARS, int(deadline.remaining_ms() * CONTEXT_CHARS_PER_MS))
+        rag_results, web_results, trimmed = fit_context(rag_results, web_results, max_chars)
+        if trimmed:
+            degradations.append("context_trimmed")
 
     # 4. Build context + system prompt
-    context_block = build_context_block(rag_results, web_results)
     system_prompt = build_system_prompt(mode)
+    sections = prompt_sections(system_prompt, history, user_query, rag_results, web_results)
+
+    if prompt_token_budget > 0:
+        tokens = {name: count_tokens(text) for name, text in sections.items()}
+        total = sum(tokens.values())
+        if total > prompt_token_budget:
+            print(
+                f"[generate_answer] Prompt of {total} tokens is over the budget "
+                f"of {prompt_token_budget}"
+                + ("; answering in concise mode" if budget_action == "concise" else "")
+            )
+            if budget_action == "concise":
+                mode = "concise"
+                system_prompt = build_system_prompt(mode)
+                fixed = count_tokens(system_prompt) + tokens["history"] + tokens["question"]
+                max_chars = max(0, prompt_token_budget - fixed) * CHARS_PER_TOKEN
+                rag_results, web_results, _ = fit_context(rag_results, web_results, max_chars)
+                sections = prompt_sections(
+                    system_prompt, history, user_query, rag_results, web_results
+                )
+                degradations.append("prompt_budget_concise")
 
+    context_block = build_context_block(rag_results, web_results)
     messages = [
         SystemMessage(content=system_prompt),
-        HumanMessage(
-            content=(
-                f"User question:\n{user_query}\n\n"
-                f"Here is the available context from internal docs and web (if any):\n{context_block}\n\n"
-                "Using ONLY this information, answer the question. "
-                "If the context does not contain enough information, say that explicitly."
-            )
-        ),
+        *history_messages(history),
+        HumanMessage(content=build_question_message(user_query, context_block)),
     ]
 
     # 5. Call the LLM
+    usage = None
+    llm_called = False
+    t_llm = time.perf_counter()
+    llm_timeout_ms = deadline.remaining_ms() if deadline is not None else None
     try:
-        response = chat_model.invoke(messages)
+        if llm_timeout_ms is None:
+            llm_called = True
+            response = chat_model.invoke(messages)
+        elif llm_timeout_ms <= 0:
+            raise DeadlineExceeded("no time left for the LLM call")
+        else:
+            llm_called = True
+            response = chat_model.invoke(messages, timeout=llm_timeout_ms / 1000)
         answer_text = response.content
+        usage = _response_usage(response)
+        answered = True
     except Exception as e:
-        answer_text = f"Error getting response from model: {str(e)}"
+        if llm_timeout_ms is not None and is_timeout(e):
+            degradations.append("llm_timed_out" if llm_called else "llm_skipped")
+            answer_text = "Sorry, this is taking longer than expected. Please try again in a moment."
+        else:
+            answer_text = f"Error getting response from model: {str(e)}"
+        errors["llm"] = str(e)
+        answered = False
+    timings["llm_ms"] = (time.perf_counter() - t_llm) * 1000
+
+    accounting = account_request(
+        mode,
+        sections,
+        llm_called,
+        answer=answer_text if answered else "",
+        usage=usage,
+        web_search_calls=web_search_calls,
+    )
 
     return {
         "answer": answer_text,
         "rag_results": rag_results,
         "web_results": web_results,
         "used_web": use_web,
+        "web_cached": cached_web is not None,
+        "timings_ms": timings,
+        "errors": errors,
+        "usage": usage,
+        "accounting": accounting,
+        "prompt_chars": sum(len(m.content) for m in messages),
+        "degradations": degradations,
     }
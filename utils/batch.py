@@ -0,0 +1,273 @@
+# utils/batch.py
+"""
+Resumable batch answering for ticket backlogs.
+
+Streams tickets from JSONL, retrieves in batches, runs LLM calls with
+bounded concurrency and appends one JSON line per finished ticket to the
+output file. The output file is the checkpoint: on restart, tickets whose
+id is already in it are skipped.
+
+Usage:
+    python -m utils.batch --input tickets.jsonl --output answers.jsonl
+    python -m utils.batch --input tickets.jsonl --output answers.jsonl --concurrency 16 --fake
+
+Ticket lines: {"id": "T-123", "query": "How do I reset my password?", "mode": "concise"}
+"""
+
+from concurrent.futures import ThreadPoolExecutor, wait
+from typing import Dict, Iterator, List, Set
+import argparse
+import json
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '../..')))
+from config.config import get_config
+from utils.accounting import CostLedger, check_hourly_budget, format_summary
+from utils.assistant import generate_answer
+from utils.index_manager import index_build_kwargs
+from utils.rag import build_knowledge_base, retrieve_relevant_chunks_batch
+from utils.search import web_search
+
+
+def iter_tickets(path: str) -> Iterator[Dict]:
+    """
+    Yield {"id", "query", "mode"} per JSONL line. Missing ids default to
+    the line number, so re-runs over the same file get stable ids.
+    """
+    with open(path, "r", encoding="utf-8") as f:
+        for line_no, line in enumerate(f, 1):
+            line = line.strip()
+            if not line:
+                continue
+            try:
+                item = json.loads(line)
+            except ValueError:
+                print(f"[iter_tickets] Skipping malformed line {line_no}")
+                continue
+            query = item.get("query") or item.get("text") or ""
+            yield {
+                "id": str(item.get("id", line_no)),
+                "query": query,
+                "mode": item.get("mode"),
+            }
+
+
+def load_done_ids(output_path: str) -> Set[str]:
+    """
+    Ids already present in the output file. A truncated last line (crash
+    mid-write) is ignored, so that ticket is simply redone.
+    """
+    done: Set[str] = set()
+    if not os.path.exists(output_path):
+        return done
+    with open(output_path, "r", encoding="utf-8") as f:
+        for line in f:
+            try:
+                done.add(str(json.loads(line)["id"]))
+            except (ValueError, KeyError):
+                continue
+    return done
+
+
+def _ends_mid_line(path: str) -> bool:
+    if not os.path.exists(path) or os.path.getsize(path) == 0:
+        return False
+    with open(path, "rb") as f:
+        f.seek(-1, os.SEEK_END)
+        return f.read(1) != b"\n"
+
+
+def _batches(tickets: Iterator[Dict], size: int) -> Iterator[List[Dict]]:
+    batch: List[Dict] = []
+    for t in tickets:
+        batch.append(t)
+        if len(batch) >= size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+def run_batch(
+    input_path: str,
+    output_path: str,
+    chat_model,
+    embed_client,
+    vectorstore: Dict,
+    batch_size: int = 32,
+    concurrency: int = 4,
+    default_mode: str = "concise",
+    top_k: int = 5,
+    web_search_fn=web_search,
+) -> Dict:
+    """
+    Answer every ticket not yet in output_path. Returns a run report.
+    """
+    config = get_config()
+    done = load_done_ids(output_path)
+    stats = {"answered": 0, "skipped": 0, "errors": 0, "usd": 0.0}
+    ledger = CostLedger()
+    start = time.perf_counter()
+
+    def answer(ticket: Dict, rag_results: List[Dict]) -> Dict:
+        mode, _ = check_hourly_budget(ledger, (ticket["mode"] or default_mode).lower())
+        result = generate_answer(
+            ticket["query"],
+            mode,
+            chat_model,
+            rag_results,
+            web_search_fn,
+            prompt_token_budget=config.get("PROMPT_TOKEN_BUDGET", 0),
+            budget_action=config.get("BUDGET_ACTION", "warn"),
+        )
+        accounting = result["accounting"]
+        ledger.record(accounting)
+        return {
+            "id": ticket["id"],
+            "query": ticket["query"],
+            "answer": result["answer"],
+            "sources": sorted({r["source"] for r in rag_results}),
+            "used_web": result["used_web"],
+            "errors": result["errors"],
+            "cost": {
+                key: accounting[key]
+                for key in ("mode", "input_tokens", "output_tokens", "prompt_tokens",
+                            "web_search_calls", "usd")
+            },
+        }
+
+    def pending_tickets() -> Iterator[Dict]:
+        for ticket in iter_tickets(input_path):
+            if ticket["id"] in done:
+                stats["skipped"] += 1
+            else:
+                yield ticket
+
+    def save(record: Dict) -> None:
+        # One complete line per ticket; flushed so a crash loses at most
+        # the tickets still in flight.
+        out.write(json.dumps(record) + "\n")
+        out.flush()
+
+        stats["answered"] += 1
+        stats["usd"] += record["cost"]["usd"]
+        if record["errors"]:
+            stats["errors"] += 1
+
+    def drain(futures: List) -> None:
+        # Saved futures are removed, so an interrupt leaves only unsaved ones
+        had_futures = bool(futures)
+        while futures:
+            save(futures[0].result())
+            futures.pop(0)
+
+        if had_futures:
+            os.fsync(out.fileno())
+            elapsed = time.perf_counter() - start
+            print(
+                f"[run_batch] {stats['answered']} answered "
+                f"({stats['answered'] / elapsed:.1f} tickets/s)"
+            )
+
+    with open(output_path, "a", encoding="utf-8") as out, ThreadPoolExecutor(
+        max_workers=concurrency
+    ) as pool:
+        if _ends_mid_line(output_path):
+            out.write("\n")  # terminate a line truncated by a crash
+        in_flight: List = []
+        submitted: List = []
+        try:
+            for batch in _batches(pending_tickets(), batch_size):
+                # Retrieval for this batch overlaps the previous batch's LLM calls
+                rag_lists = retrieve_relevant_chunks_batch(
+                    [t["query"] for t in batch], embed_client, vectorstore, top_k=top_k
+                )
+                submitted = [pool.submit(answer, t, r) for t, r in zip(batch, rag_lists)]
+                drain(in_flight)
+                in_flight, submitted = submitted, []
+            drain(in_flight)
+        except KeyboardInterrupt:
+            # Drop queued tickets, but keep the answers already paid for:
+            # let running calls finish and save every successful one
+            unsaved = in_flight + submitted
+            for fut in unsaved:
+                fut.cancel()
+            wait(unsaved)
+            finished = [f for f in unsaved if not f.cancelled() and f.exception() is None]
+            for fut in finished:
+                save(fut.result())
+            os.fsync(out.fileno())
+            print(
+                f"[run_batch] Interrupted; {stats['answered']} finished tickets are saved "
+                f"({len(finished)} after the interrupt), re-run to resume."
+            )
+
+    elapsed = time.perf_counter() - start
+    answered = stats["answered"]
+    return {
+        "answered": answered,
+        "skipped_already_done": stats["skipped"],
+        "tickets_with_errors": stats["errors"],
+        "seconds": elapsed,
+        "tickets_per_second": answered / elapsed if elapsed else 0.0,
+        "total_usd": stats["usd"],
+        "usd_per_ticket": stats["usd"] / answered if answered else 0.0,
+        "cost": ledger.summary(),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Resumable batch answering of tickets.")
+    parser.add_argument("--input", required=True, help="tickets JSONL")
+    parser.add_argument("--output", required=True, help="answers JSONL (also the checkpoint)")
+    parser.add_argument("--docs-dir", default="data/docs")
+    parser.add_argument("--batch-size", type=int, default=32)
+    parser.add_argument("--concurrency", type=int, default=4)
+    parser.add_argument("--mode", default="concise", choices=["concise", "detailed"])
+    parser.add_argument("--top-k", type=int, default=5)
+    parser.add_argument("--no-web", action="store_true", help="never call web search")
+    parser.add_argument("--fake", action="store_true", help="fake LLM / search / embeddings (offline dry run)")
+    args = parser.parse_args()
+
+    if args.fake:
+        from models.fakes import FakeChatModel, FakeEmbeddingClient, FakeWebSearch
+
+        chat_model = FakeChatModel(latency_ms=(300, 100))
+        embed_client = FakeEmbeddingClient()
+        web_search_fn = FakeWebSearch(latency_ms=(200, 50))
+    else:
+        from models.embeddings import create_embedding_client
+        from models.llm import get_chat_model
+
+        chat_model = get_chat_model()
+        if chat_model is None:
+            print("No LLM API key configured (GROQ_API_KEY / OPENAI_API_KEY / GOOGLE_API_KEY).")
+            return
+        embed_client = create_embedding_client()
+        web_search_fn = web_search
+
+    if args.no_web:
+        web_search_fn = None
+
+    vectorstore = build_knowledge_base(args.docs_dir, embed_client, **index_build_kwargs())
+    report = run_batch(
+        args.input,
+        args.output,
+        chat_model,
+        embed_client,
+        vectorstore,
+        batch_size=args.batch_size,
+        concurrency=args.concurrency,
+        default_mode=args.mode,
+        top_k=args.top_k,
+        web_search_fn=web_search_fn,
+    )
+    cost = report.pop("cost")
+    print(json.dumps(report, indent=2))
+    print(format_summary(cost))
+
+
+if __name__ == "__main__":
+    main()
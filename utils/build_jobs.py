@@ -0,0 +1,237 @@
+# utils/build_jobs.py
+
+from typing import Callable, Dict, Iterator, List, Tuple
+import os
+import threading
+import time
+
+from utils.rag import (
+    assemble_vectorstore,
+    document_spans,
+    embed_document_segments,
+    load_document,
+    load_metadata,
+)
+
+
+class BuildCancelled(Exception):
+    pass
+
+
+class BuildJob:
+    """
+    Builds a knowledge base on a background thread.
+
+    Documents are embedded in groups of about batch_size chunks. While the
+    job runs, progress() reports documents read, chunks embedded and an
+    ETA, and .vectorstore serves a partial index over the groups embedded
+    so far (republished at most every partial_interval seconds, marked
+    with "partial": True). When the job finishes, .vectorstore is the full
+    index built with build_kwargs, and on_done(vectorstore) is called. If
+    on_done raises, the job is still "done" (the index was built) and
+    progress()["finish_error"] holds the error.
+
+    cancel() stops the job between groups.
+    """
+
+    def __init__(
+        self,
+        docs_dir: str,
+        embed_client,
+        build_kwargs: Dict | None = None,
+        batch_size: int = 64,
+        partial_interval: float = 2.0,
+        on_done: Callable[[Dict], None] | None = None,
+    ):
+        self.docs_dir = docs_dir
+        self.embed_client = embed_client
+        self.build_kwargs = dict(build_kwargs or {})
+        self.build_kwargs.pop("num_shards", None)  # partial indexes are unsharded
+        self.chunking = self.build_kwargs.pop("chunking", None)
+        self.chunk_options = self.build_kwargs.pop("chunk_options", None)
+        self.batch_size = batch_size
+        self.partial_interval = partial_interval
+        self.on_done = on_done
+
+        self._vectorstore: Dict | None = None
+        self._cancel = threading.Event()
+        self._thread: threading.Thread | None = None
+        self._progress: Dict = {
+            "state": "pending",  # loading | embedding | finalizing | done | cancelled | failed
+            "docs_read": 0,
+            "docs_total": 0,
+            "chunks_embedded": 0,
+            "chunks_total": 0,
+            "started_at": None,
+            "finished_at": None,
+            "error": None,
+            "finish_error": None,  # on_done failed after a successful build
+        }
+
+    @property
+    def vectorstore(self) -> Dict | None:
+        """
+        Latest published index (partial while running), or None.
+        """
+        return self._vectorstore
+
+    @property
+    def running(self) -> bool:
+        return self._progress["state"] in ("pending", "loading", "embedding", "finalizing")
+
+    def start(self) -> "BuildJob":
+        if self._thread is None:
+            self._progress["started_at"] = time.time()
+            self._thread = threading.Thread(target=self._run, name="BuildJob", daemon=True)
+            self._thread.start()
+        return self
+
+    def cancel(self) -> None:
+        self._cancel.set()
+
+    def wait(self, timeout: float | None = None) -> bool:
+        """
+        Block until the job ends. Returns False on timeout.
+        """
+        if self._thread is not None:
+            self._thread.join(timeout)
+        return not self.running
+
+    def progress(self) -> Dict:
+        """
+        Snapshot of the job's progress, with elapsed_s, fraction and eta_s.
+        """
+        p = dict(self._progress)
+        end = p["finished_at"] or time.time()
+        p["elapsed_s"] = end - p["started_at"] if p["started_at"] else 0.0
+        p["fraction"] = p["chunks_embedded"] / p["chunks_total"] if p["chunks_total"] else 0.0
+
+        embed_started = p.pop("embed_started_at", None)
+        p["eta_s"] = None
+        if p["state"] == "embedding" and embed_started and p["chunks_embedded"]:
+            rate = p["chunks_embedded"] / (time.time() - embed_started)
+            p["eta_s"] = (p["chunks_total"] - p["chunks_embedded"]) / rate
+        p["partial_chunks"] = len(self._vectorstore["chunks"]) if self._vectorstore else 0
+        return p
+
+    def _check_cancel(self) -> None:
+        if self._cancel.is_set():
+            raise BuildCancelled()
+
+    def _run(self) -> None:
+        progress = self._progress
+        try:
+            # 1. Read and chunk documents (chunk counts give the progress total)
+            progress["state"] = "loading"
+            if not os.path.isdir(self.docs_dir):
+                raise FileNotFoundError(f"Docs directory not found: {self.docs_dir}")
+            metadata = load_metadata(self.docs_dir)
+            fnames = sorted(f for f in os.listdir(self.docs_dir) if f.lower().endswith(".txt"))
+            progress["docs_total"] = len(fnames)
+
+            docs: List[Dict] = []
+            spans: List[List[Tuple[int, int]]] = []
+            for fname in fnames:
+                self._check_cancel()
+                doc = load_document(self.docs_dir, fname, metadata)
+                if doc is not None:
+                    docs.append(doc)
+                    spans.append(document_spans(doc["text"], self.chunking, self.chunk_options))
+                    progress["chunks_total"] += len(spans[-1])
+                progress["docs_read"] += 1
+
+            if not progress["chunks_total"]:
+                raise ValueError(f"No chunks created from docs in: {self.docs_dir}")
+
+            # 2. Embed document groups, publishing partial indexes on the way
+            progress["state"] = "embedding"
+            progress["embed_started_at"] = time.time()
+            segments: List[Dict] = []
+            last_publish = 0.0
+            dedup = self.build_kwargs.get("dedup", False)
+            for group, group_spans in self._groups(docs, spans):
+                self._check_cancel()
+                new = embed_document_segments(
+                    group, self.embed_client, dedup=dedup, spans_per_doc=group_spans
+                )
+                segments.extend(new)
+                progress["chunks_embedded"] += sum(len(seg["spans"]) for seg in new)
+
+                if time.time() - last_publish >= self.partial_interval:
+                    self._publish_partial(segments)
+                    last_publish = time.time()
+
+            # 3. Full index (projection, store backend) from all segments
+            self._check_cancel()
+            progress["state"] = "finalizing"
+            version = self._vectorstore["version"] + 1 if self._vectorstore else 1
+            vectorstore = assemble_vectorstore(segments, version=version, **self.build_kwargs)
+            self._vectorstore = vectorstore
+            if self.on_done is not None:
+                try:
+                    self.on_done(vectorstore)
+                except Exception as e:
+                    progress["finish_error"] = str(e)
+                    print(f"[BuildJob] Built {self.docs_dir}, but on_done failed: {e}")
+            progress["state"] = "done"
+        except BuildCancelled:
+            progress["state"] = "cancelled"
+            print(f"[BuildJob] Cancelled build of {self.docs_dir}")
+        except Exception as e:
+            progress["state"] = "failed"
+            progress["error"] = str(e)
+            print(f"[BuildJob] Build of {self.docs_dir} failed: {e}")
+        finally:
+            progress["finished_at"] = time.time()
+
+    def _groups(
+        self, docs: List[Dict], spans: List[List[Tuple[int, int]]]
+    ) -> Iterator[Tuple[List[Dict], List[List[Tuple[int, int]]]]]:
+        group: List[Dict] = []
+        group_spans: List[List[Tuple[int, int]]] = []
+        chunks = 0
+        for doc, doc_spans in zip(docs, spans):
+            group.append(doc)
+            group_spans.append(doc_spans)
+            chunks += len(doc_spans)
+            if chunks >= self.batch_size:
+                yield group, group_spans
+                group, group_spans, chunks = [], [], 0
+        if group:
+            yield group, group_spans
+
+    def _publish_partial(self, segments: List[Dict]) -> None:
+        if not any(seg["spans"] for seg in segments):
+            return
+        version = self._vectorstore["version"] + 1 if self._vectorstore else 1
+        partial = assemble_vectorstore(
+            segments, version=version, dedup=self.build_kwargs.get("dedup", False)
+        )
+        partial["partial"] = True
+        self._vectorstore = partial  # atomic publish
+
+
+class BuildJobs:
+    """
+    Registry with at most one running BuildJob per key (e.g. per tenant).
+    """
+
+    def __init__(self):
+        self._jobs: Dict[str, BuildJob] = {}
+        self._lock = threading.Lock()
+
+    def get(self, key: str) -> BuildJob | None:
+        with self._lock:
+            return self._jobs.get(key)
+
+    def start(self, key: str, make_job: Callable[[], BuildJob]) -> BuildJob:
+        """
+        Start make_job() under key, unless a job for key is already running
+        (that job is returned instead).
+        """
+        with self._lock:
+            job = self._jobs.get(key)
+            if job is None or not job.running:
+                job = make_job().start()
+                self._jobs[key] = job
+            return job
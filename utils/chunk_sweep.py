@@ -0,0 +1,250 @@
+# utils/chunk_sweep.py
+"""
+Chunking-parameter sweep.
+
+Rebuilds the index for every chunking setting in a grid and records the
+number of chunks, build time, embedding matrix bytes, search latency and
+retrieval quality on labelled queries, then picks the best setting that
+fits a memory and/or latency target.
+
+Usage:
+    python -m utils.chunk_sweep --fake-embeddings
+    python -m utils.chunk_sweep --sizes 400,800,1200 --overlaps 0,100,200 --strategies fixed,cdc
+    python -m utils.chunk_sweep --queries labelled.jsonl --max-matrix-mb 64 --max-p50-ms 5
+
+Labelled queries use the format of utils.evaluation (default: FAQ
+questions from the docs).
+"""
+
+from typing import Dict, List
+import argparse
+import json
+import time
+
+import numpy as np
+
+from utils.chunking import MAX_CHUNK_CHARS, MIN_CHUNK_CHARS
+from utils.evaluation import (
+    generate_faq_queries,
+    load_labelled_queries,
+    mark_pareto,
+    ranking_metrics,
+)
+from utils.rag import CHUNKERS, build_knowledge_base
+
+
+def chunking_grid(
+    sizes: List[int], overlaps: List[int], strategies: List[str]
+) -> List[Dict]:
+    """
+    Settings to try: every (size, overlap < size) pair for "fixed", and
+    for "cdc" one setting per size with the default min/max proportions
+    (the default 300..1200 corresponds to size 800). Overlap does not
+    apply to cdc.
+    """
+    grid: List[Dict] = []
+    for strategy in strategies:
+        if strategy not in CHUNKERS:
+            raise ValueError(f"Unknown chunking: {strategy} (choose from {', '.join(CHUNKERS)})")
+        for size in sizes:
+            if strategy == "fixed":
+                for overlap in overlaps:
+                    if overlap < size:
+                        grid.append(
+                            {
+                                "label": f"fixed-{size}/{overlap}",
+                                "chunking": "fixed",
+                                "chunk_options": {"chunk_size": size, "overlap": overlap},
+                            }
+                        )
+            else:
+                min_size = size * MIN_CHUNK_CHARS // 800
+                max_size = size * MAX_CHUNK_CHARS // 800
+                grid.append(
+                    {
+                        "label": f"cdc-{min_size}..{max_size}",
+                        "chunking": "cdc",
+                        "chunk_options": {"min_size": min_size, "max_size": max_size},
+                    }
+                )
+    return grid
+
+
+def sweep(
+    docs_dir: str,
+    embed_client,
+    queries: List[Dict],
+    grid: List[Dict],
+    k: int = 5,
+    dedup: bool = False,
+) -> List[Dict]:
+    """
+    Build one index per grid setting and measure it. Query embeddings are
+    computed once and shared by every setting; latency covers the search.
+    """
+    query_vecs = np.array(
+        embed_client.embed_documents([q["query"] for q in queries]), dtype="float32"
+    )
+
+    rows: List[Dict] = []
+    for setting in grid:
+        start = time.perf_counter()
+        vectorstore = build_knowledge_base(
+            docs_dir,
+            embed_client,
+            dedup=dedup,
+            chunking=setting["chunking"],
+            chunk_options=setting["chunk_options"],
+        )
+        build_s = time.perf_counter() - start
+
+        store = vectorstore["store"]
+        chunks = vectorstore["chunks"]
+        all_sources = [set(chunks[i]["sources"]) for i in range(len(chunks))]
+
+        totals = {"recall": 0.0, "mrr": 0.0, "ndcg": 0.0}
+        latencies: List[float] = []
+        for q_vec, q in zip(query_vecs, queries):
+            relevant = set(q["relevant"])
+            start = time.perf_counter()
+            ids, _ = store.search(q_vec, k)
+            latencies.append((time.perf_counter() - start) * 1000)
+
+            num_relevant = sum(1 for s in all_sources if relevant & s)
+            for metric, value in ranking_metrics(
+                [all_sources[int(i)] for i in ids], relevant, num_relevant, k
+            ).items():
+                totals[metric] += value
+
+        n = max(1, len(queries))
+        store_stats = store.stats()
+        rows.append(
+            {
+                "config": setting["label"],
+                "chunking": setting["chunking"],
+                "chunk_options": setting["chunk_options"],
+                "chunks": len(chunks),
+                "mean_chunk_chars": float(chunks.lengths.mean()) if len(chunks) else 0.0,
+                "build_s": build_s,
+                "embed_s": vectorstore["dedup_report"].get("embed_seconds", 0.0),
+                "index_bytes": int(store_stats["count"] * store_stats["dim"] * 4),
+                f"recall@{k}": totals["recall"] / n,
+                "mrr": totals["mrr"] / n,
+                "p50_ms": float(np.percentile(latencies, 50)) if latencies else 0.0,
+                "p99_ms": float(np.percentile(latencies, 99)) if latencies else 0.0,
+            }
+        )
+        store.close()
+        print(f"[sweep] {setting['label']}: {len(chunks)} chunks in {build_s:.2f}s")
+
+    mark_pareto(rows, quality_key=f"recall@{k}")
+    return rows
+
+
+def recommend(
+    rows: List[Dict],
+    k: int = 5,
+    max_index_bytes: int | None = None,
+    max_p50_ms: float | None = None,
+) -> Dict | None:
+    """
+    Best setting within the targets: highest recall@k, then MRR, then the
+    smallest index and fastest build. None if nothing fits.
+    """
+    fitting = [
+        r
+        for r in rows
+        if (max_index_bytes is None or r["index_bytes"] <= max_index_bytes)
+        and (max_p50_ms is None or r["p50_ms"] <= max_p50_ms)
+    ]
+    if not fitting:
+        return None
+    return min(
+        fitting,
+        key=lambda r: (-r[f"recall@{k}"], -r["mrr"], r["index_bytes"], r["build_s"]),
+    )
+
+
+def print_table(rows: List[Dict], k: int) -> None:
+    print(
+        f"{'config':<18}{'chunks':>8}{'avg chars':>11}{'build s':>9}{'matrix KB':>11}"
+        f"{'p50 ms':>9}{'p99 ms':>9}{'recall@' + str(k):>10}{'mrr':>8}  pareto"
+    )
+    for r in rows:
+        print(
+            f"{r['config']:<18}{r['chunks']:>8}{r['mean_chunk_chars']:>11.0f}{r['build_s']:>9.2f}"
+            f"{r['index_bytes'] / 1024:>11.1f}{r['p50_ms']:>9.3f}{r['p99_ms']:>9.3f}"
+            f"{r[f'recall@{k}']:>10.3f}{r['mrr']:>8.3f}  {'*' if r['pareto'] else ''}"
+        )
+
+
+def _ints(value: str) -> List[int]:
+    return [int(v) for v in value.split(",") if v.strip()]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Sweep chunking parameters.")
+    parser.add_argument("--docs-dir", default="data/docs")
+    parser.add_argument("--queries", help="labelled JSONL; default: FAQ questions from the docs")
+    parser.add_argument("--k", type=int, default=5)
+    parser.add_argument("--sizes", default="400,800,1200", help="chunk sizes (chars)")
+    parser.add_argument("--overlaps", default="0,100,200", help="overlaps for fixed chunking (chars)")
+    parser.add_argument("--strategies", default="fixed,cdc")
+    parser.add_argument("--max-matrix-mb", type=float, help="memory target for the recommendation")
+    parser.add_argument("--max-p50-ms", type=float, help="latency target for the recommendation")
+    parser.add_argument("--no-dedup", action="store_true")
+    parser.add_argument("--fake-embeddings", action="store_true", help="use the hashing fake embedder")
+    parser.add_argument("--json", help="also write results to this file")
+    args = parser.parse_args()
+
+    if args.fake_embeddings:
+        from models.fakes import FakeEmbeddingClient
+
+        embed_client = FakeEmbeddingClient()
+    else:
+        from models.embeddings import create_embedding_client
+
+        embed_client = create_embedding_client()
+
+    queries = (
+        load_labelled_queries(args.queries)
+        if args.queries
+        else generate_faq_queries(args.docs_dir)
+    )
+    if not queries:
+        print("No labelled queries found.")
+        return
+
+    grid = chunking_grid(
+        _ints(args.sizes), _ints(args.overlaps), [s.strip() for s in args.strategies.split(",")]
+    )
+    rows = sweep(args.docs_dir, embed_client, queries, grid, k=args.k, dedup=not args.no_dedup)
+
+    print(f"\n{len(queries)} queries, {len(grid)} settings")
+    print_table(rows, args.k)
+
+    max_bytes = int(args.max_matrix_mb * 1024 * 1024) if args.max_matrix_mb else None
+    best = recommend(rows, args.k, max_index_bytes=max_bytes, max_p50_ms=args.max_p50_ms)
+    targets = []
+    if args.max_matrix_mb:
+        targets.append(f"matrix <= {args.max_matrix_mb} MB")
+    if args.max_p50_ms:
+        targets.append(f"p50 <= {args.max_p50_ms} ms")
+    target = " and ".join(targets) or "no target"
+    if best is None:
+        print(f"\nNo setting meets {target}.")
+    else:
+        options = ", ".join(f"{key}={value}" for key, value in best["chunk_options"].items())
+        print(
+            f"\nBest for {target}: {best['config']} (CHUNKING={best['chunking']}, {options}): "
+            f"recall@{args.k} {best[f'recall@{args.k}']:.3f}, {best['chunks']} chunks, "
+            f"{best['index_bytes'] / 1024:.1f} KB, p50 {best['p50_ms']:.3f} ms"
+        )
+
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump({"rows": rows, "best": best}, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
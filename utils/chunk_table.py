@@ -0,0 +1,296 @@
+# utils/chunk_table.py
+"""
+Columnar chunk storage, and a report of its memory next to a list of dicts.
+
+Usage:
+    python -m utils.chunk_table                   # data/docs, CHUNKING setting
+    python -m utils.chunk_table --docs-dir data/docs --chunking fixed
+"""
+
+from typing import Dict, Iterator, List, Tuple
+import argparse
+import os
+import sys
+
+import numpy as np
+
+
+def _byte_offsets(text: str, encoded: bytes) -> np.ndarray | None:
+    """
+    Prefix byte offsets for each character position of text (len(text) + 1
+    entries), or None when text is pure ASCII (char offset == byte offset).
+    """
+    if len(encoded) == len(text):
+        return None
+
+    codepoints = np.frombuffer(text.encode("utf-32-le"), dtype=np.uint32)
+    widths = (
+        1
+        + (codepoints >= 0x80)
+        + (codepoints >= 0x800)
+        + (codepoints >= 0x10000)
+    ).astype(np.int64)
+    return np.concatenate([[0], np.cumsum(widths)])
+
+
+class ChunkTable:
+    """
+    Columnar, read-only storage for chunks.
+
+    Instead of one {"text", "source"} dict per chunk:
+    - one UTF-8 bytes buffer per document (overlapping chunks share it)
+    - per chunk: doc id, byte offset and byte length into that buffer
+    - per chunk: an interned source id (smallest unsigned int dtype that fits)
+
+    Chunk text is only decoded when a row is materialized, e.g. for the
+    top-k results; view(i) gives a zero-copy memoryview of the bytes.
+
+    Provenance (for deduplicated chunks that occur in several documents) is
+    kept as two parallel arrays: prov_rows[j] also occurs in document
+    prov_doc_ids[j]. prov_rows is sorted.
+
+    Indexing returns the same dict shape as before (plus "sources"), so
+    existing code using vectorstore["chunks"][i]["text"] / ["source"] and
+    len() keeps working.
+    """
+
+    def __init__(
+        self,
+        buffers: List[bytes],
+        doc_ids: np.ndarray,
+        offsets: np.ndarray,
+        lengths: np.ndarray,
+        source_ids: np.ndarray,
+        sources: List[str],
+        doc_source_ids: np.ndarray | None = None,
+        prov_rows: np.ndarray | None = None,
+        prov_doc_ids: np.ndarray | None = None,
+    ):
+        self.buffers = buffers
+        self.doc_ids = doc_ids
+        self.offsets = offsets
+        self.lengths = lengths
+        self.source_ids = source_ids
+        self.sources = sources
+        self.doc_source_ids = (
+            doc_source_ids if doc_source_ids is not None else np.empty(0, dtype=np.int32)
+        )
+        self.prov_rows = prov_rows if prov_rows is not None else np.empty(0, dtype=np.int32)
+        self.prov_doc_ids = (
+            prov_doc_ids if prov_doc_ids is not None else np.empty(0, dtype=np.int32)
+        )
+
+    @classmethod
+    def from_documents(
+        cls,
+        docs: List[Dict],
+        spans_per_doc: List[List[Tuple[int, int]]],
+    ) -> "ChunkTable":
+        """
+        Build a table from documents and their (char_start, char_end) chunk spans.
+
+        docs[i] needs "text" and "source"; spans_per_doc[i] are the spans
+        of docs[i] (e.g. from utils.rag.chunk_spans).
+        """
+        buffers: List[bytes] = []
+        sources: List[str] = []
+        source_index: Dict[str, int] = {}
+
+        doc_ids: List[np.ndarray] = []
+        offsets: List[np.ndarray] = []
+        lengths: List[np.ndarray] = []
+        source_ids: List[np.ndarray] = []
+        doc_source_ids: List[int] = []
+
+        for doc_id, (d, spans) in enumerate(zip(docs, spans_per_doc)):
+            encoded = d["text"].encode("utf-8")
+            buffers.append(encoded)
+
+            if d["source"] not in source_index:
+                source_index[d["source"]] = len(sources)
+                sources.append(d["source"])
+            doc_source_ids.append(source_index[d["source"]])
+
+            if not spans:
+                continue
+
+            char_spans = np.array(spans, dtype=np.int64).reshape(-1, 2)
+            prefix = _byte_offsets(d["text"], encoded)
+            if prefix is not None:
+                char_spans = prefix[char_spans]
+
+            n = len(char_spans)
+            doc_ids.append(np.full(n, doc_id, dtype=np.int32))
+            offsets.append(char_spans[:, 0])
+            lengths.append(char_spans[:, 1] - char_spans[:, 0])
+            source_ids.append(np.full(n, source_index[d["source"]], dtype=np.int64))
+
+        def _concat(parts: List[np.ndarray], dtype) -> np.ndarray:
+            if not parts:
+                return np.empty(0, dtype=dtype)
+            return np.concatenate(parts).astype(dtype)
+
+        return cls(
+            buffers=buffers,
+            doc_ids=_concat(doc_ids, np.int32),
+            offsets=_concat(offsets, np.int64),
+            lengths=_concat(lengths, np.int32),
+            source_ids=_concat(source_ids, np.min_scalar_type(max(0, len(sources) - 1))),
+            sources=sources,
+            doc_source_ids=np.array(doc_source_ids, dtype=np.int32),
+        )
+
+    def take(
+        self,
+        rows: np.ndarray,
+        prov_rows: np.ndarray | None = None,
+        prov_doc_ids: np.ndarray | None = None,
+    ) -> "ChunkTable":
+        """
+        New table with only the given rows (buffers are shared, not copied).
+
+        prov_rows / prov_doc_ids (row numbers in the new table) record extra
+        documents each kept row also occurs in.
+        """
+        rows = np.asarray(rows, dtype=np.int64)
+        if prov_rows is not None and len(prov_rows):
+            order = np.argsort(prov_rows, kind="stable")
+            prov_rows = np.asarray(prov_rows, dtype=np.int32)[order]
+            prov_doc_ids = np.asarray(prov_doc_ids, dtype=np.int32)[order]
+        else:
+            prov_rows = prov_doc_ids = None
+
+        return ChunkTable(
+            buffers=self.buffers,
+            doc_ids=self.doc_ids[rows],
+            offsets=self.offsets[rows],
+            lengths=self.lengths[rows],
+            source_ids=self.source_ids[rows],
+            sources=self.sources,
+            doc_source_ids=self.doc_source_ids,
+            prov_rows=prov_rows,
+            prov_doc_ids=prov_doc_ids,
+        )
+
+    def __len__(self) -> int:
+        return len(self.offsets)
+
+    def view(self, i: int) -> memoryview:
+        """
+        Zero-copy view of chunk i's UTF-8 bytes.
+        """
+        start = int(self.offsets[i])
+        return memoryview(self.buffers[int(self.doc_ids[i])])[
+            start : start + int(self.lengths[i])
+        ]
+
+    def text(self, i: int) -> str:
+        return str(self.view(i), "utf-8")
+
+    def source(self, i: int) -> str:
+        return self.sources[int(self.source_ids[i])]
+
+    def extra_doc_ids(self, i: int) -> np.ndarray:
+        """
+        Other documents chunk i also occurs in (deduplication provenance).
+        """
+        lo = np.searchsorted(self.prov_rows, i, side="left")
+        hi = np.searchsorted(self.prov_rows, i, side="right")
+        return self.prov_doc_ids[lo:hi]
+
+    def all_sources(self, i: int) -> List[str]:
+        """
+        Primary source first, then any other sources of duplicate copies.
+        """
+        names = [self.source(i)]
+        for doc_id in self.extra_doc_ids(i):
+            name = self.sources[int(self.doc_source_ids[doc_id])]
+            if name not in names:
+                names.append(name)
+        return names
+
+    def __getitem__(self, i: int) -> Dict:
+        if i < 0:
+            i += len(self)
+        if not 0 <= i < len(self):
+            raise IndexError("chunk index out of range")
+        return {"text": self.text(i), "source": self.source(i), "sources": self.all_sources(i)}
+
+    def __iter__(self) -> Iterator[Dict]:
+        for i in range(len(self)):
+            yield self[i]
+
+    def texts(self) -> List[str]:
+        """
+        Materialize all chunk texts (e.g. for embedding).
+        """
+        return [self.text(i) for i in range(len(self))]
+
+    def nbytes(self) -> int:
+        """
+        Approximate memory held by this table.
+        """
+        total = sum(sys.getsizeof(b) for b in self.buffers)
+        total += sum(sys.getsizeof(s) for s in self.sources)
+        total += sys.getsizeof(self.buffers) + sys.getsizeof(self.sources)
+        for arr in (
+            self.doc_ids,
+            self.offsets,
+            self.lengths,
+            self.source_ids,
+            self.doc_source_ids,
+            self.prov_rows,
+            self.prov_doc_ids,
+        ):
+            total += arr.nbytes
+        return total
+
+
+def chunk_memory_report(table: ChunkTable) -> Dict:
+    """
+    Compare the ChunkTable's memory with the equivalent list of
+    {"text", "source"} dicts (one str per chunk, sources shared per doc).
+
+    The list layout is measured one row at a time, without building it.
+    """
+    n = len(table)
+    dict_overhead = sys.getsizeof({"text": "", "source": ""})
+
+    list_bytes = sys.getsizeof([None] * n)  # the list's pointer array
+    list_bytes += sum(sys.getsizeof(s) for s in table.sources)
+    for i in range(n):
+        list_bytes += dict_overhead + sys.getsizeof(table.text(i))
+
+    table_bytes = table.nbytes()
+    return {
+        "num_chunks": n,
+        "list_of_dicts_bytes": list_bytes,
+        "chunk_table_bytes": table_bytes,
+        "saved_bytes": list_bytes - table_bytes,
+        "ratio": list_bytes / table_bytes if table_bytes else 0.0,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Chunk memory: ChunkTable vs list of dicts.")
+    parser.add_argument("--docs-dir", default=os.path.join("data", "docs"))
+    parser.add_argument("--chunking", help="fixed or cdc (default: CHUNKING setting)")
+    args = parser.parse_args()
+
+    from utils.rag import document_spans, load_documents
+
+    docs = load_documents(args.docs_dir)
+    table = ChunkTable.from_documents(
+        docs, [document_spans(d["text"], args.chunking) for d in docs]
+    )
+    report = chunk_memory_report(table)
+    print(
+        f"{len(docs)} documents, {report['num_chunks']} chunks\n"
+        f"Chunk memory: {report['chunk_table_bytes']} bytes "
+        f"(list of dicts would be {report['list_of_dicts_bytes']} bytes, "
+        f"{report['ratio']:.1f}x)"
+    )
+
+
+if __name__ == "__main__":
+    main()
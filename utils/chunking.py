@@ -0,0 +1,250 @@
+# utils/chunking.py
+"""
+Content-defined chunking, and a report of how many chunks survive edits.
+
+Fixed-offset chunks shift after an insertion near the top of a document,
+so every later chunk changes. Content-defined boundaries depend only on
+the text around them, so after a local edit the chunks away from it are
+byte-identical and their embeddings can be reused (see
+utils.rag.embed_document_segments).
+
+Usage:
+    python -m utils.chunking                      # synthetic documents
+    python -m utils.chunking --docs-dir data/docs
+    python -m utils.chunking --old v1.txt --new v2.txt
+"""
+
+from typing import Callable, Dict, List, Tuple
+import argparse
+import hashlib
+import os
+import random
+import re
+
+import numpy as np
+
+
+# Chunks are MIN_CHUNK_CHARS..MAX_CHUNK_CHARS long and end at a sentence or
+# paragraph break. Past MIN_CHUNK_CHARS, a chunk ends at the first paragraph
+# break, or at the first sentence break whose window hash is divisible by
+# BREAK_DIVISOR (on average every BREAK_DIVISOR-th sentence). A minimum well
+# below the typical distance between such breaks lets boundaries shifted by
+# an edit fall back onto the old ones within a chunk or two.
+MIN_CHUNK_CHARS = 300
+MAX_CHUNK_CHARS = 1200
+BREAK_DIVISOR = 5
+HASH_WINDOW = 32  # characters before a break that its hash depends on
+
+_rng = np.random.RandomState(7)
+_GEAR = _rng.randint(0, 2**32, size=256, dtype=np.uint64)
+_SHIFTS = np.arange(HASH_WINDOW, dtype=np.uint64)
+
+# Break after: a blank line (paragraph), a sentence end, or a line end
+_BREAK_RE = re.compile(r"\n[ \t]*\n\s*|(?<=[.!?])[\"')\]]*\s+|\n\s*")
+_WS_RE = re.compile(r"\s+")
+
+
+def chunk_key(text: str) -> bytes:
+    """
+    Exact identity of a chunk's text (embeddings are reused by this key).
+    """
+    return hashlib.blake2b(text.encode("utf-8"), digest_size=16).digest()
+
+
+def _breaks(text: str) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Positions where a chunk may end (text[start:pos]) and whether each one
+    is a paragraph break.
+    """
+    ends, paragraph = [], []
+    for m in _BREAK_RE.finditer(text):
+        if m.end() < len(text):
+            ends.append(m.end())
+            paragraph.append(m.group().count("\n") >= 2)
+    return np.array(ends, dtype=np.int64), np.array(paragraph, dtype=bool)
+
+
+def window_hashes(text: str, positions: np.ndarray) -> np.ndarray:
+    """
+    Gear hash of the HASH_WINDOW characters before each position: the
+    value a rolling hash has when it reaches that position, computed only
+    where it is needed.
+    """
+    if not len(positions):
+        return np.empty(0, dtype=np.uint64)
+    codes = np.frombuffer(text.encode("utf-32-le"), dtype=np.uint32)
+    idx = positions[:, None] - 1 - _SHIFTS.astype(np.int64)[None, :]
+    gear = _GEAR[codes[np.maximum(idx, 0)] & 0xFF]
+    gear[idx < 0] = 0
+    return (np.sum(gear << _SHIFTS, axis=1) & 0xFFFFFFFF).astype(np.uint64)
+
+
+def cdc_spans(
+    text: str,
+    min_size: int = MIN_CHUNK_CHARS,
+    max_size: int = MAX_CHUNK_CHARS,
+    divisor: int = BREAK_DIVISOR,
+) -> List[Tuple[int, int]]:
+    """
+    (start, end) spans of content-defined chunks.
+
+    Where a chunk ends depends only on nearby text, so boundaries
+    resynchronize right after an edit. If no break qualifies before
+    max_size, the chunk ends at the last break (or whitespace) in range.
+    Chunks do not overlap; they always hold whole sentences when possible.
+    """
+    spans: List[Tuple[int, int]] = []
+    n = len(text)
+    if not text:
+        return spans
+
+    ends, paragraph = _breaks(text)
+    hit = paragraph | (window_hashes(text, ends) % divisor == 0)
+    cut_ends = ends[hit]
+
+    start = 0
+    while start < n:
+        lo, hi = start + min_size, min(start + max_size, n)
+        if lo >= n:
+            spans.append((start, n))
+            break
+
+        i = np.searchsorted(cut_ends, lo)
+        if i < len(cut_ends) and cut_ends[i] <= hi:
+            end = int(cut_ends[i])
+        elif hi == n:
+            end = n
+        else:
+            j = np.searchsorted(ends, hi, side="right") - 1
+            if j >= 0 and ends[j] >= lo:
+                end = int(ends[j])
+            else:
+                ws = [m.end() for m in _WS_RE.finditer(text, lo, hi)]
+                end = ws[-1] if ws else hi
+
+        # Don't leave a runt tail that could have been part of this chunk
+        if n - end < min_size and n - start <= max_size:
+            end = n
+        spans.append((start, end))
+        start = end
+
+    return spans
+
+
+def reuse_rate(
+    old_text: str,
+    new_text: str,
+    spans_fn: Callable[[str], List[Tuple[int, int]]],
+) -> Dict:
+    """
+    How many chunks of new_text already existed (byte-identical) in old_text.
+    """
+    old_keys = {chunk_key(old_text[s:e]) for s, e in spans_fn(old_text)}
+    new_keys = [chunk_key(new_text[s:e]) for s, e in spans_fn(new_text)]
+    reused = sum(k in old_keys for k in new_keys)
+    return {
+        "chunks": len(new_keys),
+        "reused": reused,
+        "reembedded": len(new_keys) - reused,
+        "reuse_rate": reused / len(new_keys) if new_keys else 1.0,
+    }
+
+
+def _synthetic_document(rng: random.Random, sentences: int = 120) -> str:
+    words = (
+        "account password billing invoice plan upgrade export data api key token "
+        "request limit error support team refund policy annual monthly user admin "
+        "settings dashboard report email notification integration webhook"
+    ).split()
+    paragraphs, paragraph = [], []
+    for _ in range(sentences):
+        n = rng.randint(8, 20)
+        sentence = " ".join(rng.choice(words) for _ in range(n))
+        paragraph.append(sentence.capitalize() + ".")
+        if rng.random() < 0.15:
+            paragraphs.append(" ".join(paragraph))
+            paragraph = []
+    paragraphs.append(" ".join(paragraph))
+    return "\n\n".join(p for p in paragraphs if p)
+
+
+def _edits(text: str, rng: random.Random) -> Dict[str, str]:
+    """
+    Typical local edits of a document.
+    """
+    sentence = "This sentence was added in a later revision of the document. "
+    top = text.find(". ") + 2 if ". " in text else 0
+    middle = len(text) // 2
+    middle = text.find(". ", middle) + 2 if ". " in text[middle:] else middle
+    para = text.find("\n\n")
+    word = rng.randrange(len(text)) if text else 0
+    word = text.find(" ", word) + 1 if " " in text[word:] else 0
+    return {
+        "insert near top": text[:top] + sentence + text[top:],
+        "insert in middle": text[:middle] + sentence + text[middle:],
+        "delete first paragraph": text[para + 2 :] if para >= 0 else text,
+        "change one word": text[:word] + "changed " + text[word:],
+        "append at end": text + "\n\n" + sentence.strip(),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Chunk reuse after edits: fixed vs content-defined.")
+    parser.add_argument("--docs-dir", help="use these .txt documents instead of synthetic ones")
+    parser.add_argument("--old", help="old version of one document (with --new)")
+    parser.add_argument("--new", help="new version of one document (with --old)")
+    parser.add_argument("--synthetic", type=int, default=20, help="number of synthetic documents")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    from utils.rag import chunk_spans
+
+    chunkers = {"fixed": chunk_spans, "cdc": cdc_spans}
+    rng = random.Random(args.seed)
+
+    if args.old and args.new:
+        with open(args.old, "r", encoding="utf-8") as f:
+            old = f.read()
+        with open(args.new, "r", encoding="utf-8") as f:
+            new = f.read()
+        for name, fn in chunkers.items():
+            r = reuse_rate(old, new, fn)
+            print(f"{name:<6} {r['reused']}/{r['chunks']} chunks reused ({r['reuse_rate']:.1%})")
+        return
+
+    if args.docs_dir:
+        texts = []
+        for fname in sorted(os.listdir(args.docs_dir)):
+            if fname.lower().endswith(".txt"):
+                with open(os.path.join(args.docs_dir, fname), "r", encoding="utf-8") as f:
+                    texts.append(f.read())
+    else:
+        texts = [_synthetic_document(rng) for _ in range(args.synthetic)]
+
+    totals: Dict[Tuple[str, str], List[int]] = {}
+    edit_names: List[str] = []
+    for text in texts:
+        for edit, new in _edits(text, rng).items():
+            if edit not in edit_names:
+                edit_names.append(edit)
+            for name, fn in chunkers.items():
+                r = reuse_rate(text, new, fn)
+                t = totals.setdefault((edit, name), [0, 0])
+                t[0] += r["reused"]
+                t[1] += r["chunks"]
+
+    sizes = {name: [e - s for t in texts for s, e in fn(t)] for name, fn in chunkers.items()}
+    print(f"{len(texts)} documents")
+    for name, lengths in sizes.items():
+        print(f"  {name:<6} {len(lengths)} chunks, mean {np.mean(lengths):.0f} chars")
+    print(f"\n{'edit':<24}{'fixed reuse':>13}{'cdc reuse':>13}")
+    for edit in edit_names:
+        rates = []
+        for name in chunkers:
+            reused, chunks = totals.get((edit, name), [0, 0])
+            rates.append(reused / chunks if chunks else 1.0)
+        print(f"{edit:<24}{rates[0]:>13.1%}{rates[1]:>13.1%}")
+
+
+if __name__ == "__main__":
+    main()
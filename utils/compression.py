@@ -0,0 +1,109 @@
+# utils/compression.py
+
+from typing import Dict, List, Tuple
+import re
+import time
+
+import numpy as np
+
+from utils.accounting import CHARS_PER_TOKEN
+
+
+# Per chunk: keep the best TOP_SENTENCES sentences and NEIGHBOURS sentences
+# on each side of them. Chunks shorter than MIN_CHUNK_CHARS are kept whole.
+TOP_SENTENCES = 2
+NEIGHBOURS = 1
+MIN_CHUNK_CHARS = 200
+GAP_MARKER = "…"
+
+_SENTENCE_RE = re.compile(r"(?<=[.!?])\s+|\n\s*\n|\n(?=\s*(?:[-*•]|\d+[.)])\s)")
+
+
+def split_sentences(text: str) -> List[str]:
+    """
+    Split text on sentence ends, blank lines and list items.
+    """
+    return [s.strip() for s in _SENTENCE_RE.split(text) if s and s.strip()]
+
+
+def select_sentences(
+    scores: np.ndarray,
+    top_sentences: int = TOP_SENTENCES,
+    neighbours: int = NEIGHBOURS,
+) -> List[int]:
+    """
+    Sorted indices of the best-scoring sentences plus their neighbours.
+    """
+    keep = set()
+    for i in np.argsort(-scores)[:top_sentences]:
+        keep.update(range(max(0, i - neighbours), min(len(scores), i + neighbours + 1)))
+    return sorted(keep)
+
+
+def compress_chunks(
+    query_vec: np.ndarray,
+    rag_results: List[Dict],
+    embed_client,
+    top_sentences: int = TOP_SENTENCES,
+    neighbours: int = NEIGHBOURS,
+) -> Tuple[List[Dict], Dict]:
+    """
+    Query-aware extractive compression of retrieved chunks.
+
+    Sentences of all chunks are embedded in one batch and scored against
+    the (already computed) query vector; each chunk keeps only its best
+    sentences and their neighbours, in original order, with GAP_MARKER
+    where text was dropped. No LLM call is involved.
+
+    Returns (compressed results, report).
+    """
+    start = time.perf_counter()
+    chars_before = sum(len(r["text"]) for r in rag_results)
+
+    # Only chunks with more sentences than would be kept are worth scoring
+    keep_max = top_sentences * (2 * neighbours + 1)
+    split: List[List[str]] = []
+    for r in rag_results:
+        sentences = split_sentences(r["text"]) if len(r["text"]) >= MIN_CHUNK_CHARS else []
+        split.append(sentences if len(sentences) > keep_max else [])
+
+    flat = [s for sentences in split for s in sentences]
+    compressed: List[Dict] = [dict(r) for r in rag_results]
+    kept_total = 0
+
+    if flat:
+        vectors = np.array(embed_client.embed_documents(flat), dtype="float32")
+        q = np.asarray(query_vec, dtype="float32")
+        scores = vectors @ q / (
+            (np.linalg.norm(vectors, axis=1) + 1e-8) * (np.linalg.norm(q) + 1e-8)
+        )
+
+        offset = 0
+        for result, sentences in zip(compressed, split):
+            if not sentences:
+                continue
+            chunk_scores = scores[offset : offset + len(sentences)]
+            offset += len(sentences)
+
+            keep = select_sentences(chunk_scores, top_sentences, neighbours)
+            kept_total += len(keep)
+            parts: List[str] = []
+            for j, i in enumerate(keep):
+                if j and i != keep[j - 1] + 1:
+                    parts.append(GAP_MARKER)
+                parts.append(sentences[i])
+            result["text"] = " ".join(parts)
+
+    chars_after = sum(len(r["text"]) for r in compressed)
+    report = {
+        "chunks": len(rag_results),
+        "sentences_scored": len(flat),
+        "sentences_kept": kept_total,
+        "chars_before": chars_before,
+        "chars_after": chars_after,
+        "est_tokens_before": chars_before // CHARS_PER_TOKEN,
+        "est_tokens_after": chars_after // CHARS_PER_TOKEN,
+        "reduction": 1 - chars_after / chars_before if chars_before else 0.0,
+        "ms": (time.perf_counter() - start) * 1000,
+    }
+    return compressed, report
@@ -0,0 +1,66 @@
+# utils/deadline.py
+
+import time
+
+
+# How a request's remaining budget is spent. Web search gets a share of
+# what is left after retrieval; the LLM gets everything that remains.
+WEB_SEARCH_SHARE = 0.3
+MIN_WEB_SEARCH_MS = 300.0   # a smaller slice is not worth starting a call
+LOW_BUDGET_MS = 2000.0      # below this at the start, retrieve fewer chunks
+CONTEXT_CHARS_PER_MS = 2.0  # prompt size allowed per ms left for the LLM
+MIN_CONTEXT_CHARS = 800
+
+
+class DeadlineExceeded(TimeoutError):
+    pass
+
+
+class Deadline:
+    """
+    Absolute time budget for one request.
+
+    start defaults to now; pass an earlier perf_counter() value (e.g. the
+    request's arrival time) so that queueing counts against the budget.
+    """
+
+    def __init__(self, budget_ms: float, start: float | None = None):
+        self.budget_ms = float(budget_ms)
+        self.start = time.perf_counter() if start is None else start
+        self.expires_at = self.start + self.budget_ms / 1000
+
+    @classmethod
+    def coerce(cls, value) -> "Deadline | None":
+        """
+        None / 0 -> no deadline, a number -> budget in ms from now,
+        a Deadline -> itself.
+        """
+        if value is None or isinstance(value, Deadline):
+            return value
+        return cls(value) if value > 0 else None
+
+    def remaining_ms(self) -> float:
+        return max(0.0, (self.expires_at - time.perf_counter()) * 1000)
+
+    def elapsed_ms(self) -> float:
+        return (time.perf_counter() - self.start) * 1000
+
+    @property
+    def expired(self) -> bool:
+        return self.remaining_ms() <= 0
+
+    def slice_ms(self, share: float) -> float:
+        """
+        A stage's share of the time that is left.
+        """
+        return self.remaining_ms() * share
+
+
+def is_timeout(error: Exception) -> bool:
+    """
+    Whether error is a timeout: stages pass their share of the budget to
+    the client as its request timeout (so a slow call is cut off rather
+    than left running), and clients report it with their own exception
+    types (TimeoutError, httpx / requests / provider SDK *Timeout*).
+    """
+    return isinstance(error, TimeoutError) or "Timeout" in type(error).__name__
@@ -0,0 +1,176 @@
+# utils/dedup.py
+"""
+Exact and near-duplicate chunk detection (hashing and MinHash/LSH), and a
+report of the duplicates in a docs directory.
+
+Usage:
+    python -m utils.dedup                         # data/docs, CHUNKING setting
+    python -m utils.dedup --docs-dir data/docs --chunking fixed --dim 384
+"""
+
+from typing import Dict, List, Tuple
+import argparse
+import hashlib
+import os
+import re
+import zlib
+
+import numpy as np
+
+
+# MinHash / LSH parameters. With 16 bands of 8 rows, pairs above ~0.7
+# Jaccard similarity almost always share a bucket; they are then verified
+# against NEAR_DUP_THRESHOLD on the full signature.
+NUM_PERM = 128
+NUM_BANDS = 16
+NEAR_DUP_THRESHOLD = 0.85
+SHINGLE_WORDS = 3
+
+_MERSENNE_PRIME = (1 << 31) - 1
+_rng = np.random.RandomState(42)
+_PERM_A = _rng.randint(1, _MERSENNE_PRIME, size=NUM_PERM).astype(np.int64)
+_PERM_B = _rng.randint(0, _MERSENNE_PRIME, size=NUM_PERM).astype(np.int64)
+
+_WS_RE = re.compile(r"\s+")
+
+
+def normalize_text(text: str) -> str:
+    """
+    Lowercase and collapse whitespace, so formatting-only differences
+    count as exact duplicates.
+    """
+    return _WS_RE.sub(" ", text.lower()).strip()
+
+
+def exact_hash(text: str) -> bytes:
+    return hashlib.sha1(normalize_text(text).encode("utf-8")).digest()
+
+
+def minhash_signature(text: str) -> np.ndarray:
+    """
+    MinHash signature (NUM_PERM int64 values) over word shingles.
+    """
+    words = normalize_text(text).split(" ")
+    if len(words) >= SHINGLE_WORDS:
+        shingles = {
+            " ".join(words[i : i + SHINGLE_WORDS])
+            for i in range(len(words) - SHINGLE_WORDS + 1)
+        }
+    else:
+        shingles = set(words)
+
+    x = np.fromiter(
+        (zlib.crc32(s.encode("utf-8")) % _MERSENNE_PRIME for s in shingles),
+        dtype=np.int64,
+        count=len(shingles),
+    )
+    return ((_PERM_A[:, None] * x[None, :] + _PERM_B[:, None]) % _MERSENNE_PRIME).min(axis=1)
+
+
+def chunk_fingerprints(texts: List[str]) -> Tuple[List[bytes], np.ndarray]:
+    """
+    Exact hashes and MinHash signatures [len(texts), NUM_PERM] for texts.
+    """
+    hashes = [exact_hash(t) for t in texts]
+    if not texts:
+        return hashes, np.empty((0, NUM_PERM), dtype=np.int64)
+    return hashes, np.vstack([minhash_signature(t) for t in texts])
+
+
+def find_duplicates(
+    hashes: List[bytes],
+    signatures: np.ndarray,
+    threshold: float = NEAR_DUP_THRESHOLD,
+) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Cluster exact and near-duplicate chunks.
+
+    Returns (rep, is_exact):
+    - rep[i]: index of the representative (first member) of i's cluster
+    - is_exact[i]: True if i was matched to its cluster by exact hash
+    """
+    n = len(hashes)
+    parent = np.arange(n)
+
+    def find(i: int) -> int:
+        while parent[i] != i:
+            parent[i] = parent[parent[i]]
+            i = parent[i]
+        return i
+
+    def union(i: int, j: int) -> None:
+        ri, rj = find(i), find(j)
+        if ri != rj:
+            parent[max(ri, rj)] = min(ri, rj)
+
+    # 1. Exact duplicates
+    is_exact = np.zeros(n, dtype=bool)
+    first_by_hash: Dict[bytes, int] = {}
+    for i, h in enumerate(hashes):
+        if h in first_by_hash:
+            union(first_by_hash[h], i)
+            is_exact[i] = True
+        else:
+            first_by_hash[h] = i
+
+    # 2. Near duplicates via LSH banding (only exact-unique rows)
+    unique_rows = np.flatnonzero(~is_exact)
+    rows_per_band = NUM_PERM // NUM_BANDS
+    for band in range(NUM_BANDS):
+        cols = slice(band * rows_per_band, (band + 1) * rows_per_band)
+        buckets: Dict[bytes, List[int]] = {}
+        for i in unique_rows:
+            buckets.setdefault(signatures[i, cols].tobytes(), []).append(int(i))
+
+        for members in buckets.values():
+            for j in members[1:]:
+                i = members[0]
+                if find(i) == find(j):
+                    continue
+                if np.mean(signatures[i] == signatures[j]) >= threshold:
+                    union(i, j)
+
+    rep = np.array([find(i) for i in range(n)], dtype=np.int64)
+    return rep, is_exact
+
+
+def dedup_report(rep: np.ndarray, is_exact: np.ndarray) -> Dict:
+    """
+    Counts of exact / near duplicates for a find_duplicates result.
+    """
+    duplicates = rep != np.arange(len(rep))
+    return {
+        "chunks_total": int(len(rep)),
+        "chunks_unique": int(len(rep) - duplicates.sum()),
+        "exact_duplicates": int((duplicates & is_exact).sum()),
+        "near_duplicates": int((duplicates & ~is_exact).sum()),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Duplicate chunks in a docs directory.")
+    parser.add_argument("--docs-dir", default=os.path.join("data", "docs"))
+    parser.add_argument("--chunking", help="fixed or cdc (default: CHUNKING setting)")
+    parser.add_argument("--dim", type=int, default=384, help="embedding dims, for the bytes saved")
+    args = parser.parse_args()
+
+    from utils.rag import document_spans, load_documents
+
+    docs = load_documents(args.docs_dir)
+    texts = [
+        d["text"][start:end]
+        for d in docs
+        for start, end in document_spans(d["text"], args.chunking)
+    ]
+    hashes, signatures = chunk_fingerprints(texts)
+    report = dedup_report(*find_duplicates(hashes, signatures))
+    dropped = report["chunks_total"] - report["chunks_unique"]
+    print(
+        f"Dedup: {report['chunks_unique']}/{report['chunks_total']} chunks kept "
+        f"({report['exact_duplicates']} exact, {report['near_duplicates']} near duplicates), "
+        f"{dropped * args.dim * 4} matrix bytes saved at {args.dim} float32 dims"
+    )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,421 @@
+# utils/evaluation.py
+"""
+Retrieval quality-versus-speed evaluation.
+
+Runs labelled queries (query -> relevant sources) through several retrieval
+configurations (exact, approximate IVF, reduced-dimension, two-stage, int8
+and hybrid) and reports recall@k, MRR and nDCG@k next to p50/p99 search
+latency and index memory, marking the Pareto-optimal configurations.
+
+Usage:
+    python -m utils.evaluation                      # queries generated from FAQ questions
+    python -m utils.evaluation --queries labelled.jsonl --k 5 --dims 32,64,128
+    python -m utils.evaluation --nlist 64 --nprobe 1,4,16
+    python -m utils.evaluation --fake-embeddings    # offline, no torch
+
+Labelled JSONL lines: {"query": "...", "relevant": ["pricing.txt", ...]}
+"""
+
+from typing import Callable, Dict, List, Tuple
+import argparse
+import json
+import math
+import os
+import re
+import time
+
+import numpy as np
+
+from utils.index_manager import index_build_kwargs
+from utils.projection import fit_projection, project, two_stage_search
+from utils.rag import build_knowledge_base, cosine_similarity_matrix
+
+
+SearchFn = Callable[[np.ndarray, str, int], Tuple[np.ndarray, np.ndarray]]
+
+_TOKEN_RE = re.compile(r"\w+")
+
+# Rows of int8 codes widened to float32 at a time by the quantized search
+QUANTIZED_BLOCK_ROWS = 4096
+
+
+def load_labelled_queries(path: str) -> List[Dict]:
+    """
+    Read {"query": ..., "relevant": [...]} (or "source": ...) JSONL lines.
+    """
+    queries: List[Dict] = []
+    with open(path, "r", encoding="utf-8") as f:
+        for line in f:
+            line = line.strip()
+            if not line:
+                continue
+            item = json.loads(line)
+            relevant = item.get("relevant") or [item.get("source")]
+            queries.append({"query": item["query"], "relevant": [r for r in relevant if r]})
+    return queries
+
+
+def generate_faq_queries(docs_dir: str) -> List[Dict]:
+    """
+    Use every line ending in '?' in the docs as a query whose relevant
+    source is the file it came from.
+    """
+    queries: List[Dict] = []
+    for fname in sorted(os.listdir(docs_dir)):
+        if not fname.lower().endswith(".txt"):
+            continue
+        with open(os.path.join(docs_dir, fname), "r", encoding="utf-8") as f:
+            for line in f:
+                line = line.strip()
+                if line.endswith("?"):
+                    queries.append({"query": line, "relevant": [fname]})
+    return queries
+
+
+def _top_k(sims: np.ndarray, k: int) -> Tuple[np.ndarray, np.ndarray]:
+    idx = np.argsort(-sims)[:k]
+    return idx, sims[idx]
+
+
+# ---------------------------------------------------------------------------
+# Retrieval configurations. Each returns (search_fn, index_bytes).
+# ---------------------------------------------------------------------------
+
+
+def exact_config(vectorstore: Dict) -> Tuple[SearchFn, int]:
+    _, matrix = vectorstore["store"].vectors()
+
+    def search(q_vec, query, k):
+        return _top_k(cosine_similarity_matrix(q_vec, matrix), k)
+
+    return search, matrix.nbytes
+
+
+def reduced_config(vectorstore: Dict, dims: int, rescore: bool) -> Tuple[SearchFn, int]:
+    """
+    rescore=False: approximate search on the reduced vectors only.
+    rescore=True: two-stage search (coarse pass + exact rescoring).
+    """
+    _, matrix = vectorstore["store"].vectors()
+    projection = fit_projection(matrix, dims)
+    reduced = projection["reduced"]
+    norms = projection["reduced_norms"]
+
+    if rescore:
+
+        def search(q_vec, query, k):
+            return two_stage_search(q_vec, matrix, projection, k)
+
+        return search, matrix.nbytes + reduced.nbytes
+
+    def search(q_vec, query, k):
+        q_red = project(projection, q_vec)
+        return _top_k(reduced @ q_red / (norms * (np.linalg.norm(q_red) + 1e-8)), k)
+
+    return search, reduced.nbytes
+
+
+def quantized_config(vectorstore: Dict) -> Tuple[SearchFn, int]:
+    """
+    int8 scalar quantization with one float scale per row (4x smaller).
+
+    Only the codes are kept: NumPy has no int8 matmul, so each search
+    widens QUANTIZED_BLOCK_ROWS rows at a time to float32 and scores them
+    (cosine ignores the per-row scale). index_bytes counts the codes,
+    scales and norms the search holds.
+    """
+    _, matrix = vectorstore["store"].vectors()
+    scales = (np.abs(matrix).max(axis=1) / 127.0 + 1e-12).astype(np.float32)
+    codes = np.round(matrix / scales[:, None]).astype(np.int8)
+    norms = np.sqrt((codes.astype(np.int32) ** 2).sum(axis=1)).astype(np.float32) + 1e-8
+
+    def search(q_vec, query, k):
+        q = np.asarray(q_vec, dtype=np.float32)
+        dots = np.empty(len(codes), dtype=np.float32)
+        for start in range(0, len(codes), QUANTIZED_BLOCK_ROWS):
+            block = codes[start : start + QUANTIZED_BLOCK_ROWS]
+            dots[start : start + len(block)] = block.astype(np.float32) @ q
+        return _top_k(dots / (norms * (np.linalg.norm(q) + 1e-8)), k)
+
+    return search, codes.nbytes + scales.nbytes + norms.nbytes
+
+
+def _spherical_kmeans(vectors: np.ndarray, nlist: int, iters: int = 10, seed: int = 0) -> np.ndarray:
+    """
+    nlist unit-norm centroids of unit-norm rows (k-means on cosine).
+    """
+    rng = np.random.RandomState(seed)
+    centroids = vectors[rng.choice(len(vectors), nlist, replace=False)].copy()
+    for _ in range(iters):
+        assign = np.argmax(vectors @ centroids.T, axis=1)
+        sums = np.zeros_like(centroids)
+        np.add.at(sums, assign, vectors)
+        empty = ~np.isin(np.arange(nlist), assign)
+        sums[empty] = vectors[rng.choice(len(vectors), int(empty.sum()))]
+        centroids = sums / (np.linalg.norm(sums, axis=1, keepdims=True) + 1e-8)
+    return centroids
+
+
+def ivf_config(vectorstore: Dict, nlist: int, nprobe: int) -> Tuple[SearchFn, int]:
+    """
+    Approximate nearest-neighbour search with an inverted file: rows are
+    clustered around nlist k-means centroids, and a query scores only the
+    rows of its nprobe closest clusters (stored contiguously per cluster).
+    """
+    _, matrix = vectorstore["store"].vectors()
+    normed = matrix / (np.linalg.norm(matrix, axis=1, keepdims=True) + 1e-8)
+    nlist = max(1, min(nlist, len(normed)))
+    nprobe = max(1, min(nprobe, nlist))
+    centroids = _spherical_kmeans(normed, nlist)
+
+    assign = np.argmax(normed @ centroids.T, axis=1)
+    order = np.argsort(assign, kind="stable")
+    bounds = np.searchsorted(assign[order], np.arange(nlist + 1))
+    lists = np.ascontiguousarray(normed[order])
+
+    def search(q_vec, query, k):
+        q = np.asarray(q_vec, dtype=np.float32)
+        q = q / (np.linalg.norm(q) + 1e-8)
+        probe = np.argsort(-(centroids @ q))[:nprobe]
+        rows = np.concatenate([np.arange(bounds[c], bounds[c + 1]) for c in probe])
+        idx, scores = _top_k(lists[rows] @ q, k)
+        return order[rows[idx]], scores
+
+    return search, lists.nbytes + centroids.nbytes + order.nbytes + bounds.nbytes
+
+
+def hybrid_config(vectorstore: Dict, alpha: float = 0.7) -> Tuple[SearchFn, int]:
+    """
+    alpha * dense cosine + (1 - alpha) * normalized BM25 over chunk texts.
+    """
+    _, matrix = vectorstore["store"].vectors()
+    chunks = vectorstore["chunks"]
+    k1, b = 1.5, 0.75
+
+    doc_tfs: List[Dict[str, int]] = []
+    df: Dict[str, int] = {}
+    for i in range(len(chunks)):
+        tf: Dict[str, int] = {}
+        for tok in _TOKEN_RE.findall(chunks[i]["text"].lower()):
+            tf[tok] = tf.get(tok, 0) + 1
+        doc_tfs.append(tf)
+        for tok in tf:
+            df[tok] = df.get(tok, 0) + 1
+
+    doc_lens = np.array([sum(tf.values()) for tf in doc_tfs], dtype=np.float32)
+    avg_len = float(doc_lens.mean()) if len(doc_lens) else 0.0
+    n = len(doc_tfs)
+
+    def bm25(query: str) -> np.ndarray:
+        scores = np.zeros(n, dtype=np.float32)
+        for tok in set(_TOKEN_RE.findall(query.lower())):
+            if tok not in df:
+                continue
+            idf = math.log(1 + (n - df[tok] + 0.5) / (df[tok] + 0.5))
+            for i, tf in enumerate(doc_tfs):
+                f = tf.get(tok, 0)
+                if f:
+                    scores[i] += idf * f * (k1 + 1) / (f + k1 * (1 - b + b * doc_lens[i] / avg_len))
+        return scores
+
+    def search(q_vec, query, k):
+        dense = cosine_similarity_matrix(q_vec, matrix)
+        lexical = bm25(query)
+        if lexical.max() > 0:
+            lexical = lexical / lexical.max()
+        return _top_k(alpha * dense + (1 - alpha) * lexical, k)
+
+    index_bytes = matrix.nbytes + sum(len(tf) for tf in doc_tfs) * 16
+    return search, index_bytes
+
+
+def build_configs(
+    vectorstore: Dict,
+    dims_list: List[int],
+    nprobe_list: List[int] | None = None,
+    nlist: int = 0,
+) -> Dict[str, Tuple[SearchFn, int]]:
+    """
+    nlist = 0 picks about sqrt(number of chunks) IVF clusters.
+    """
+    configs = {
+        "exact": exact_config(vectorstore),
+        "quantized-int8": quantized_config(vectorstore),
+        "hybrid-bm25": hybrid_config(vectorstore),
+    }
+    nlist = nlist or max(1, int(round(math.sqrt(len(vectorstore["chunks"])))))
+    for nprobe in nprobe_list or [1, 4]:
+        if nprobe <= nlist:
+            configs[f"ivf{nlist}-probe{nprobe}"] = ivf_config(vectorstore, nlist, nprobe)
+    for dims in dims_list:
+        configs[f"reduced-pca{dims}"] = reduced_config(vectorstore, dims, rescore=False)
+        configs[f"two-stage-pca{dims}"] = reduced_config(vectorstore, dims, rescore=True)
+    return configs
+
+
+# ---------------------------------------------------------------------------
+# Metrics
+# ---------------------------------------------------------------------------
+
+
+def ranking_metrics(
+    result_sources: List[set], relevant: set, num_relevant_chunks: int, k: int
+) -> Dict[str, float]:
+    """
+    Metrics for one ranked result list.
+
+    result_sources[i]: sources of the i-th retrieved chunk.
+    - recall@k: fraction of relevant sources present in the top k
+    - MRR: 1 / rank of the first chunk from a relevant source
+    - nDCG@k: binary relevance per chunk
+    """
+    result_sources = result_sources[:k]
+    rels = [int(bool(relevant & s)) for s in result_sources]
+    found = set().union(*result_sources) & relevant if result_sources else set()
+
+    first = next((i for i, r in enumerate(rels) if r), None)
+    dcg = sum(r / math.log2(i + 2) for i, r in enumerate(rels))
+    ideal = sum(1 / math.log2(i + 2) for i in range(min(k, num_relevant_chunks)))
+    return {
+        "recall": len(found) / len(relevant) if relevant else 0.0,
+        "mrr": 1.0 / (first + 1) if first is not None else 0.0,
+        "ndcg": dcg / ideal if ideal else 0.0,
+    }
+
+
+def evaluate(
+    vectorstore: Dict,
+    query_vecs: np.ndarray,
+    queries: List[Dict],
+    configs: Dict[str, Tuple[SearchFn, int]],
+    k: int = 5,
+) -> List[Dict]:
+    """
+    Run every configuration over every query and collect metrics.
+    Latency covers the search only (the query embedding is shared).
+    """
+    chunks = vectorstore["chunks"]
+    all_sources = [set(chunks[i]["sources"]) for i in range(len(chunks))]
+
+    rows: List[Dict] = []
+    for name, (search, index_bytes) in configs.items():
+        totals = {"recall": 0.0, "mrr": 0.0, "ndcg": 0.0}
+        latencies: List[float] = []
+
+        for q_vec, q in zip(query_vecs, queries):
+            relevant = set(q["relevant"])
+            start = time.perf_counter()
+            idx, _ = search(q_vec, q["query"], k)
+            latencies.append((time.perf_counter() - start) * 1000)
+
+            num_relevant = sum(1 for s in all_sources if relevant & s)
+            for metric, value in ranking_metrics(
+                [all_sources[int(i)] for i in idx], relevant, num_relevant, k
+            ).items():
+                totals[metric] += value
+
+        n = max(1, len(queries))
+        rows.append(
+            {
+                "config": name,
+                f"recall@{k}": totals["recall"] / n,
+                "mrr": totals["mrr"] / n,
+                f"ndcg@{k}": totals["ndcg"] / n,
+                "p50_ms": float(np.percentile(latencies, 50)) if latencies else 0.0,
+                "p99_ms": float(np.percentile(latencies, 99)) if latencies else 0.0,
+                "index_bytes": index_bytes,
+            }
+        )
+
+    mark_pareto(rows, quality_key=f"recall@{k}")
+    return rows
+
+
+def mark_pareto(rows: List[Dict], quality_key: str) -> None:
+    """
+    Set row["pareto"] = True for configurations not dominated on
+    (quality higher, p50 latency lower, memory lower).
+    """
+
+    def dominates(a: Dict, b: Dict) -> bool:
+        no_worse = (
+            a[quality_key] >= b[quality_key]
+            and a["p50_ms"] <= b["p50_ms"]
+            and a["index_bytes"] <= b["index_bytes"]
+        )
+        better = (
+            a[quality_key] > b[quality_key]
+            or a["p50_ms"] < b["p50_ms"]
+            or a["index_bytes"] < b["index_bytes"]
+        )
+        return no_worse and better
+
+    for row in rows:
+        row["pareto"] = not any(dominates(other, row) for other in rows if other is not row)
+
+
+def print_table(rows: List[Dict], k: int) -> None:
+    print(
+        f"{'config':<20}{'recall@' + str(k):>10}{'mrr':>8}{'ndcg@' + str(k):>9}"
+        f"{'p50 ms':>9}{'p99 ms':>9}{'index KB':>11}  pareto"
+    )
+    for r in rows:
+        print(
+            f"{r['config']:<20}{r[f'recall@{k}']:>10.3f}{r['mrr']:>8.3f}{r[f'ndcg@{k}']:>9.3f}"
+            f"{r['p50_ms']:>9.3f}{r['p99_ms']:>9.3f}{r['index_bytes'] / 1024:>11.1f}  "
+            f"{'*' if r['pareto'] else ''}"
+        )
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Evaluate retrieval quality vs speed.")
+    parser.add_argument("--docs-dir", default="data/docs")
+    parser.add_argument("--queries", help="labelled JSONL; default: FAQ questions from the docs")
+    parser.add_argument("--k", type=int, default=5)
+    parser.add_argument("--dims", default="32,64,128", help="reduced dims to try")
+    parser.add_argument("--nlist", type=int, default=0, help="IVF clusters (0 = sqrt of chunks)")
+    parser.add_argument("--nprobe", default="1,4", help="IVF clusters probed per query, to try")
+    parser.add_argument("--fake-embeddings", action="store_true", help="use the hashing fake embedder")
+    parser.add_argument("--json", help="also write results to this file")
+    args = parser.parse_args()
+
+    if args.fake_embeddings:
+        from models.fakes import FakeEmbeddingClient
+
+        embed_client = FakeEmbeddingClient()
+    else:
+        from models.embeddings import create_embedding_client
+
+        embed_client = create_embedding_client()
+
+    queries = (
+        load_labelled_queries(args.queries)
+        if args.queries
+        else generate_faq_queries(args.docs_dir)
+    )
+    if not queries:
+        print("No labelled queries found.")
+        return
+
+    # Chunked and deduplicated like the app's index; the projections under
+    # test are fitted per --dims, so none is built here
+    build_kwargs = dict(index_build_kwargs(), projection_dims=0)
+    vectorstore = build_knowledge_base(args.docs_dir, embed_client, **build_kwargs)
+    query_vecs = np.array(
+        embed_client.embed_documents([q["query"] for q in queries]), dtype="float32"
+    )
+    dims_list = [int(d) for d in args.dims.split(",") if d.strip()]
+    nprobe_list = [int(p) for p in args.nprobe.split(",") if p.strip()]
+
+    configs = build_configs(vectorstore, dims_list, nprobe_list, nlist=args.nlist)
+    rows = evaluate(vectorstore, query_vecs, queries, configs, k=args.k)
+    print(f"{len(queries)} queries, {len(vectorstore['chunks'])} chunks")
+    print_table(rows, args.k)
+
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump(rows, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,389 @@
+# utils/hot_cache.py
+"""
+In-process caches of query embeddings, retrieval results and web results,
+with snapshots of their hottest entries that survive restarts.
+
+Each cache is an LRU that counts hits per entry. Entries carry the
+version they are valid for: query embeddings the embedding model,
+retrieval results the index version (see index_version). Web results
+instead expire after WEB_CACHE_TTL_S.
+
+On graceful shutdown and every CACHE_SNAPSHOT_INTERVAL_S, the
+CACHE_SNAPSHOT_TOP most-hit entries of each cache are written to
+CACHE_SNAPSHOT_PATH (one compressed .npz). On startup they are loaded
+back in the background; entries for an index version or embedding model
+that is no longer served, and expired web results, are dropped.
+
+Usage:
+    python -m utils.hot_cache snapshots/hot_caches.npz      # inspect a snapshot
+"""
+
+from collections import OrderedDict
+from typing import Callable, Dict, List, Set, Tuple
+import argparse
+import atexit
+import json
+import os
+import threading
+import time
+
+import numpy as np
+
+
+SNAPSHOT_FORMAT = 1
+CACHE_ENTRIES = 2048    # per cache
+SNAPSHOT_TOP = 500      # hottest entries per cache written to a snapshot
+WEB_TTL_S = 300.0
+SNAPSHOT_INTERVAL_S = 300.0
+
+
+def index_version(vectorstore: Dict) -> str | None:
+    """
+    Version of an index that survives restarts: its build counter and
+    build time, which snapshots and shared generations keep (a snapshot's
+    meta works too). None for a partial index, whose results are not cached.
+    """
+    if vectorstore.get("partial"):
+        return None
+    return f"{vectorstore.get('version', 0)}@{vectorstore.get('built_at', 0.0):.6f}"
+
+
+def web_key(query: str, k: int) -> Tuple:
+    return (" ".join(query.lower().split()), k)
+
+
+class HotCache:
+    """
+    Thread-safe LRU of max_entries (0 = disabled) counting hits per entry.
+
+    get() only returns an entry stored for the same version and, with
+    ttl_s, stored at most ttl_s seconds ago; other entries are dropped.
+    Keys are tuples of JSON values (they are written to snapshots).
+    """
+
+    def __init__(self, max_entries: int = CACHE_ENTRIES, ttl_s: float | None = None):
+        self.max_entries = max_entries
+        self.ttl_s = ttl_s
+        self._lock = threading.Lock()
+        self._entries: "OrderedDict[Tuple, Dict]" = OrderedDict()
+        self._stats = {"hits": 0, "misses": 0, "rehydrated": 0, "rehydrated_hits": 0}
+
+    def fresh(self, entry: Dict, now: float | None = None) -> bool:
+        return self.ttl_s is None or (now or time.time()) - entry["stored_at"] <= self.ttl_s
+
+    def get(self, key: Tuple, version: str | None = None):
+        if self.max_entries <= 0:
+            return None
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and (entry["version"] != version or not self.fresh(entry)):
+                del self._entries[key]
+                entry = None
+            if entry is None:
+                self._stats["misses"] += 1
+                return None
+            entry["hits"] += 1
+            self._entries.move_to_end(key)
+            self._stats["hits"] += 1
+            if entry["rehydrated"]:
+                self._stats["rehydrated_hits"] += 1
+            return entry["value"]
+
+    def put(self, key: Tuple, value, version: str | None = None) -> None:
+        if self.max_entries <= 0:
+            return
+        with self._lock:
+            old = self._entries.pop(key, None)
+            self._entries[key] = {
+                "value": value,
+                "version": version,
+                "stored_at": time.time(),
+                "hits": old["hits"] if old is not None else 0,
+                "rehydrated": False,
+            }
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def hottest(self, n: int) -> List[Tuple[Tuple, Dict]]:
+        """
+        Up to n (key, entry) pairs, most hits first (ties: most recently used).
+        """
+        with self._lock:
+            items = list(self._entries.items())
+        ranked = sorted(
+            enumerate(items), key=lambda pair: (pair[1][1]["hits"], pair[0]), reverse=True
+        )
+        return [item for _, item in ranked[:n]]
+
+    def load(self, entries: List[Tuple[Tuple, Dict]]) -> int:
+        """
+        Add rehydrated entries (hottest first) behind the live ones, which
+        they never replace. Returns how many were added.
+        """
+        added = 0
+        with self._lock:
+            for key, entry in entries:
+                if len(self._entries) >= self.max_entries:
+                    break
+                if key in self._entries:
+                    continue
+                self._entries[key] = dict(entry, rehydrated=True)
+                self._entries.move_to_end(key, last=False)
+                added += 1
+            self._stats["rehydrated"] += added
+        return added
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self) -> Dict:
+        with self._lock:
+            s = dict(self._stats, entries=len(self._entries))
+        lookups = s["hits"] + s["misses"]
+        s["hit_rate"] = s["hits"] / lookups if lookups else 0.0
+        return s
+
+
+class HotCaches:
+    """
+    A process's query-embedding, retrieval and web-result caches, with
+    snapshots (save / start_snapshots) and rehydration (load /
+    rehydrate_async). ready is set once rehydration has finished, or
+    straight away when there is nothing to rehydrate.
+    """
+
+    def __init__(self, max_entries: int = CACHE_ENTRIES, web_ttl_s: float = WEB_TTL_S):
+        self.embeddings = HotCache(max_entries)
+        self.retrieval = HotCache(max_entries)
+        self.web = HotCache(max_entries, ttl_s=web_ttl_s)
+        self.ready = threading.Event()
+        self.last_snapshot: Dict | None = None
+        self.last_rehydrate: Dict | None = None
+        self._save_lock = threading.Lock()
+        self._stop = threading.Event()
+
+    def caches(self) -> Dict[str, HotCache]:
+        return {"embeddings": self.embeddings, "retrieval": self.retrieval, "web": self.web}
+
+    def embed_query(self, embed_client, query: str) -> Tuple[np.ndarray, bool]:
+        """
+        Embedding of query, and whether it came from the cache (else it
+        is embedded and cached).
+        """
+        key = (query,)
+        q_vec = self.embeddings.get(key, embed_client.model_name)
+        if q_vec is not None:
+            return q_vec, True
+        q_vec = np.array(embed_client.embed_query(query), dtype="float32")
+        if len(q_vec):
+            self.embeddings.put(key, q_vec, embed_client.model_name)
+        return q_vec, False
+
+    def save(self, path: str, top: int = SNAPSHOT_TOP) -> Dict:
+        """
+        Write the top most-hit entries of each cache to path (atomically).
+        """
+        start = time.perf_counter()
+        tables: Dict[str, List[Dict]] = {}
+        vectors: List[np.ndarray] = []
+        now = time.time()
+        for name, cache in self.caches().items():
+            rows = []
+            for key, entry in cache.hottest(top):
+                if not cache.fresh(entry, now):
+                    continue
+                row = {
+                    "key": list(key),
+                    "version": entry["version"],
+                    "hits": entry["hits"],
+                    "stored_at": entry["stored_at"],
+                }
+                if name == "embeddings":
+                    vectors.append(np.asarray(entry["value"], dtype="float32"))
+                else:
+                    row["value"] = entry["value"]
+                rows.append(row)
+            tables[name] = rows
+
+        meta = {"format": SNAPSHOT_FORMAT, "saved_at": now, "caches": tables}
+        with self._save_lock:
+            os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+            tmp = f"{path}.tmp-{os.getpid()}"
+            with open(tmp, "wb") as f:
+                np.savez_compressed(
+                    f,
+                    meta=np.frombuffer(json.dumps(meta).encode("utf-8"), dtype=np.uint8),
+                    vectors=np.concatenate(vectors) if vectors else np.zeros(0, dtype="float32"),
+                    lengths=np.array([len(v) for v in vectors], dtype=np.int64),
+                )
+            os.replace(tmp, path)
+
+        report = {
+            "path": path,
+            "entries": {name: len(rows) for name, rows in tables.items()},
+            "bytes": os.path.getsize(path),
+            "ms": (time.perf_counter() - start) * 1000,
+        }
+        self.last_snapshot = dict(report, at=now)
+        print(
+            f"[HotCaches.save] Wrote {sum(report['entries'].values())} entries "
+            f"({report['bytes'] / 1024:.1f} KB) to {path} in {report['ms']:.0f} ms"
+        )
+        return report
+
+    def load(
+        self,
+        path: str,
+        index_versions: Set[str] | None = None,
+        embedding_models: Set[str] | None = None,
+    ) -> Dict:
+        """
+        Add the entries of a snapshot. Retrieval results for an index
+        version not in index_versions, embeddings of a model not in
+        embedding_models (None = keep all) and expired web results are
+        dropped.
+        """
+        start = time.perf_counter()
+        meta, vectors, lengths = read_snapshot(path)
+        offsets = np.concatenate([[0], np.cumsum(lengths)])
+        valid = {"embeddings": embedding_models, "retrieval": index_versions, "web": None}
+
+        now = time.time()
+        report: Dict = {"path": path, "kept": {}, "dropped": {}}
+        for name, cache in self.caches().items():
+            entries = []
+            rows = meta["caches"].get(name, [])
+            for i, row in enumerate(rows):
+                versions = valid[name]
+                if versions is not None and row["version"] not in versions:
+                    continue
+                if cache.ttl_s is not None and now - row["stored_at"] > cache.ttl_s:
+                    continue
+                value = (
+                    vectors[offsets[i]:offsets[i + 1]].copy()
+                    if name == "embeddings"
+                    else row["value"]
+                )
+                entries.append(
+                    (
+                        tuple(row["key"]),
+                        {
+                            "value": value,
+                            "version": row["version"],
+                            "stored_at": row["stored_at"],
+                            # Halved so that popularity from long ago fades out
+                            "hits": row["hits"] // 2,
+                        },
+                    )
+                )
+            report["kept"][name] = cache.load(entries)
+            report["dropped"][name] = len(rows) - report["kept"][name]
+        report["ms"] = (time.perf_counter() - start) * 1000
+
+        self.last_rehydrate = dict(report, at=now)
+        print(
+            f"[HotCaches.load] Rehydrated {report['kept']} from {path}, dropped "
+            f"{report['dropped']} in {report['ms']:.0f} ms"
+        )
+        return report
+
+    def rehydrate_async(
+        self,
+        path: str,
+        valid_versions: Callable[[], Tuple[Set[str] | None, Set[str] | None]] | None = None,
+    ) -> threading.Thread:
+        """
+        load() path on a background thread, then set ready.
+        valid_versions() gives the (index_versions, embedding_models) to keep.
+        """
+
+        def run() -> None:
+            try:
+                if os.path.isfile(path):
+                    index_versions, embedding_models = (
+                        valid_versions() if valid_versions is not None else (None, None)
+                    )
+                    self.load(path, index_versions, embedding_models)
+            except Exception as e:
+                print(f"[HotCaches] Rehydrating from {path} failed: {e}")
+            finally:
+                self.ready.set()
+
+        thread = threading.Thread(target=run, name="HotCachesRehydrate", daemon=True)
+        thread.start()
+        return thread
+
+    def wait_ready(self, timeout: float | None = None) -> bool:
+        return self.ready.wait(timeout)
+
+    def start_snapshots(
+        self, path: str, interval_s: float = SNAPSHOT_INTERVAL_S, top: int = SNAPSHOT_TOP
+    ) -> None:
+        """
+        Snapshot to path every interval_s seconds (0 = only at exit) and at
+        interpreter exit.
+        """
+        if interval_s > 0:
+
+            def run() -> None:
+                while not self._stop.wait(interval_s):
+                    self._snapshot(path, top)
+
+            threading.Thread(target=run, name="HotCachesSnapshot", daemon=True).start()
+        atexit.register(self.shutdown, path, top)
+
+    def shutdown(self, path: str, top: int = SNAPSHOT_TOP) -> None:
+        """
+        Stop periodic snapshots and write a last one.
+        """
+        self._stop.set()
+        self._snapshot(path, top)
+
+    def _snapshot(self, path: str, top: int) -> None:
+        # Before rehydration ends the caches hold only part of what the
+        # existing snapshot has: writing now would lose the rest
+        if not self.ready.is_set():
+            return
+        try:
+            self.save(path, top)
+        except Exception as e:
+            print(f"[HotCaches] Snapshot to {path} failed: {e}")
+
+    def stats(self) -> Dict[str, Dict]:
+        return {name: cache.stats() for name, cache in self.caches().items()}
+
+
+def read_snapshot(path: str) -> Tuple[Dict, np.ndarray, np.ndarray]:
+    """
+    A snapshot's meta, flat embedding vectors and their lengths.
+    """
+    with np.load(path) as data:
+        meta = json.loads(bytes(data["meta"]).decode("utf-8"))
+        vectors, lengths = data["vectors"], data["lengths"]
+    if meta.get("format") != SNAPSHOT_FORMAT:
+        raise ValueError(f"Unsupported hot cache snapshot format: {meta.get('format')}")
+    return meta, vectors, lengths
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Inspect a hot cache snapshot.")
+    parser.add_argument("path")
+    args = parser.parse_args()
+
+    meta, _, _ = read_snapshot(args.path)
+    age = time.time() - meta["saved_at"]
+    print(f"{args.path}: saved {age:.0f}s ago, {os.path.getsize(args.path) / 1024:.1f} KB")
+    for name, rows in meta["caches"].items():
+        versions: Dict[str, int] = {}
+        for row in rows:
+            versions[str(row["version"])] = versions.get(str(row["version"]), 0) + 1
+        hits = sum(row["hits"] for row in rows)
+        print(
+            f"  {name:<11}{len(rows):>6} entries{hits:>8} hits  "
+            + ", ".join(f"{v}: {n}" for v, n in sorted(versions.items()))
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,399 @@
+# utils/index_manager.py
+
+from collections import OrderedDict
+from typing import Callable, Dict, List, Set
+import os
+import sys
+import threading
+import time
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '../..')))
+from config.config import get_config
+from utils.hot_cache import index_version
+from utils.rag import build_knowledge_base
+from utils.shared_index import (
+    attach_vectorstore,
+    is_stale,
+    publish_vectorstore,
+    published_generation,
+)
+from utils.snapshot import (
+    load_vectorstore,
+    read_snapshot_meta,
+    save_vectorstore,
+    vectorstore_nbytes,
+)
+from utils.vector_store import retire_store
+
+
+# Build settings that change an index's content (the store backend does
+# not): a shared index built with others is not attached.
+INDEX_SETTINGS = ("chunking", "dedup", "projection_dims", "projection_method")
+
+
+def parse_tenants(spec: str) -> Dict[str, Dict]:
+    """
+    Parse "name=docs_dir[@embedding_model],..." into
+    {name: {"docs_dir": ..., "embedding_model": ... | None}}.
+    """
+    tenants: Dict[str, Dict] = {}
+    for item in spec.split(","):
+        item = item.strip()
+        if not item:
+            continue
+        name, _, rest = item.partition("=")
+        docs_dir, _, model = rest.partition("@")
+        if not name or not docs_dir:
+            raise ValueError(f"Bad tenant entry: {item!r} (expected name=docs_dir[@model])")
+        tenants[name.strip()] = {
+            "docs_dir": docs_dir.strip(),
+            "embedding_model": model.strip() or None,
+        }
+    return tenants
+
+
+class IndexManager:
+    """
+    Serves several tenants (each with its own docs directory) from one
+    process.
+
+    - get(tenant) returns the tenant's vectorstore, loading it on demand
+      from its snapshot under snapshot_dir (building and snapshotting it
+      first if there is none, or if it was built with another embedding
+      model or INDEX_SETTINGS).
+    - Resident vectorstores are kept in LRU order; after a load, the least
+      recently used ones are evicted until the total is within
+      memory_budget_bytes (the one just loaded is always kept).
+    - Tenants using the same embedding model share one client.
+    - With shared_dir, indexes are shared by every process on the host
+      (see utils.shared_index): a tenant is attached zero-copy from its
+      published generation if there is one built with the same
+      embedding model and INDEX_SETTINGS; otherwise it is loaded or
+      built, published, and attached. Builds, refreshes and installs
+      publish a new generation, which other processes attach on their
+      next get() / get_resident(). Shared indexes count 0 bytes against
+      the memory budget.
+
+    Evicted and replaced vectorstores have their store closed (stopping
+    compaction threads, SQLite connections and mmaps) once the readers
+    that pinned it (see utils.rag.pin_vectorstore) have released it.
+    """
+
+    def __init__(
+        self,
+        tenants: Dict[str, Dict],
+        snapshot_dir: str,
+        memory_budget_bytes: int,
+        embed_client_factory: Callable | None = None,
+        default_embedding_model: str | None = None,
+        build_kwargs: Dict | None = None,
+        shared_dir: str | None = None,
+    ):
+        if not tenants:
+            raise ValueError("No tenants configured.")
+        self.tenants = tenants
+        self.snapshot_dir = snapshot_dir
+        self.memory_budget_bytes = memory_budget_bytes
+        self.default_embedding_model = default_embedding_model
+        self.shared_dir = shared_dir
+        self.build_kwargs = dict(build_kwargs or {})
+        self.build_kwargs.pop("num_shards", None)  # snapshots are unsharded
+
+        if embed_client_factory is None:
+            from models.embeddings import create_embedding_client
+
+            embed_client_factory = create_embedding_client
+        self._embed_client_factory = embed_client_factory
+        self._embed_clients: Dict[str | None, object] = {}
+
+        self._lock = threading.Lock()  # guards the LRU, stats and client cache
+        self._tenant_locks = {name: threading.Lock() for name in tenants}
+        self._resident: "OrderedDict[str, Dict]" = OrderedDict()
+        self._nbytes: Dict[str, int] = {}
+        self._stats: Dict[str, Dict] = {
+            name: {
+                "loads": 0,
+                "hits": 0,
+                "evictions": 0,
+                "last_load_ms": None,
+                "last_load_from": None,
+                "last_used": None,
+            }
+            for name in tenants
+        }
+
+    def _check_tenant(self, tenant: str) -> None:
+        if tenant not in self.tenants:
+            raise KeyError(f"Unknown tenant: {tenant}")
+
+    def docs_dir(self, tenant: str) -> str:
+        self._check_tenant(tenant)
+        return self.tenants[tenant]["docs_dir"]
+
+    def snapshot_path(self, tenant: str) -> str:
+        return os.path.join(self.snapshot_dir, tenant)
+
+    def _model_name(self, tenant: str) -> str | None:
+        return self.tenants[tenant].get("embedding_model") or self.default_embedding_model
+
+    def embedding_model(self, tenant: str) -> str | None:
+        self._check_tenant(tenant)
+        return self._model_name(tenant)
+
+    def index_settings(self) -> Dict:
+        """
+        The build settings (INDEX_SETTINGS) recorded with shared indexes.
+        """
+        return {key: self.build_kwargs.get(key) for key in INDEX_SETTINGS}
+
+    def embed_client(self, tenant: str):
+        """
+        The tenant's embedding client, shared with every tenant on the same model.
+        """
+        self._check_tenant(tenant)
+        model = self._model_name(tenant)
+        with self._lock:
+            if model not in self._embed_clients:
+                self._embed_clients[model] = self._embed_client_factory(model)
+            return self._embed_clients[model]
+
+    def get_resident(self, tenant: str) -> Dict | None:
+        """
+        The tenant's vectorstore if it is in memory, without loading it
+        (a newer shared generation is attached, which copies nothing).
+        """
+        with self._lock:
+            vectorstore = self._resident.get(tenant)
+        if vectorstore is not None and self._stale(tenant, vectorstore):
+            return self.get(tenant)
+        return vectorstore
+
+    def _stale(self, tenant: str, vectorstore: Dict) -> bool:
+        return self.shared_dir is not None and is_stale(vectorstore, self.shared_dir, tenant)
+
+    def get(self, tenant: str) -> Dict:
+        """
+        The tenant's vectorstore, loaded (or built) on demand.
+        """
+        self._check_tenant(tenant)
+        with self._lock:
+            vectorstore = self._touch(tenant)
+        if vectorstore is not None and not self._stale(tenant, vectorstore):
+            return vectorstore
+
+        # One loader per tenant; other tenants load in parallel
+        with self._tenant_locks[tenant]:
+            with self._lock:
+                vectorstore = self._touch(tenant)
+            if vectorstore is not None and not self._stale(tenant, vectorstore):
+                return vectorstore
+
+            start = time.perf_counter()
+            vectorstore, source = self._load_or_build(tenant)
+            self._admit(tenant, vectorstore, (time.perf_counter() - start) * 1000, source)
+            return vectorstore
+
+    def refresh(self, tenant: str) -> Dict:
+        """
+        Rebuild the tenant's index from its docs, replace its snapshot and
+        make it resident.
+        """
+        self._check_tenant(tenant)
+        with self._tenant_locks[tenant]:
+            start = time.perf_counter()
+            vectorstore = self._share(tenant, self._build(tenant))
+            self._admit(tenant, vectorstore, (time.perf_counter() - start) * 1000, "build")
+            return vectorstore
+
+    def install(self, tenant: str, vectorstore: Dict, build_ms: float | None = None) -> None:
+        """
+        Snapshot a vectorstore built elsewhere (e.g. by a BuildJob) as the
+        tenant's index and make it resident.
+        """
+        self._check_tenant(tenant)
+        with self._tenant_locks[tenant]:
+            self._save_snapshot(tenant, vectorstore)
+            self._admit(tenant, self._share(tenant, vectorstore), build_ms, "build")
+
+    def has_snapshot(self, tenant: str) -> bool:
+        self._check_tenant(tenant)
+        return read_snapshot_meta(self.snapshot_path(tenant)) is not None
+
+    def index_versions(self) -> Set[str]:
+        """
+        Versions (see utils.hot_cache.index_version) of the tenants'
+        resident indexes and snapshots: the ones cached results may be for.
+        """
+        with self._lock:
+            versions = {index_version(vs) for vs in self._resident.values()}
+        for tenant in self.tenants:
+            meta = read_snapshot_meta(self.snapshot_path(tenant))
+            if meta is not None:
+                versions.add(index_version(meta))
+        versions.discard(None)
+        return versions
+
+    def build_kwargs_for(self, tenant: str) -> Dict:
+        """
+        Keyword arguments for building the tenant's index (see build_knowledge_base).
+        """
+        self._check_tenant(tenant)
+        return dict(self.build_kwargs)
+
+    def _touch(self, tenant: str) -> Dict | None:
+        # Caller holds self._lock
+        vectorstore = self._resident.get(tenant)
+        if vectorstore is not None:
+            self._resident.move_to_end(tenant)
+            self._stats[tenant]["hits"] += 1
+            self._stats[tenant]["last_used"] = time.time()
+        return vectorstore
+
+    def _load_or_build(self, tenant: str):
+        if self.shared_dir is not None and published_generation(self.shared_dir, tenant):
+            try:
+                vectorstore = attach_vectorstore(self.shared_dir, tenant)
+                shared = vectorstore["shared"]
+                if (
+                    shared["embedding_model"] == self._model_name(tenant)
+                    and shared["build_settings"] == self.index_settings()
+                ):
+                    return vectorstore, "shared"
+                print(
+                    f"[IndexManager] Shared index for {tenant} was built with "
+                    f"{shared['embedding_model']} / {shared['build_settings']}; not attaching"
+                )
+            except Exception as e:
+                print(f"[IndexManager] Failed to attach shared index for {tenant}: {e}")
+
+        path = self.snapshot_path(tenant)
+        meta = read_snapshot_meta(path)
+        if meta is not None:
+            if (
+                meta.get("embedding_model") == self._model_name(tenant)
+                and meta.get("build_settings") == self.index_settings()
+            ):
+                try:
+                    return self._share(tenant, load_vectorstore(path)), "snapshot"
+                except Exception as e:
+                    print(f"[IndexManager] Failed to load snapshot for {tenant}: {e}; rebuilding")
+            else:
+                print(
+                    f"[IndexManager] Snapshot for {tenant} was built with "
+                    f"{meta.get('embedding_model')} / {meta.get('build_settings')}; rebuilding"
+                )
+        return self._share(tenant, self._build(tenant)), "build"
+
+    def _share(self, tenant: str, vectorstore: Dict) -> Dict:
+        """
+        With shared_dir: publish vectorstore for every process on the host
+        and return the attached (zero-copy) version in its place.
+        """
+        if self.shared_dir is None:
+            return vectorstore
+        publish_vectorstore(
+            vectorstore, self.shared_dir, tenant, self._model_name(tenant), self.index_settings()
+        )
+        return attach_vectorstore(self.shared_dir, tenant)
+
+    def _build(self, tenant: str) -> Dict:
+        vectorstore = build_knowledge_base(
+            self.docs_dir(tenant), self.embed_client(tenant), **self.build_kwargs
+        )
+        self._save_snapshot(tenant, vectorstore)
+        return vectorstore
+
+    def _save_snapshot(self, tenant: str, vectorstore: Dict) -> None:
+        os.makedirs(self.snapshot_dir, exist_ok=True)
+        save_vectorstore(
+            vectorstore, self.snapshot_path(tenant), self._model_name(tenant), self.index_settings()
+        )
+
+    def _admit(self, tenant: str, vectorstore: Dict, load_ms: float, source: str) -> None:
+        nbytes = vectorstore_nbytes(vectorstore)
+        retired = []
+        with self._lock:
+            previous = self._resident.get(tenant)
+            if previous is not None and previous is not vectorstore:
+                retired.append(previous)
+            self._resident[tenant] = vectorstore
+            self._resident.move_to_end(tenant)
+            self._nbytes[tenant] = nbytes
+
+            stats = self._stats[tenant]
+            stats["loads"] += 1
+            stats["last_load_ms"] = load_ms
+            stats["last_load_from"] = source
+            stats["last_used"] = time.time()
+
+            while self.resident_bytes() > self.memory_budget_bytes and len(self._resident) > 1:
+                victim, evicted = self._resident.popitem(last=False)
+                self._nbytes.pop(victim, None)
+                self._stats[victim]["evictions"] += 1
+                retired.append(evicted)
+                print(f"[IndexManager] Evicted {victim} (memory budget)")
+
+        # Snapshot files stay: close the stores, don't drop them
+        for old in retired:
+            if "store" in old:
+                retire_store(old["store"])
+
+    def resident_bytes(self) -> int:
+        return sum(self._nbytes.values())
+
+    def stats(self) -> List[Dict]:
+        """
+        One row per tenant: residency, memory, load timings and counters.
+        """
+        with self._lock:
+            return [
+                dict(
+                    self._stats[name],
+                    tenant=name,
+                    resident=name in self._resident,
+                    bytes=self._nbytes.get(name, 0),
+                    embedding_model=self._model_name(name),
+                    shared_generation=(
+                        self._resident[name].get("shared", {}).get("generation")
+                        if name in self._resident
+                        else None
+                    ),
+                )
+                for name in self.tenants
+            ]
+
+
+def index_build_kwargs(config: Dict | None = None) -> Dict:
+    """
+    The INDEX_SETTINGS build_knowledge_base kwargs from config (CHUNKING,
+    DEDUP_ENABLED, PROJECTION_*), for tools that build an index the way
+    the app does.
+    """
+    config = config or get_config()
+    return {
+        "chunking": config["CHUNKING"],
+        "dedup": config.get("DEDUP_ENABLED", False),
+        "projection_dims": config.get("PROJECTION_DIMS", 0),
+        "projection_method": config.get("PROJECTION_METHOD", "pca"),
+    }
+
+
+def index_manager_from_config() -> IndexManager:
+    """
+    IndexManager for TENANTS / SNAPSHOT_DIR / INDEX_MEMORY_BUDGET_MB /
+    SHARED_INDEX_DIR, building with the same dedup / projection / store
+    settings as the app.
+    """
+    config = get_config()
+    return IndexManager(
+        tenants=parse_tenants(config.get("TENANTS", "default=data/docs")),
+        snapshot_dir=config.get("SNAPSHOT_DIR", "snapshots"),
+        memory_budget_bytes=int(config.get("INDEX_MEMORY_BUDGET_MB", 512) * 1024 * 1024),
+        default_embedding_model=config.get("EMBEDDING_MODEL_NAME"),
+        build_kwargs=dict(
+            index_build_kwargs(config),
+            store_backend=config.get("VECTORSTORE_BACKEND", "numpy"),
+            store_dir=config.get("VECTORSTORE_DIR") or None,
+        ),
+        shared_dir=config.get("SHARED_INDEX_DIR") or None,
+    )
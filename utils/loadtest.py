@@ -0,0 +1,293 @@
+# utils/loadtest.py
+"""
+Offline load generator for the answer_query pipeline.
+
+Replays a JSONL query log (or a synthetic FAQ / pricing / outage mix)
+against fake chat models and a fake web-search backend, at a fixed
+concurrency (closed loop) or a target arrival rate (open loop).
+
+Usage:
+    python -m utils.loadtest --synthetic 200 --concurrency 8
+    python -m utils.loadtest --queries logs/queries.jsonl --rate 20 --concurrency 16
+"""
+
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, List
+import argparse
+import json
+import random
+import threading
+import time
+
+import numpy as np
+
+from models.fakes import FakeChatModel, FakeEmbeddingClient, FakeWebSearch
+from utils.accounting import CostLedger, format_summary
+from utils.assistant import answer_query
+from utils.deadline import Deadline
+from utils.index_manager import index_build_kwargs
+from utils.rag import build_knowledge_base
+
+
+SYNTHETIC_QUERIES = {
+    "faq": [
+        "How do I reset my account password?",
+        "How do I update my billing information?",
+        "How do I delete my account?",
+        "Where can I download my invoices?",
+    ],
+    "pricing": [
+        "What plans do you offer?",
+        "How much does the Pro plan cost per month?",
+        "Is there a discount for annual billing?",
+        "Do you have a free trial?",
+    ],
+    "outage": [
+        "Is the service down right now?",
+        "Is there an outage today?",
+        "What is the current status of the API?",
+        "Any ongoing incident with login?",
+    ],
+}
+
+STAGES = ["retrieve_ms", "compress_ms", "web_search_ms", "llm_ms", "total_ms"]
+
+
+def load_query_log(path: str) -> List[Dict]:
+    """
+    Read a JSONL query log. Each line needs "query" (or "text"),
+    and may carry "mode" ("concise" / "detailed").
+    """
+    queries: List[Dict] = []
+    with open(path, "r", encoding="utf-8") as f:
+        for line in f:
+            line = line.strip()
+            if not line:
+                continue
+            item = json.loads(line)
+            text = item.get("query") or item.get("text")
+            if text:
+                queries.append({"query": text, "mode": item.get("mode", "concise")})
+    return queries
+
+
+def synthetic_queries(
+    n: int,
+    mix: Dict[str, float] | None = None,
+    seed: int = 0,
+) -> List[Dict]:
+    """
+    n queries drawn from SYNTHETIC_QUERIES with the given category weights.
+    """
+    mix = mix or {"faq": 0.5, "pricing": 0.3, "outage": 0.2}
+    rng = random.Random(seed)
+    categories = list(mix)
+    weights = [mix[c] for c in categories]
+
+    queries: List[Dict] = []
+    for _ in range(n):
+        category = rng.choices(categories, weights=weights)[0]
+        queries.append(
+            {
+                "query": rng.choice(SYNTHETIC_QUERIES[category]),
+                "mode": rng.choice(["concise", "detailed"]),
+                "category": category,
+            }
+        )
+    return queries
+
+
+def _percentiles(values: List[float]) -> Dict[str, float]:
+    if not values:
+        return {"count": 0}
+    arr = np.asarray(values)
+    return {
+        "count": len(values),
+        "p50": float(np.percentile(arr, 50)),
+        "p90": float(np.percentile(arr, 90)),
+        "p99": float(np.percentile(arr, 99)),
+        "max": float(arr.max()),
+    }
+
+
+def run_load_test(
+    queries: List[Dict],
+    chat_model,
+    embed_client,
+    vectorstore: Dict,
+    web_search_fn,
+    concurrency: int = 8,
+    rate: float | None = None,
+    seed: int = 0,
+    deadline_ms: float | None = None,
+) -> Dict:
+    """
+    Run queries through answer_query and return a report.
+
+    - rate=None: closed loop, all queries offered at t=0 to `concurrency` workers.
+    - rate=R: open loop, Poisson arrivals at R queries/second.
+
+    Queueing delay is the time between a query's arrival and a worker
+    picking it up. deadline_ms gives each query a budget counted from its
+    arrival, so queueing eats into it.
+    """
+    records: List[Dict] = []
+    lock = threading.Lock()
+    rng = random.Random(seed)
+    ledger = CostLedger()
+
+    def handle(q: Dict, arrival: float) -> None:
+        started = time.perf_counter()
+        record = {"queue_ms": (started - arrival) * 1000, "errors": {}, "degradations": []}
+        try:
+            result = answer_query(
+                user_query=q["query"],
+                mode=q.get("mode", "concise"),
+                chat_model=chat_model,
+                embed_client=embed_client,
+                vectorstore=vectorstore,
+                web_search_fn=web_search_fn,
+                deadline=Deadline(deadline_ms, start=arrival) if deadline_ms else None,
+                ledger=ledger,
+            )
+            record.update(result["timings_ms"])
+            record["errors"] = result["errors"]
+            record["degradations"] = result["degradations"]
+            if "deadline" in result:
+                record["deadline_met"] = result["deadline"]["met"]
+        except Exception as e:
+            record["errors"] = {"pipeline": str(e)}
+            record["total_ms"] = (time.perf_counter() - started) * 1000
+        with lock:
+            records.append(record)
+
+    t0 = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        next_arrival = t0
+        for q in queries:
+            if rate:
+                next_arrival += rng.expovariate(rate)
+                delay = next_arrival - time.perf_counter()
+                if delay > 0:
+                    time.sleep(delay)
+                arrival = next_arrival
+            else:
+                arrival = t0
+            pool.submit(handle, q, arrival)
+    wall = time.perf_counter() - t0
+
+    error_counts: Dict[str, int] = {}
+    for r in records:
+        for stage in r["errors"]:
+            error_counts[stage] = error_counts.get(stage, 0) + 1
+
+    degradation_counts: Dict[str, int] = {}
+    for r in records:
+        for name in r["degradations"]:
+            degradation_counts[name] = degradation_counts.get(name, 0) + 1
+    met = [r["deadline_met"] for r in records if "deadline_met" in r]
+
+    n = len(records)
+    return {
+        "requests": n,
+        "wall_seconds": wall,
+        "throughput_qps": n / wall if wall else 0.0,
+        "concurrency": concurrency,
+        "target_rate_qps": rate,
+        "latency_ms": {
+            stage: _percentiles([r[stage] for r in records if stage in r])
+            for stage in STAGES
+        },
+        "queue_ms": _percentiles([r["queue_ms"] for r in records]),
+        "error_rate": {stage: count / n for stage, count in error_counts.items()} if n else {},
+        "deadline_ms": deadline_ms,
+        "deadline_met_rate": sum(met) / len(met) if met else None,
+        "degradation_rate": (
+            {name: count / n for name, count in degradation_counts.items()} if n else {}
+        ),
+        "cost": ledger.summary(),
+    }
+
+
+def print_report(report: Dict) -> None:
+    print(
+        f"Requests: {report['requests']} in {report['wall_seconds']:.2f}s "
+        f"-> {report['throughput_qps']:.1f} req/s (concurrency {report['concurrency']})"
+    )
+    print(f"{'stage':<16}{'count':>7}{'p50':>10}{'p90':>10}{'p99':>10}{'max':>10}")
+    rows = dict(report["latency_ms"], queue_ms=report["queue_ms"])
+    for stage, p in rows.items():
+        if not p["count"]:
+            continue
+        print(
+            f"{stage:<16}{p['count']:>7}{p['p50']:>10.1f}{p['p90']:>10.1f}"
+            f"{p['p99']:>10.1f}{p['max']:>10.1f}"
+        )
+    for stage, rate in report["error_rate"].items():
+        print(f"Error rate [{stage}]: {rate:.1%}")
+    if report.get("deadline_ms"):
+        print(f"Deadline {report['deadline_ms']:.0f} ms met: {report['deadline_met_rate']:.1%}")
+        for name, rate in report["degradation_rate"].items():
+            print(f"Degradation [{name}]: {rate:.1%}")
+    if report.get("cost"):
+        print(format_summary(report["cost"]))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Offline load test for answer_query.")
+    parser.add_argument("--queries", help="JSONL query log to replay")
+    parser.add_argument("--synthetic", type=int, default=100, help="number of synthetic queries (if no --queries)")
+    parser.add_argument("--concurrency", type=int, default=8)
+    parser.add_argument("--rate", type=float, default=None, help="open-loop arrival rate (queries/s)")
+    parser.add_argument("--docs-dir", default="data/docs")
+    parser.add_argument("--llm-latency-ms", type=float, default=400.0)
+    parser.add_argument("--llm-jitter-ms", type=float, default=150.0)
+    parser.add_argument("--llm-error-rate", type=float, default=0.01)
+    parser.add_argument("--search-latency-ms", type=float, default=250.0)
+    parser.add_argument("--search-jitter-ms", type=float, default=100.0)
+    parser.add_argument("--search-error-rate", type=float, default=0.02)
+    parser.add_argument("--deadline-ms", type=float, default=None, help="per-query latency budget")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--json", help="also write the report to this file")
+    args = parser.parse_args()
+
+    queries = (
+        load_query_log(args.queries)
+        if args.queries
+        else synthetic_queries(args.synthetic, seed=args.seed)
+    )
+
+    embed_client = FakeEmbeddingClient()
+    vectorstore = build_knowledge_base(args.docs_dir, embed_client, **index_build_kwargs())
+    chat_model = FakeChatModel(
+        "fake-llm",
+        latency_ms=(args.llm_latency_ms, args.llm_jitter_ms),
+        error_rate=args.llm_error_rate,
+        seed=args.seed,
+    )
+    web_search_fn = FakeWebSearch(
+        latency_ms=(args.search_latency_ms, args.search_jitter_ms),
+        error_rate=args.search_error_rate,
+        seed=args.seed,
+    )
+
+    report = run_load_test(
+        queries,
+        chat_model,
+        embed_client,
+        vectorstore,
+        web_search_fn,
+        concurrency=args.concurrency,
+        rate=args.rate,
+        seed=args.seed,
+        deadline_ms=args.deadline_ms,
+    )
+    print_report(report)
+
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump(report, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,593 @@
+# utils/prefetch.py
+"""
+Speculative retrieval for likely follow-up questions.
+
+Support conversations follow predictable paths (password reset -> account
+locked, billing -> invoices). A FollowUpModel counts which question
+follows which in past sessions, and keeps learning from live ones. After
+a request is answered, the Prefetcher predicts the likely next questions
+and, once no request is in flight, embeds them and retrieves their chunks
+into the session's PrefetchCache. When the next question matches a
+prefetched one, answer_query skips the embedding and search stages
+(same text) or only the search (near-identical embedding).
+
+Usage:
+    python -m utils.prefetch                              # synthetic sessions
+    python -m utils.prefetch --sessions sessions.jsonl --train-fraction 0.8
+
+Session logs are JSONL lines {"session_id": ..., "query": ...}, in order.
+"""
+
+from collections import OrderedDict
+from contextlib import contextmanager
+from typing import Dict, List, Tuple
+import argparse
+import json
+import random
+import re
+import threading
+import time
+
+import numpy as np
+
+from utils.rag import pin_vectorstore, retrieve_relevant_chunks_batch, unpin_vectorstore
+
+
+# A known question within MATCH_SIMILARITY of the current one contributes
+# its follow-ups; a prefetched question within HIT_SIMILARITY of the next
+# one lends it its retrieval results.
+MATCH_SIMILARITY = 0.8
+HIT_SIMILARITY = 0.95
+MAX_FOLLOW_UPS = 3
+CACHE_ENTRIES = 8       # prefetched questions kept per session
+MAX_KNOWN_QUERIES = 5000
+IDLE_WAIT_S = 2.0       # a prefetch waiting longer for idle time is dropped
+
+_WORD_RE = re.compile(r"\w+")
+
+
+def normalize_query(text: str) -> str:
+    return " ".join(_WORD_RE.findall((text or "").lower()))
+
+
+def load_sessions(path: str) -> List[List[str]]:
+    """
+    Questions per session, in order, from a JSONL session log.
+    """
+    sessions: Dict[str, List[str]] = {}
+    with open(path, "r", encoding="utf-8") as f:
+        for line in f:
+            line = line.strip()
+            if not line:
+                continue
+            item = json.loads(line)
+            text = item.get("query") or item.get("text")
+            if text:
+                sessions.setdefault(str(item.get("session_id", "")), []).append(text)
+    return list(sessions.values())
+
+
+class FollowUpModel:
+    """
+    Question-to-next-question counts over the embedding space of one
+    embedding model.
+
+    Known questions are stored once (by normalized text) with their
+    embedding. predict() finds the known questions similar to the current
+    one and ranks what followed them, weighted by similarity and count.
+    """
+
+    def __init__(self, dim: int):
+        self._lock = threading.Lock()
+        self.queries: List[str] = []
+        self._index: Dict[str, int] = {}
+        self._matrix = np.zeros((64, dim), dtype="float32")
+        self.transitions: Dict[int, Dict[int, int]] = {}
+
+    def __len__(self) -> int:
+        return len(self.queries)
+
+    def _add_query(self, text: str, vec: np.ndarray) -> int | None:
+        # Caller holds self._lock
+        key = normalize_query(text)
+        if key in self._index:
+            return self._index[key]
+        if not key or len(self.queries) >= MAX_KNOWN_QUERIES:
+            return None
+        n = len(self.queries)
+        if n == len(self._matrix):
+            self._matrix = np.vstack([self._matrix, np.zeros_like(self._matrix)])
+        self._matrix[n] = vec
+        self.queries.append(text)
+        self._index[key] = n
+        return n
+
+    def observe(self, prev: str, prev_vec: np.ndarray, nxt: str, next_vec: np.ndarray) -> None:
+        """
+        Record that question nxt followed prev in a session.
+        """
+        with self._lock:
+            a = self._add_query(prev, prev_vec)
+            b = self._add_query(nxt, next_vec)
+            if a is None or b is None or a == b:
+                return
+            counts = self.transitions.setdefault(a, {})
+            counts[b] = counts.get(b, 0) + 1
+
+    def fit(self, sessions: List[List[str]], embed_client) -> None:
+        """
+        Learn from past sessions (distinct questions are embedded in one batch).
+        """
+        distinct = list({normalize_query(q): q for s in sessions for q in s}.values())
+        if not distinct:
+            return
+        vectors = dict(
+            zip(
+                (normalize_query(q) for q in distinct),
+                np.array(embed_client.embed_documents(distinct), dtype="float32"),
+            )
+        )
+        for session in sessions:
+            for prev, nxt in zip(session, session[1:]):
+                self.observe(prev, vectors[normalize_query(prev)], nxt, vectors[normalize_query(nxt)])
+
+    def predict(self, query: str, q_vec: np.ndarray, k: int = MAX_FOLLOW_UPS) -> List[Tuple[str, float]]:
+        """
+        Up to k likely next questions with their estimated probability.
+        """
+        with self._lock:
+            n = len(self.queries)
+            if not n or not self.transitions:
+                return []
+            sims = self._matrix[:n] @ np.asarray(q_vec, dtype="float32")
+            current = self._index.get(normalize_query(query))
+            scores: Dict[int, float] = {}
+            for i in np.flatnonzero(sims >= MATCH_SIMILARITY):
+                for j, count in self.transitions.get(int(i), {}).items():
+                    if j != current:
+                        scores[j] = scores.get(j, 0.0) + float(sims[i]) * count
+            total = sum(scores.values())
+            ranked = sorted(scores.items(), key=lambda item: -item[1])[:k]
+            return [(self.queries[j], score / total) for j, score in ranked]
+
+
+def index_key(vectorstore: Dict) -> Tuple:
+    """
+    Identity of an index version (cached retrieval results are only valid for it).
+    """
+    return (
+        vectorstore.get("version"),
+        vectorstore.get("built_at"),
+        vectorstore.get("shared", {}).get("generation"),
+        len(vectorstore["chunks"]),
+    )
+
+
+def _stats() -> Dict:
+    return {
+        "lookups": 0,
+        "hits_exact": 0,
+        "hits_similar": 0,
+        "prefetched": 0,
+        "wasted": 0,
+        "prefetch_ms": 0.0,
+        "wasted_ms": 0.0,
+        "skipped_busy": 0,
+    }
+
+
+def _rates(stats: Dict) -> Dict:
+    hits = stats["hits_exact"] + stats["hits_similar"]
+    return dict(
+        stats,
+        hits=hits,
+        hit_rate=hits / stats["lookups"] if stats["lookups"] else 0.0,
+        waste_rate=stats["wasted"] / stats["prefetched"] if stats["prefetched"] else 0.0,
+    )
+
+
+class PrefetchCache:
+    """
+    One conversation's prefetched questions (an LRU of CACHE_ENTRIES).
+
+    Entries are keyed by normalized question text and only match a
+    request against the same index version, top_k and filters. An entry
+    dropped (evicted or outdated) without having been used counts as
+    wasted work.
+    """
+
+    def __init__(self, prefetcher: "Prefetcher", max_entries: int = CACHE_ENTRIES):
+        self.prefetcher = prefetcher
+        self.max_entries = max_entries
+        self._lock = threading.Lock()
+        self._entries: "OrderedDict[str, Dict]" = OrderedDict()
+        self._last: Tuple[str, np.ndarray] | None = None
+        self._stats = _stats()
+
+    @staticmethod
+    def request_key(vectorstore: Dict, top_k: int, filters: Dict | None) -> Tuple:
+        return (index_key(vectorstore), top_k, json.dumps(filters, sort_keys=True))
+
+    def _bump(self, name: str, value: float = 1) -> None:
+        self._stats[name] += value
+        self.prefetcher._bump(name, value)
+
+    def _drop(self, key: str) -> None:
+        # Caller holds self._lock
+        entry = self._entries.pop(key)
+        if not entry["used"]:
+            self._bump("wasted")
+            self._bump("wasted_ms", entry["cost_ms"])
+
+    def _hit(self, entry: Dict, kind: str) -> Dict:
+        # Caller holds self._lock
+        self._bump("hits_exact" if kind == "exact" else "hits_similar")
+        entry["used"] = True
+        self._entries.move_to_end(normalize_query(entry["query"]))
+        return {
+            "kind": kind,
+            "query": entry["query"],
+            "q_vec": entry["q_vec"],
+            "rag_results": [dict(r) for r in entry["rag_results"]],
+        }
+
+    def lookup(self, query: str, request_key: Tuple) -> Dict | None:
+        """
+        Prefetched results for exactly this question (counts a lookup).
+        """
+        with self._lock:
+            self._bump("lookups")
+            for key in [k for k, e in self._entries.items() if e["request_key"] != request_key]:
+                self._drop(key)
+            entry = self._entries.get(normalize_query(query))
+            return self._hit(entry, "exact") if entry is not None else None
+
+    def lookup_similar(self, q_vec: np.ndarray, request_key: Tuple) -> Dict | None:
+        """
+        Prefetched results of the closest question within HIT_SIMILARITY.
+        """
+        with self._lock:
+            best, best_sim = None, HIT_SIMILARITY
+            for entry in self._entries.values():
+                if entry["request_key"] != request_key:
+                    continue
+                sim = float(np.dot(entry["q_vec"], q_vec))
+                if sim >= best_sim:
+                    best, best_sim = entry, sim
+            return self._hit(best, "similar") if best is not None else None
+
+    def has(self, query: str) -> bool:
+        with self._lock:
+            return normalize_query(query) in self._entries
+
+    def store(self, entries: List[Dict]) -> None:
+        with self._lock:
+            for entry in entries:
+                key = normalize_query(entry["query"])
+                if key in self._entries:
+                    self._drop(key)
+                self._entries[key] = dict(entry, used=False)
+                self._bump("prefetched")
+                self._bump("prefetch_ms", entry["cost_ms"])
+                while len(self._entries) > self.max_entries:
+                    self._drop(next(iter(self._entries)))
+
+    def clear(self) -> None:
+        """
+        Forget the conversation (e.g. when the chat is cleared).
+        """
+        with self._lock:
+            for key in list(self._entries):
+                self._drop(key)
+            self._last = None
+
+    def stats(self) -> Dict:
+        with self._lock:
+            return _rates(dict(self._stats, cached=len(self._entries)))
+
+
+class Prefetcher:
+    """
+    Process-wide prefetch worker, shared by all sessions.
+
+    after_answer() records the question-to-question transition of the
+    session and queues a prefetch (replacing the session's pending one).
+    A single background thread runs prefetches only while no request is
+    in flight (see foreground()), waiting up to idle_wait_s for that.
+
+    One FollowUpModel is kept per embedding model; the seed sessions
+    are fitted into it on the worker thread the first time it is needed.
+    """
+
+    def __init__(
+        self,
+        sessions: List[List[str]] | None = None,
+        max_follow_ups: int = MAX_FOLLOW_UPS,
+        idle_wait_s: float = IDLE_WAIT_S,
+    ):
+        self.sessions = sessions or []
+        self.max_follow_ups = max_follow_ups
+        self.idle_wait_s = idle_wait_s
+        self._models: Dict[str, FollowUpModel] = {}
+        self._fitted: set = set()
+        self._stats = _stats()
+        self._stats_lock = threading.Lock()
+
+        self._cond = threading.Condition()
+        self._busy = 0
+        self._running = False
+        self._pending: "OrderedDict[int, Dict]" = OrderedDict()
+        self._thread = threading.Thread(target=self._run, name="Prefetcher", daemon=True)
+        self._thread.start()
+
+    def session(self) -> PrefetchCache:
+        return PrefetchCache(self)
+
+    def _bump(self, name: str, value: float = 1) -> None:
+        with self._stats_lock:
+            self._stats[name] += value
+
+    def stats(self) -> Dict:
+        with self._stats_lock:
+            stats = dict(self._stats)
+        return _rates(dict(stats, known_questions=sum(len(m) for m in self._models.values())))
+
+    def model(self, embed_client) -> FollowUpModel:
+        name = getattr(embed_client, "model_name", "")
+        with self._cond:
+            if name not in self._models:
+                dim = getattr(embed_client, "dim", 0) or len(embed_client.embed_query("a"))
+                self._models[name] = FollowUpModel(dim)
+            return self._models[name]
+
+    @contextmanager
+    def foreground(self):
+        """
+        Mark a request in flight; prefetches wait until none are.
+        """
+        with self._cond:
+            self._busy += 1
+        try:
+            yield
+        finally:
+            with self._cond:
+                self._busy -= 1
+                self._cond.notify_all()
+
+    def after_answer(
+        self,
+        cache: PrefetchCache,
+        query: str,
+        q_vec: np.ndarray,
+        embed_client,
+        vectorstore: Dict,
+        top_k: int,
+        filters: Dict | None,
+    ) -> None:
+        """
+        Learn from the session's last transition and queue a prefetch of
+        the likely follow-ups of query.
+        """
+        model = self.model(embed_client)
+        with cache._lock:
+            last, cache._last = cache._last, (query, q_vec)
+        if last is not None:
+            model.observe(last[0], last[1], query, q_vec)
+
+        # The queued task reads the store later: keep it open until then
+        if not pin_vectorstore(vectorstore):
+            return
+        with self._cond:
+            replaced = self._pending.pop(id(cache), None)
+            self._pending[id(cache)] = {
+                "cache": cache,
+                "query": query,
+                "q_vec": q_vec,
+                "embed_client": embed_client,
+                "vectorstore": vectorstore,
+                "top_k": top_k,
+                "filters": filters,
+                "request_key": PrefetchCache.request_key(vectorstore, top_k, filters),
+            }
+            self._cond.notify_all()
+        if replaced is not None:
+            unpin_vectorstore(replaced["vectorstore"])
+
+    def drain(self, timeout: float = 10.0) -> bool:
+        """
+        Wait until no prefetch is queued or running. Returns False on timeout.
+        """
+        with self._cond:
+            return self._cond.wait_for(lambda: not self._pending and not self._running, timeout)
+
+    def _run(self) -> None:
+        while True:
+            with self._cond:
+                self._cond.wait_for(lambda: self._pending)
+                _, task = self._pending.popitem(last=False)
+                self._running = True
+                idle = self._cond.wait_for(lambda: self._busy == 0, self.idle_wait_s)
+            try:
+                if idle:
+                    self._prefetch(task)
+                else:
+                    self._bump("skipped_busy")
+            except Exception as e:
+                print(f"[Prefetcher] Prefetch failed: {e}")
+            finally:
+                unpin_vectorstore(task["vectorstore"])
+                with self._cond:
+                    self._running = False
+                    self._cond.notify_all()
+
+    def _prefetch(self, task: Dict) -> None:
+        embed_client = task["embed_client"]
+        model = self.model(embed_client)
+        name = getattr(embed_client, "model_name", "")
+        if name not in self._fitted:
+            self._fitted.add(name)
+            model.fit(self.sessions, embed_client)
+
+        cache: PrefetchCache = task["cache"]
+        follow_ups = [
+            q for q, _ in model.predict(task["query"], task["q_vec"], self.max_follow_ups)
+            if not cache.has(q)
+        ]
+        if not follow_ups:
+            return
+
+        start = time.perf_counter()
+        q_matrix = np.array(embed_client.embed_documents(follow_ups), dtype="float32")
+        results = retrieve_relevant_chunks_batch(
+            follow_ups,
+            embed_client,
+            task["vectorstore"],
+            top_k=task["top_k"],
+            filters=task["filters"],
+            query_vecs=q_matrix,
+        )
+        cost_ms = (time.perf_counter() - start) * 1000 / len(follow_ups)
+        cache.store(
+            [
+                {
+                    "query": q,
+                    "q_vec": vec,
+                    "rag_results": rag_results,
+                    "request_key": task["request_key"],
+                    "cost_ms": cost_ms,
+                }
+                for q, vec, rag_results in zip(follow_ups, q_matrix, results)
+            ]
+        )
+
+
+# Synthetic conversations: each question's likely follow-ups
+FLOWS = {
+    "How do I reset my password?": [
+        "My account is locked after too many login attempts",
+        "I did not receive the password reset email",
+    ],
+    "My account is locked after too many login attempts": [
+        "How long until my account is unlocked?",
+        "How do I contact support?",
+    ],
+    "I did not receive the password reset email": [
+        "How do I change the email address on my account?",
+        "How do I contact support?",
+    ],
+    "How do I update my billing information?": [
+        "Where can I download my invoices?",
+        "Why was I charged twice this month?",
+    ],
+    "Where can I download my invoices?": [
+        "Can I add my company VAT number to invoices?",
+        "Why was I charged twice this month?",
+    ],
+    "Why was I charged twice this month?": [
+        "What is your refund policy?",
+        "How do I contact support?",
+    ],
+    "What plans do you offer?": [
+        "How much does the Pro plan cost per month?",
+        "Is there a discount for annual billing?",
+    ],
+    "How much does the Pro plan cost per month?": [
+        "Is there a discount for annual billing?",
+        "Do you have a free trial?",
+    ],
+    "Is there a discount for annual billing?": [
+        "What is your refund policy?",
+        "How do I upgrade my plan?",
+    ],
+}
+
+
+def synthetic_sessions(n: int, seed: int = 0, max_turns: int = 4) -> List[List[str]]:
+    """
+    Random walks over FLOWS (the first follow-up is the likelier one).
+    """
+    rng = random.Random(seed)
+    starts = list(FLOWS)
+    sessions: List[List[str]] = []
+    for _ in range(n):
+        session = [rng.choice(starts)]
+        while len(session) < max_turns and session[-1] in FLOWS and rng.random() < 0.8:
+            session.append(rng.choices(FLOWS[session[-1]], weights=[0.7, 0.3])[0])
+        sessions.append(session)
+    return sessions
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Replay sessions with follow-up prefetching.")
+    parser.add_argument("--sessions", help="JSONL session log; default: synthetic sessions")
+    parser.add_argument("--synthetic", type=int, default=300, help="number of synthetic sessions")
+    parser.add_argument("--train-fraction", type=float, default=0.7)
+    parser.add_argument("--docs-dir", default="data/docs")
+    parser.add_argument("--follow-ups", type=int, default=MAX_FOLLOW_UPS)
+    parser.add_argument("--fake-embeddings", action="store_true")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    from models.fakes import FakeChatModel
+    from utils.assistant import answer_query
+    from utils.index_manager import index_build_kwargs
+    from utils.rag import build_knowledge_base
+
+    if args.fake_embeddings:
+        from models.fakes import FakeEmbeddingClient
+
+        embed_client = FakeEmbeddingClient()
+    else:
+        from models.embeddings import create_embedding_client
+
+        embed_client = create_embedding_client()
+
+    sessions = (
+        load_sessions(args.sessions)
+        if args.sessions
+        else synthetic_sessions(args.synthetic, seed=args.seed)
+    )
+    split = int(len(sessions) * args.train_fraction)
+    train, test = sessions[:split], sessions[split:]
+
+    vectorstore = build_knowledge_base(args.docs_dir, embed_client, **index_build_kwargs())
+    prefetcher = Prefetcher(train, max_follow_ups=args.follow_ups)
+    chat_model = FakeChatModel()
+
+    retrieve_ms = {"hit": [], "miss": []}
+    for session in test:
+        cache = prefetcher.session()
+        for query in session:
+            result = answer_query(
+                query,
+                "concise",
+                chat_model,
+                embed_client,
+                vectorstore,
+                web_search_fn=None,
+                compress=False,
+                prefetch=cache,
+            )
+            kind = "hit" if result["prefetch"]["hit"] else "miss"
+            retrieve_ms[kind].append(result["timings_ms"]["retrieve_ms"])
+            prefetcher.drain()  # the user reads the answer: idle time
+        cache.clear()
+
+    stats = prefetcher.stats()
+    turns = sum(len(s) for s in test)
+    print(f"{len(train)} training sessions, {len(test)} replayed ({turns} questions)")
+    print(
+        f"Hit rate: {stats['hit_rate']:.1%} of {stats['lookups']} lookups "
+        f"({stats['hits_exact']} exact, {stats['hits_similar']} similar)"
+    )
+    print(
+        f"Prefetched: {stats['prefetched']} questions in {stats['prefetch_ms']:.0f} ms; "
+        f"wasted: {stats['wasted']} ({stats['waste_rate']:.1%}, {stats['wasted_ms']:.0f} ms)"
+    )
+    for kind, values in retrieve_ms.items():
+        if values:
+            print(f"Retrieve stage on {kind}: mean {np.mean(values):.3f} ms over {len(values)} questions")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,229 @@
+# utils/profiling.py
+"""
+On-demand per-request profiling.
+
+Enable with PROFILE_ENABLED=true (sampled at PROFILE_SAMPLE_RATE), or force
+it for one request with answer_query(..., profile=True). Each profiled
+request writes to PROFILE_DIR:
+    <request_id>.prof      cProfile stats (load with pstats)
+    <request_id>.mem.txt   top tracemalloc allocations
+    <request_id>.json      label, duration, timestamp
+
+Aggregate dumps into a hot-function report:
+    python -m utils.profiling --dir profiles --top 20 --label answer_query
+"""
+
+from contextlib import contextmanager
+from typing import Callable, Dict, Iterator, List, Tuple
+import argparse
+import cProfile
+import functools
+import glob
+import json
+import os
+import pstats
+import random
+import sys
+import threading
+import time
+import tracemalloc
+import uuid
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '../..')))
+from config.config import get_config
+
+
+# cProfile and tracemalloc are process-wide in practice, so only one request
+# is profiled at a time; requests arriving meanwhile simply aren't profiled.
+_profile_lock = threading.Lock()
+_active = threading.local()
+
+
+@functools.lru_cache(maxsize=1)
+def _sampling() -> Tuple[bool, float]:
+    """
+    (PROFILE_ENABLED, PROFILE_SAMPLE_RATE), read once per process since
+    every @profiled call checks them (_sampling.cache_clear() re-reads).
+    """
+    config = get_config()
+    return config.get("PROFILE_ENABLED", False), config.get("PROFILE_SAMPLE_RATE", 0.1)
+
+
+def should_profile(flag: bool | None = None) -> bool:
+    """
+    Decide whether to profile a request.
+
+    flag=True/False forces the decision (request flag); flag=None samples
+    according to PROFILE_ENABLED / PROFILE_SAMPLE_RATE.
+    """
+    if flag is not None:
+        return flag
+
+    enabled, sample_rate = _sampling()
+    return enabled and random.random() < sample_rate
+
+
+def is_profiling() -> bool:
+    """
+    True if the current thread is inside profile_request.
+    """
+    return getattr(_active, "request_id", None) is not None
+
+
+@contextmanager
+def profile_request(
+    request_id: str,
+    label: str,
+    enabled: bool = True,
+) -> Iterator[Dict | None]:
+    """
+    Profile the enclosed block and write dumps keyed by request_id.
+
+    Yields a dict that is filled with the dump paths on exit, or None if
+    profiling is disabled, nested, or another request is being profiled.
+    """
+    if not enabled or is_profiling() or not _profile_lock.acquire(blocking=False):
+        yield None
+        return
+
+    config = get_config()
+    out_dir = config.get("PROFILE_DIR", "profiles")
+    top_n = config.get("PROFILE_TOP_ALLOCATIONS", 25)
+
+    info: Dict = {}
+    started_tracemalloc = not tracemalloc.is_tracing()
+    profiler = cProfile.Profile()
+    _active.request_id = request_id
+
+    try:
+        if started_tracemalloc:
+            tracemalloc.start()
+        start = time.perf_counter()
+        profiler.enable()
+        try:
+            yield info
+        finally:
+            profiler.disable()
+            duration = time.perf_counter() - start
+            snapshot = tracemalloc.take_snapshot()
+            if started_tracemalloc:
+                tracemalloc.stop()
+
+            try:
+                info.update(
+                    _write_dumps(out_dir, request_id, label, duration, profiler, snapshot, top_n)
+                )
+            except Exception as e:
+                print(f"[profile_request] Failed to write profile for {request_id}: {e}")
+    finally:
+        _active.request_id = None
+        _profile_lock.release()
+
+
+def _write_dumps(
+    out_dir: str,
+    request_id: str,
+    label: str,
+    duration: float,
+    profiler: cProfile.Profile,
+    snapshot: tracemalloc.Snapshot,
+    top_n: int,
+) -> Dict:
+    os.makedirs(out_dir, exist_ok=True)
+    base = os.path.join(out_dir, request_id)
+
+    profiler.dump_stats(base + ".prof")
+
+    top_stats = snapshot.filter_traces(
+        [tracemalloc.Filter(False, tracemalloc.__file__)]
+    ).statistics("lineno")[:top_n]
+    with open(base + ".mem.txt", "w", encoding="utf-8") as f:
+        for stat in top_stats:
+            f.write(f"{stat}\n")
+
+    with open(base + ".json", "w", encoding="utf-8") as f:
+        json.dump(
+            {
+                "request_id": request_id,
+                "label": label,
+                "duration_ms": duration * 1000,
+                "timestamp": time.time(),
+            },
+            f,
+        )
+
+    return {
+        "request_id": request_id,
+        "prof_path": base + ".prof",
+        "mem_path": base + ".mem.txt",
+        "duration_ms": duration * 1000,
+    }
+
+
+def profiled(label: str) -> Callable:
+    """
+    Decorator: sample-profile standalone calls of a function.
+
+    Calls made inside an already profiled request are not profiled again
+    (they show up in that request's dump instead).
+    """
+
+    def decorator(func: Callable) -> Callable:
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            if is_profiling() or not should_profile():
+                return func(*args, **kwargs)
+            request_id = f"{label}-{uuid.uuid4().hex[:12]}"
+            with profile_request(request_id, label):
+                return func(*args, **kwargs)
+
+        return wrapper
+
+    return decorator
+
+
+def hot_function_report(
+    profile_dir: str,
+    top: int = 20,
+    sort: str = "cumulative",
+    label: str | None = None,
+) -> pstats.Stats | None:
+    """
+    Merge all .prof dumps in profile_dir (optionally only those with the
+    given label) and print the top functions. Returns the merged Stats.
+    """
+    paths: List[str] = []
+    for prof_path in sorted(glob.glob(os.path.join(profile_dir, "*.prof"))):
+        if label:
+            meta_path = prof_path[: -len(".prof")] + ".json"
+            try:
+                with open(meta_path, "r", encoding="utf-8") as f:
+                    if json.load(f).get("label") != label:
+                        continue
+            except (OSError, ValueError):
+                continue
+        paths.append(prof_path)
+
+    if not paths:
+        print(f"No profile dumps found in {profile_dir}")
+        return None
+
+    stats = pstats.Stats(*paths)
+    print(f"Aggregated {len(paths)} profile(s) from {profile_dir}")
+    stats.strip_dirs().sort_stats(sort).print_stats(top)
+    return stats
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Aggregate per-request profile dumps.")
+    parser.add_argument("--dir", default=get_config().get("PROFILE_DIR", "profiles"))
+    parser.add_argument("--top", type=int, default=20)
+    parser.add_argument("--sort", default="cumulative", choices=["cumulative", "tottime", "ncalls"])
+    parser.add_argument("--label", default=None, help="only dumps with this label (e.g. answer_query)")
+    args = parser.parse_args()
+
+    hot_function_report(args.dir, top=args.top, sort=args.sort, label=args.label)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,233 @@
+# utils/projection.py
+"""
+Dimension reduction for two-stage search (coarse pass on reduced vectors,
+exact rescoring of the candidates).
+
+Choose PROJECTION_DIMS by measuring recall@k against exact search and the
+query time for each candidate number of dims on the docs' index:
+    python -m utils.projection --dims 16,32,64,128 --k 5
+    python -m utils.projection --method truncate --fake-embeddings
+"""
+
+from typing import Callable, Dict, List, Tuple
+import argparse
+import time
+
+import numpy as np
+
+
+def fit_projection(
+    embeddings: np.ndarray,
+    dims: int,
+    method: str = "pca",
+    candidates: int = 50,
+) -> Dict:
+    """
+    Fit a dimensionality reduction for two-stage search.
+
+    method:
+      - "pca": project onto the top `dims` principal components
+      - "truncate": keep the first `dims` coordinates (Matryoshka-style models)
+
+    Returns a projection dict that also holds the reduced document matrix:
+    {"method", "dims", "mean", "components", "reduced", "reduced_norms", "candidates"}
+    """
+    if method not in ("pca", "truncate"):
+        raise ValueError(f"Unknown projection method: {method}")
+
+    dims = max(1, min(dims, embeddings.shape[1]))
+    projection: Dict = {
+        "method": method,
+        "dims": dims,
+        "mean": None,
+        "components": None,
+        "candidates": candidates,
+    }
+
+    if method == "pca":
+        mean = embeddings.mean(axis=0)
+        centered = embeddings - mean
+        # Eigen-decomposition of the (dim x dim) covariance is cheap for
+        # 384-d vectors, whatever the number of rows.
+        cov = centered.T @ centered
+        eigvals, eigvecs = np.linalg.eigh(cov)
+        order = np.argsort(eigvals)[::-1][:dims]
+        projection["mean"] = mean.astype("float32")
+        projection["components"] = np.ascontiguousarray(eigvecs[:, order], dtype="float32")
+
+    reduced = project(projection, embeddings)
+    projection["reduced"] = reduced
+    projection["reduced_norms"] = np.linalg.norm(reduced, axis=1) + 1e-8
+    return projection
+
+
+def project(projection: Dict, vectors: np.ndarray) -> np.ndarray:
+    """
+    Apply a fitted projection to a vector [dim] or matrix [n, dim].
+    """
+    if projection["method"] == "truncate":
+        return np.ascontiguousarray(vectors[..., : projection["dims"]], dtype="float32")
+    return ((vectors - projection["mean"]) @ projection["components"]).astype("float32")
+
+
+def two_stage_search(
+    query_vec: np.ndarray,
+    embeddings: np.ndarray | Callable[[np.ndarray], np.ndarray],
+    projection: Dict,
+    top_k: int,
+    rows: np.ndarray | None = None,
+    candidates: int | None = None,
+) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Coarse pass on the reduced matrix, then exact cosine rescoring of the
+    best `candidates` rows against the full vectors.
+
+    embeddings: the full matrix, or a function returning the given rows
+    (e.g. VectorStore.take), so only the candidates are read.
+    rows: optional row indices to restrict the search to.
+    Returns (indices, exact_scores), sorted by descending score.
+    """
+    candidates = max(top_k, candidates or projection["candidates"])
+
+    q_red = project(projection, query_vec)
+    reduced = projection["reduced"]
+    norms = projection["reduced_norms"]
+    if rows is not None:
+        reduced, norms = reduced[rows], norms[rows]
+
+    coarse = reduced @ q_red / (norms * (np.linalg.norm(q_red) + 1e-8))
+    if candidates < len(coarse):
+        cand = np.argpartition(-coarse, candidates)[:candidates]
+    else:
+        cand = np.arange(len(coarse))
+    if rows is not None:
+        cand = rows[cand]
+
+    full = embeddings(cand) if callable(embeddings) else embeddings[cand]
+    exact = full @ query_vec / (
+        (np.linalg.norm(full, axis=1) + 1e-8) * (np.linalg.norm(query_vec) + 1e-8)
+    )
+    order = np.argsort(-exact)[:top_k]
+    return cand[order], exact[order]
+
+
+def recall_at_k(
+    embeddings: np.ndarray,
+    projection: Dict,
+    query_vecs: np.ndarray,
+    k: int = 5,
+    candidates: int | None = None,
+) -> float:
+    """
+    Mean fraction of the exact top-k that the two-stage search also returns.
+    """
+    doc_norms = np.linalg.norm(embeddings, axis=1) + 1e-8
+    hits = 0
+    for q in query_vecs:
+        exact = embeddings @ q / (doc_norms * (np.linalg.norm(q) + 1e-8))
+        truth = set(np.argsort(-exact)[:k].tolist())
+        found, _ = two_stage_search(q, embeddings, projection, k, candidates=candidates)
+        hits += len(truth & set(found.tolist()))
+    return hits / (len(query_vecs) * min(k, len(embeddings))) if len(query_vecs) else 0.0
+
+
+def sweep_projection_dims(
+    embeddings: np.ndarray,
+    dims_list: List[int],
+    query_vecs: np.ndarray | None = None,
+    method: str = "pca",
+    k: int = 5,
+    candidates: int = 50,
+    num_queries: int = 100,
+    seed: int = 0,
+) -> List[Dict]:
+    """
+    Recall@k and mean query time for each candidate number of dims.
+
+    Without query_vecs, a random sample of the document vectors is used
+    as queries (each should find itself and its neighbours).
+    """
+    if query_vecs is None:
+        rng = np.random.RandomState(seed)
+        sample = rng.choice(len(embeddings), size=min(num_queries, len(embeddings)), replace=False)
+        query_vecs = embeddings[sample]
+
+    results: List[Dict] = []
+    for dims in dims_list:
+        projection = fit_projection(embeddings, dims, method=method, candidates=candidates)
+
+        start = time.perf_counter()
+        for q in query_vecs:
+            two_stage_search(q, embeddings, projection, k)
+        query_ms = (time.perf_counter() - start) * 1000 / max(1, len(query_vecs))
+
+        results.append(
+            {
+                "dims": projection["dims"],
+                "recall_at_k": recall_at_k(embeddings, projection, query_vecs, k=k),
+                "query_ms": query_ms,
+                "reduced_bytes": projection["reduced"].nbytes,
+            }
+        )
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Recall@k and latency of two-stage search per dims.")
+    parser.add_argument("--docs-dir", default="data/docs")
+    parser.add_argument("--dims", default="16,32,64,128", help="reduced dims to try")
+    parser.add_argument("--method", default="pca", choices=["pca", "truncate"])
+    parser.add_argument("--k", type=int, default=5)
+    parser.add_argument("--candidates", type=int, default=50, help="rows rescored exactly")
+    parser.add_argument("--queries", type=int, default=100, help="document vectors sampled as queries")
+    parser.add_argument("--fake-embeddings", action="store_true", help="use the hashing fake embedder")
+    args = parser.parse_args()
+
+    from utils.index_manager import index_build_kwargs
+    from utils.rag import build_knowledge_base
+
+    if args.fake_embeddings:
+        from models.fakes import FakeEmbeddingClient
+
+        embed_client = FakeEmbeddingClient()
+    else:
+        from models.embeddings import create_embedding_client
+
+        embed_client = create_embedding_client()
+
+    build_kwargs = dict(index_build_kwargs(), projection_dims=0)
+    vectorstore = build_knowledge_base(args.docs_dir, embed_client, **build_kwargs)
+    _, embeddings = vectorstore["store"].vectors()
+
+    rng = np.random.RandomState(0)
+    sample = rng.choice(len(embeddings), size=min(args.queries, len(embeddings)), replace=False)
+    query_vecs = embeddings[sample]
+
+    doc_norms = np.linalg.norm(embeddings, axis=1) + 1e-8
+    start = time.perf_counter()
+    for q in query_vecs:
+        np.argsort(-(embeddings @ q / (doc_norms * (np.linalg.norm(q) + 1e-8))))[: args.k]
+    exact_ms = (time.perf_counter() - start) * 1000 / max(1, len(query_vecs))
+
+    dims_list = [int(d) for d in args.dims.split(",") if d.strip()]
+    rows = sweep_projection_dims(
+        embeddings,
+        dims_list,
+        query_vecs=query_vecs,
+        method=args.method,
+        k=args.k,
+        candidates=args.candidates,
+    )
+
+    print(f"{len(embeddings)} chunks x {embeddings.shape[1]} dims, {len(query_vecs)} queries, {args.method}")
+    print(f"{'dims':>6}{'recall@' + str(args.k):>11}{'query ms':>10}{'reduced KB':>12}")
+    print(f"{'exact':>6}{1.0:>11.3f}{exact_ms:>10.3f}{embeddings.nbytes / 1024:>12.1f}")
+    for r in rows:
+        print(
+            f"{r['dims']:>6}{r['recall_at_k']:>11.3f}{r['query_ms']:>10.3f}"
+            f"{r['reduced_bytes'] / 1024:>12.1f}"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -1,10 +1,69 @@
 # utils/rag.py
 
+import datetime
+import json
 import os
+import time
+import uuid
 from typing import List, Dict, Tuple
 
 import numpy as np
-from models.embeddings import EmbeddingClient
+from config.config import get_config
+from models.embeddings import EmbeddingBackend
+from utils.chunk_table import ChunkTable
+from utils.chunking import cdc_spans, chunk_key
+from utils.dedup import chunk_fingerprints, dedup_report, find_duplicates
+from utils.profiling import profiled
+from utils.projection import fit_projection, two_stage_search
+from utils.shards import ShardedIndex
+from utils.vector_store import create_store
+
+
+# Optional per-directory metadata file:
+# {"pricing.txt": {"tags": ["billing"], "date": "2024-05-01"}, ...}
+METADATA_FILE = "metadata.json"
+
+
+def load_metadata(docs_dir: str) -> Dict:
+    """
+    Read docs_dir/metadata.json if present, else return {}.
+    """
+    meta_path = os.path.join(docs_dir, METADATA_FILE)
+    if not os.path.isfile(meta_path):
+        return {}
+
+    try:
+        with open(meta_path, "r", encoding="utf-8") as f:
+            return json.load(f)
+    except Exception as e:
+        print(f"[load_documents] Failed to read {meta_path}: {e}")
+        return {}
+
+
+def load_document(docs_dir: str, fname: str, metadata: Dict) -> Dict | None:
+    """
+    Load a single .txt file from docs_dir (see load_documents for the shape).
+    Returns None if the file can't be read.
+    """
+    path = os.path.join(docs_dir, fname)
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            text = f.read()
+        mtime = datetime.date.fromtimestamp(os.path.getmtime(path))
+    except Exception as e:
+        # Skip files that can’t be read
+        print(f"[load_documents] Failed to read {path}: {e}")
+        return None
+
+    meta = metadata.get(fname, {})
+
+    return {
+        "id": fname,
+        "text": text,
+        "source": fname,
+        "tags": list(meta.get("tags", [os.path.splitext(fname)[0]])),
+        "date": meta.get("date", mtime.isoformat()),
+    }
 
 
 def load_documents(docs_dir: str) -> List[Dict]:
@@ -13,39 +72,53 @@ def load_documents(docs_dir: str) -> List[Dict]:
 
     Returns a list of dicts:
     [
-      {"id": "faq.txt", "text": "...full text...", "source": "faq.txt"},
+      {"id": "faq.txt", "text": "...full text...", "source": "faq.txt",
+       "tags": ["faq"], "date": "2024-05-01"},
       ...
     ]
+
+    Tags and date come from docs_dir/metadata.json when present; otherwise
+    tags default to the file stem and date to the file's modification date.
     """
     docs: List[Dict] = []
 
     if not os.path.isdir(docs_dir):
         raise FileNotFoundError(f"Docs directory not found: {docs_dir}")
 
+    metadata = load_metadata(docs_dir)
+
     for fname in os.listdir(docs_dir):
         if not fname.lower().endswith(".txt"):
             continue
 
-        path = os.path.join(docs_dir, fname)
-        try:
-            with open(path, "r", encoding="utf-8") as f:
-                text = f.read()
-        except Exception as e:
-            # Skip files that can’t be read
-            print(f"[load_documents] Failed to read {path}: {e}")
-            continue
-
-        docs.append(
-            {
-                "id": fname,
-                "text": text,
-                "source": fname,
-            }
-        )
+        doc = load_document(docs_dir, fname, metadata)
+        if doc is not None:
+            docs.append(doc)
 
     return docs
 
 
+def chunk_spans(
+    text: str, chunk_size: int = 800, overlap: int = 200
+) -> List[Tuple[int, int]]:
+    """
+    (start, end) character spans of the chunks produced by chunk_text.
+    """
+    spans: List[Tuple[int, int]] = []
+    if not text:
+        return spans
+
+    start = 0
+    n = len(text)
+
+    while start < n:
+        spans.append((start, min(start + chunk_size, n)))
+        # move start forward but keep overlap with previous chunk
+        start += chunk_size - overlap
+
+    return spans
+
+
 def chunk_text(
     text: str, chunk_size: int = 800, overlap: int = 200
 ) -> List[str]:
@@ -57,66 +130,393 @@ def chunk_text(
 
     Returns a list of text chunks.
     """
-    chunks: List[str] = []
-    if not text:
-        return chunks
+    return [text[start:end] for start, end in chunk_spans(text, chunk_size, overlap)]
 
-    start = 0
-    n = len(text)
 
-    while start < n:
-        end = start + chunk_size
-        chunk = text[start:end]
-        chunks.append(chunk)
-        # move start forward but keep overlap with previous chunk
-        start += chunk_size - overlap
+# "fixed": chunk_spans (fixed offsets with overlap)
+# "cdc": content-defined chunks (see utils.chunking), stable under local edits
+CHUNKERS = {"fixed": chunk_spans, "cdc": cdc_spans}
 
-    return chunks
+
+def document_spans(
+    text: str, chunking: str | None = None, chunk_options: Dict | None = None
+) -> List[Tuple[int, int]]:
+    """
+    Chunk spans of a document with the given chunking strategy (default:
+    the CHUNKING config setting). chunk_options are passed to the chunker,
+    e.g. {"chunk_size": 600, "overlap": 100} for "fixed" or {"min_size": 200}
+    for "cdc".
+    """
+    chunking = chunking or get_config()["CHUNKING"]
+    if chunking not in CHUNKERS:
+        raise ValueError(f"Unknown chunking: {chunking} (choose from {', '.join(CHUNKERS)})")
+    return CHUNKERS[chunking](text, **(chunk_options or {}))
 
 
 def build_knowledge_base(
     docs_dir: str,
-    embed_client: EmbeddingClient,
+    embed_client: EmbeddingBackend,
+    num_shards: int = 0,
+    dedup: bool = False,
+    projection_dims: int = 0,
+    projection_method: str = "pca",
+    store_backend: str = "numpy",
+    store_dir: str | None = None,
+    chunking: str | None = None,
+    chunk_options: Dict | None = None,
 ) -> Dict:
     """
-    Build an in-memory 'vector store' from all docs in docs_dir.
+    Build a 'vector store' from all docs in docs_dir.
 
     Returns a dict:
     {
-        "embeddings": np.ndarray [num_chunks, dim],
-        "chunks": [
-            {"text": "...", "source": "faq.txt"},
-            ...
-        ]
+        "store": VectorStore,  # embeddings, id = chunk row (see utils.vector_store)
+        "chunks": ChunkTable,  # chunks[i] -> {"text": "...", "source": "faq.txt"}
+        "postings": {...},     # see build_postings
+        "version": 1,
+        "built_at": 1700000000.0,
+        "dedup_report": {...},  # see assemble_vectorstore
     }
+
+    With dedup=True, exact and near-duplicate chunks are embedded and
+    stored once; chunks[i]["sources"] lists every source they occur in.
+
+    With projection_dims > 0, a PCA (or truncation) projection is fitted and
+    stored as "projection"; queries then do a fast pass on the reduced
+    matrix and rescore a small candidate set exactly (see utils.projection).
+
+    store_backend selects the storage engine ("numpy", "mmap", "sqlite");
+    on-disk backends write under store_dir (a temp dir / memory if None).
+
+    chunking selects how documents are split (see CHUNKERS; None = the
+    CHUNKING config setting), with chunk_options overriding the chunker's size parameters.
+
+    With num_shards > 0, the embeddings are partitioned across that many
+    worker processes instead, and "store" is replaced by
+    "shards": ShardedIndex (call vectorstore["shards"].close() when done).
     """
     docs = load_documents(docs_dir)
+    embed_stats: Dict = {}
+    segments = embed_document_segments(
+        docs,
+        embed_client,
+        dedup=dedup,
+        stats=embed_stats,
+        chunking=chunking,
+        chunk_options=chunk_options,
+    )
+
+    if not any(seg["spans"] for seg in segments):
+        raise ValueError(f"No chunks created from docs in: {docs_dir}")
 
-    chunks: List[Dict] = []
-    for d in docs:
-        for ch in chunk_text(d["text"]):
-            chunks.append(
-                {
-                    "text": ch,
-                    "source": d["source"],
-                }
-            )
+    vectorstore = assemble_vectorstore(
+        segments,
+        num_shards=num_shards,
+        dedup=dedup,
+        projection_dims=projection_dims,
+        projection_method=projection_method,
+        store_backend=store_backend,
+        store_dir=store_dir,
+    )
+    vectorstore["dedup_report"].update(embed_stats)
+    return vectorstore
 
-    if not chunks:
-        raise ValueError(f"No chunks created from docs in: {docs_dir}")
 
-    texts = [c["text"] for c in chunks]
-    embeddings_list = embed_client.embed_documents(texts)  # List[List[float]]
+def embed_document_segments(
+    docs: List[Dict],
+    embed_client: EmbeddingBackend,
+    dedup: bool = False,
+    stats: Dict | None = None,
+    chunking: str | None = None,
+    reuse: Dict[bytes, np.ndarray] | None = None,
+    chunk_options: Dict | None = None,
+    spans_per_doc: List[List[Tuple[int, int]]] | None = None,
+) -> List[Dict]:
+    """
+    Chunk and embed documents, keeping each document's chunks separate.
+
+    All chunks are embedded in a single batch. Returns one segment per doc:
+    {"doc": {...}, "spans": [(start, end), ...], "embeddings": np.ndarray [n, dim],
+     "hashes": [...], "signatures": np.ndarray [n, NUM_PERM]}
+
+    With dedup=True, duplicate chunks (see utils.dedup) are embedded once
+    and their vector is reused. reuse maps chunk_key(text) to a vector
+    embedded earlier (see segment_embeddings_by_key); chunks found there
+    are not embedded again. stats, if given, receives embedding counts
+    and timings. spans_per_doc, if given, holds each doc's spans from
+    document_spans, so the docs aren't chunked again.
+    """
+    if spans_per_doc is None:
+        spans_per_doc = [document_spans(d["text"], chunking, chunk_options) for d in docs]
+    texts = [
+        d["text"][start:end]
+        for d, spans in zip(docs, spans_per_doc)
+        for start, end in spans
+    ]
+
+    if dedup:
+        hashes, signatures = chunk_fingerprints(texts)
+        rep, _ = find_duplicates(hashes, signatures)
+    else:
+        hashes, signatures = None, None
+        rep = np.arange(len(texts))
+    unique_rows = np.flatnonzero(rep == np.arange(len(texts)))
+
+    reused = np.zeros(len(unique_rows), dtype=bool)
+    if reuse:
+        keys = [chunk_key(texts[i]) for i in unique_rows]
+        reused = np.array([k in reuse for k in keys], dtype=bool)
+
+    t_embed = time.perf_counter()
+    embeddings_list = embed_client.embed_documents(
+        [texts[i] for i in unique_rows[~reused]]
+    )  # List[List[float]]
+    embed_seconds = time.perf_counter() - t_embed
 
     embeddings = np.array(embeddings_list, dtype="float32")
+    if reused.any():
+        vectors = [reuse[k] for k, hit in zip(keys, reused) if hit]
+        unique_embeddings = np.empty((len(unique_rows), len(vectors[0])), dtype="float32")
+        unique_embeddings[reused] = vectors
+        unique_embeddings[~reused] = embeddings.reshape(-1, len(vectors[0]))
+        embeddings = unique_embeddings
+    if not texts:
+        embeddings = embeddings.reshape(0, 0)
+    else:
+        # Duplicates share their representative's vector
+        embeddings = embeddings[np.searchsorted(unique_rows, rep)]
+    del texts
+
+    if stats is not None:
+        skipped = len(rep) - len(unique_rows)
+        num_reused = int(reused.sum())
+        num_embedded = len(unique_rows) - num_reused
+        per_chunk = embed_seconds / num_embedded if num_embedded else 0.0
+        stats.update(
+            {
+                "chunks_embedded": num_embedded,
+                "chunks_reused": num_reused,
+                "embeddings_skipped": int(skipped),
+                "embed_seconds": embed_seconds,
+                "est_embed_seconds_saved": per_chunk * (skipped + num_reused),
+            }
+        )
+
+    segments: List[Dict] = []
+    row = 0
+    for d, spans in zip(docs, spans_per_doc):
+        rows = slice(row, row + len(spans))
+        segments.append(
+            {
+                "doc": d,
+                "spans": spans,
+                "embeddings": embeddings[rows],
+                "hashes": hashes[rows] if dedup else None,
+                "signatures": signatures[rows] if dedup else None,
+            }
+        )
+        row += len(spans)
+
+    return segments
+
+
+def segment_embeddings_by_key(segments: List[Dict]) -> Dict[bytes, np.ndarray]:
+    """
+    chunk_key(chunk text) -> embedding for every chunk of the segments,
+    for passing as `reuse` to embed_document_segments.
+    """
+    vectors: Dict[bytes, np.ndarray] = {}
+    for seg in segments:
+        text = seg["doc"]["text"]
+        for (start, end), vec in zip(seg["spans"], seg["embeddings"]):
+            vectors[chunk_key(text[start:end])] = vec
+    return vectors
+
+
+def assemble_vectorstore(
+    segments: List[Dict],
+    num_shards: int = 0,
+    version: int = 1,
+    dedup: bool = False,
+    projection_dims: int = 0,
+    projection_method: str = "pca",
+    store_backend: str = "numpy",
+    store_dir: str | None = None,
+) -> Dict:
+    """
+    Build the vectorstore dict (see build_knowledge_base) from per-document
+    segments, e.g. a mix of freshly embedded and reused ones.
+
+    Also records "version" and "built_at" (unix time) for staleness reporting.
+
+    With dedup=True (and fingerprints in the segments), duplicate chunks
+    across all segments are stored once, keeping every source as
+    provenance. "dedup_report" holds the counts and bytes saved.
+
+    projection_dims > 0 adds a "projection" for two-stage search
+    (ignored for sharded stores).
+
+    Each build gets its own store; on-disk backends write to a new
+    "<backend>-v<version>-<id>" path under store_dir, so a store that is
+    still being searched is never overwritten.
+    """
+    segments = [seg for seg in segments if seg["spans"]]
+    if not segments:
+        raise ValueError("No chunks to index.")
+
+    docs = [seg["doc"] for seg in segments]
+    chunks = ChunkTable.from_documents(docs, [seg["spans"] for seg in segments])
+    embeddings = np.ascontiguousarray(
+        np.vstack([seg["embeddings"] for seg in segments]), dtype="float32"
+    )
+
+    report: Dict = {}
+    prov_rows = prov_doc_ids = None
+    if dedup and all(seg.get("signatures") is not None for seg in segments):
+        hashes = [h for seg in segments for h in seg["hashes"]]
+        rep, is_exact = find_duplicates(
+            hashes, np.vstack([seg["signatures"] for seg in segments])
+        )
+        keep = np.flatnonzero(rep == np.arange(len(rep)))
+
+        # Duplicate rows from other documents become provenance of their
+        # representative's new row number
+        dup = np.flatnonzero(rep != np.arange(len(rep)))
+        dup = dup[chunks.doc_ids[dup] != chunks.doc_ids[rep[dup]]]
+        pairs = np.unique(
+            np.stack([np.searchsorted(keep, rep[dup]), chunks.doc_ids[dup]], axis=1),
+            axis=0,
+        ).reshape(-1, 2)
+        prov_rows, prov_doc_ids = pairs[:, 0], pairs[:, 1]
+
+        report = dedup_report(rep, is_exact)
+        report["matrix_bytes_saved"] = int((len(rep) - len(keep)) * embeddings.shape[1] * 4)
+
+        chunks = chunks.take(keep, prov_rows, prov_doc_ids)
+        embeddings = np.ascontiguousarray(embeddings[keep])
+
+    postings = build_postings(docs, chunks.doc_ids, chunks.prov_rows, chunks.prov_doc_ids)
 
     vectorstore = {
-        "embeddings": embeddings,
         "chunks": chunks,
+        "postings": postings,
+        "version": version,
+        "built_at": time.time(),
+        "dedup_report": report,
     }
+
+    if num_shards > 0:
+        vectorstore["shards"] = ShardedIndex(embeddings, num_shards)
+    else:
+        path = None
+        if store_dir and store_backend != "numpy":
+            os.makedirs(store_dir, exist_ok=True)
+            path = os.path.join(store_dir, f"{store_backend}-v{version}-{uuid.uuid4().hex[:8]}")
+            if store_backend == "sqlite":
+                path += ".sqlite"
+        store = create_store(store_backend, embeddings.shape[1], path)
+        store.add(np.arange(len(embeddings)), embeddings)
+        vectorstore["store"] = store
+        if projection_dims > 0:
+            vectorstore["projection"] = fit_projection(
+                embeddings, projection_dims, method=projection_method
+            )
     return vectorstore
 
 
+def build_postings(
+    docs: List[Dict],
+    doc_ids: np.ndarray,
+    prov_rows: np.ndarray | None = None,
+    prov_doc_ids: np.ndarray | None = None,
+) -> Dict[str, Dict[str, np.ndarray]]:
+    """
+    Precompute row-index postings per metadata value.
+
+    doc_ids[i] is the index (into docs) of the parent document of chunk row i.
+    prov_rows / prov_doc_ids add extra (row, document) pairs, e.g. for
+    deduplicated chunks that also occur in other documents.
+
+    Returns:
+    {
+      "source": {"faq.txt": array([0, 1]), ...},
+      "tags":   {"billing": array([3, 4, 5]), ...},
+      "date":   {"2024-05-01": array([...]), ...},
+    }
+    """
+    rows = np.arange(len(doc_ids), dtype=np.int64)
+    if prov_rows is not None and len(prov_rows):
+        rows = np.concatenate([rows, np.asarray(prov_rows, dtype=np.int64)])
+        doc_ids = np.concatenate([doc_ids, prov_doc_ids])
+
+    # Rows of each document, grouped with one stable sort
+    order = np.argsort(doc_ids, kind="stable")
+    counts = np.bincount(doc_ids, minlength=len(docs))
+    rows_per_doc = np.split(rows[order], np.cumsum(counts)[:-1])
+
+    lists: Dict[str, Dict[str, List[np.ndarray]]] = {"source": {}, "tags": {}, "date": {}}
+
+    for d, rows in zip(docs, rows_per_doc):
+        lists["source"].setdefault(d["source"], []).append(rows)
+        lists["date"].setdefault(d["date"], []).append(rows)
+        for tag in d["tags"]:
+            lists["tags"].setdefault(tag, []).append(rows)
+
+    return {
+        field: {value: np.unique(np.concatenate(parts)) for value, parts in values.items()}
+        for field, values in lists.items()
+    }
+
+
+def _as_list(value) -> List[str]:
+    if value is None:
+        return []
+    if isinstance(value, str):
+        return [value]
+    return list(value)
+
+
+def resolve_filter_rows(postings: Dict, filters: Dict | None) -> np.ndarray | None:
+    """
+    Turn a filter into the sorted row indices that match it, using postings.
+
+    filters: {"source": str | [str], "tags": str | [str],
+              "date_from": "YYYY-MM-DD", "date_to": "YYYY-MM-DD"}
+    Values within a field are OR-ed, fields are AND-ed.
+    Returns None when there is no filter.
+    """
+    if not filters:
+        return None
+
+    selected: List[np.ndarray] = []
+
+    for field in ("source", "tags"):
+        values = _as_list(filters.get(field))
+        if values:
+            parts = [postings[field].get(v, np.empty(0, dtype=np.int64)) for v in values]
+            selected.append(np.unique(np.concatenate(parts)))
+
+    date_from = filters.get("date_from")
+    date_to = filters.get("date_to")
+    if date_from or date_to:
+        parts = [
+            rows
+            for date, rows in postings["date"].items()
+            if (not date_from or date >= date_from) and (not date_to or date <= date_to)
+        ]
+        selected.append(
+            np.unique(np.concatenate(parts)) if parts else np.empty(0, dtype=np.int64)
+        )
+
+    if not selected:
+        return None
+
+    rows = selected[0]
+    for other in selected[1:]:
+        rows = np.intersect1d(rows, other, assume_unique=True)
+    return rows
+
+
 def cosine_similarity_matrix(
     query_vec: np.ndarray, doc_matrix: np.ndarray
 ) -> np.ndarray:
@@ -134,49 +534,157 @@ def cosine_similarity_matrix(
     return sims
 
 
+def pin_vectorstore(vectorstore: Dict) -> bool:
+    """
+    Pin vectorstore's store for the caller's reads (see VectorStore.acquire),
+    so a rebuild or eviction that replaces it meanwhile closes it only after
+    unpin_vectorstore(). False if it has been retired and closed already:
+    look up the current vectorstore and pin that one.
+    """
+    store = vectorstore.get("store")
+    return store is None or store.acquire()
+
+
+def unpin_vectorstore(vectorstore: Dict) -> None:
+    store = vectorstore.get("store")
+    if store is not None:
+        store.release()
+
+
+def _check_vectorstore(vectorstore: Dict) -> None:
+    if not vectorstore or (
+        "store" not in vectorstore and "shards" not in vectorstore
+    ):
+        raise ValueError("Vectorstore is empty or not built.")
+
+
+def search_vectorstore(
+    q_vec: np.ndarray,
+    vectorstore: Dict,
+    top_k: int = 5,
+    filters: Dict | None = None,
+) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Top-k search for an already embedded query.
+    Returns (row_indices, scores), sorted by descending score.
+    """
+    rows = resolve_filter_rows(vectorstore.get("postings", {}), filters)
+    if rows is not None and len(rows) == 0:
+        return np.empty(0, dtype=np.int64), np.empty(0, dtype=np.float32)
+
+    if "shards" in vectorstore:
+        # Scatter-gather across worker processes (shards score only `rows`)
+        return vectorstore["shards"].search(q_vec, top_k, rows=rows)
+
+    store = vectorstore["store"]
+    if "projection" in vectorstore:
+        # Coarse pass on reduced vectors, exact rescoring of the candidates.
+        # Built stores have dense ids, so reduced rows are store ids and only
+        # the candidates' full vectors are read.
+        return two_stage_search(q_vec, store.take, vectorstore["projection"], top_k, rows=rows)
+
+    # The store pre- or post-filters depending on selectivity (see VectorStore.search_batch)
+    return store.search(q_vec, top_k, rows=rows)
+
+
+def _materialize(vectorstore: Dict, top_idx: np.ndarray, top_scores: np.ndarray) -> List[Dict]:
+    results: List[Dict] = []
+    for idx, score in zip(top_idx, top_scores):
+        chunk = vectorstore["chunks"][int(idx)]
+        score = float(score)
+        results.append(
+            {
+                "text": chunk["text"],
+                "source": chunk["source"],
+                "sources": chunk["sources"],
+                "score": score,
+            }
+        )
+
+    return results
+
+
+@profiled("retrieve_relevant_chunks")
 def retrieve_relevant_chunks(
     query: str,
-    embed_client: EmbeddingClient,
+    embed_client: EmbeddingBackend,
     vectorstore: Dict,
     top_k: int = 5,
+    filters: Dict | None = None,
+    query_vec: np.ndarray | None = None,
 ) -> List[Dict]:
     """
     Given a user query and a vectorstore, return top_k most similar chunks.
 
+    filters (optional) restricts the search to chunks whose source, tags or
+    document date match, e.g. {"source": ["pricing.txt"]}.
+    See resolve_filter_rows for the format.
+
+    query_vec (optional) is the query's embedding, if the caller already
+    has it; the query is then not embedded again.
+
     Returns:
     [
-      {"text": "...chunk...", "source": "faq.txt", "score": 0.83},
+      {"text": "...chunk...", "source": "faq.txt", "sources": ["faq.txt"], "score": 0.83},
       ...
     ]
     """
     if not query:
         return []
 
-    if not vectorstore or "embeddings" not in vectorstore:
-        raise ValueError("Vectorstore is empty or not built.")
+    _check_vectorstore(vectorstore)
 
-    q_emb_list = embed_client.embed_query(query)
-    if not q_emb_list:
-        return []
+    if query_vec is not None:
+        q_vec = np.asarray(query_vec, dtype="float32")
+    else:
+        q_emb_list = embed_client.embed_query(query)
+        if not q_emb_list:
+            return []
+        q_vec = np.array(q_emb_list, dtype="float32")
 
-    q_vec = np.array(q_emb_list, dtype="float32")
-    doc_matrix = vectorstore["embeddings"]  # shape: (num_chunks, dim)
+    top_idx, top_scores = search_vectorstore(q_vec, vectorstore, top_k, filters)
+    return _materialize(vectorstore, top_idx, top_scores)
 
-    sims = cosine_similarity_matrix(q_vec, doc_matrix)
-    # Indices of top_k scores, sorted descending
-    top_idx = np.argsort(-sims)[:top_k]
 
-    results: List[Dict] = []
-    for idx in top_idx:
-        chunk = vectorstore["chunks"][int(idx)]
-        score = float(sims[int(idx)])
-        results.append(
-            {
-                "text": chunk["text"],
-                "source": chunk["source"],
-                "score": score,
-            }
+def retrieve_relevant_chunks_batch(
+    queries: List[str],
+    embed_client: EmbeddingBackend,
+    vectorstore: Dict,
+    top_k: int = 5,
+    filters: Dict | None = None,
+    query_vecs: np.ndarray | None = None,
+) -> List[List[Dict]]:
+    """
+    Batched retrieve_relevant_chunks: one embedding call for all queries and,
+    unless sharded or two-stage, one matrix-matrix product.
+
+    query_vecs (optional) are the queries' embeddings, one row per query,
+    if the caller already has them.
+
+    Returns one result list per query (empty for empty queries).
+    """
+    _check_vectorstore(vectorstore)
+
+    positions = [i for i, q in enumerate(queries) if q]
+    results: List[List[Dict]] = [[] for _ in queries]
+    if not positions:
+        return results
+
+    if query_vecs is not None:
+        q_matrix = np.asarray(query_vecs, dtype="float32")[positions]
+    else:
+        q_matrix = np.array(
+            embed_client.embed_documents([queries[i] for i in positions]), dtype="float32"
         )
 
-    return results
+    if "store" in vectorstore and "projection" not in vectorstore:
+        rows = resolve_filter_rows(vectorstore.get("postings", {}), filters)
+        found = vectorstore["store"].search_batch(q_matrix, top_k, rows=rows)
+        for pos, (top_idx, top_scores) in zip(positions, found):
+            results[pos] = _materialize(vectorstore, top_idx, top_scores)
+        return results
 
+    for pos, q_vec in zip(positions, q_matrix):
+        top_idx, top_scores = search_vectorstore(q_vec, vectorstore, top_k, filters)
+        results[pos] = _materialize(vectorstore, top_idx, top_scores)
+    return results
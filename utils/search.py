@@ -8,6 +8,7 @@ from tavily import TavilyClient
 
 sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '../..')))
 from config.config import get_config
+from utils.deadline import DeadlineExceeded, is_timeout
 
 
 def _get_tavily_client() -> TavilyClient | None:
@@ -30,7 +31,7 @@ def _get_tavily_client() -> TavilyClient | None:
         return None
 
 
-def web_search(query: str, k: int = 3) -> List[Dict]:
+def web_search(query: str, k: int = 3, timeout_s: float | None = None) -> List[Dict]:
     """
     Perform a web search and return a normalized list of results:
 
@@ -38,6 +39,9 @@ def web_search(query: str, k: int = 3) -> List[Dict]:
       {"title": "...", "snippet": "...", "url": "..."},
       ...
     ]
+
+    timeout_s is passed to Tavily as the request timeout; a search that
+    runs over it raises DeadlineExceeded (other errors return []).
     """
     if not query:
         return []
@@ -48,13 +52,17 @@ def web_search(query: str, k: int = 3) -> List[Dict]:
         print("[web_search] No Tavily API key configured.")
         return []
 
+    options = {"timeout": timeout_s} if timeout_s is not None else {}
     try:
         response = client.search(
             query=query,
             max_results=k,
             search_depth="basic",  # good enough for our use case
+            **options,
         )
     except Exception as e:
+        if timeout_s is not None and is_timeout(e):
+            raise DeadlineExceeded(f"web search timed out after {timeout_s * 1000:.0f} ms") from e
         print(f"[web_search] Tavily search error: {e}")
         return []
 
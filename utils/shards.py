@@ -0,0 +1,307 @@
+# utils/shards.py
+
+from typing import Dict, List, Tuple
+import itertools
+import multiprocessing as mp
+import threading
+import time
+
+import numpy as np
+
+
+def _local_top_k(sims: np.ndarray, top_k: int) -> np.ndarray:
+    """
+    Indices of the top_k largest scores, sorted descending.
+    """
+    if top_k >= len(sims):
+        return np.argsort(-sims)
+    part = np.argpartition(-sims, top_k)[:top_k]
+    return part[np.argsort(-sims[part])]
+
+
+# Longest a search waits for every shard's reply (a hung worker)
+SHARD_TIMEOUT_S = 5.0
+
+
+class ShardWorkerError(RuntimeError):
+    """
+    A shard could not answer: its worker process exited or did not reply
+    in time, the query failed in it, or the index was closed.
+    """
+
+
+def _shard_worker(conn, embeddings: np.ndarray) -> None:
+    """
+    Worker process loop: owns one slice of the embeddings matrix.
+
+    Receives (request_id, query_vec, top_k, local_rows | None), replies with
+    (request_id, local_indices, scores, elapsed_seconds, error | None).
+    None shuts the worker down.
+    """
+    doc_norms = np.linalg.norm(embeddings, axis=1) + 1e-8
+
+    while True:
+        msg = conn.recv()
+        if msg is None:
+            break
+
+        request_id, q_vec, top_k, rows = msg
+        start = time.perf_counter()
+        try:
+            q_norm = np.linalg.norm(q_vec)
+            if rows is None:
+                sims = embeddings @ q_vec / (q_norm * doc_norms + 1e-8)
+                idx = _local_top_k(sims, top_k)
+                scores = sims[idx]
+            elif len(rows):
+                sims = embeddings[rows] @ q_vec / (q_norm * doc_norms[rows] + 1e-8)
+                pos = _local_top_k(sims, top_k)
+                idx, scores = rows[pos], sims[pos]
+            else:
+                idx = np.empty(0, dtype=np.int64)
+                scores = np.empty(0, dtype=np.float32)
+        except Exception as e:
+            conn.send((request_id, None, None, 0.0, f"{type(e).__name__}: {e}"))
+            continue
+
+        conn.send((request_id, idx, scores, time.perf_counter() - start, None))
+
+    conn.close()
+
+
+class _PendingSearch:
+    """
+    Replies of one in-flight search, filled in by the shards' reader threads.
+    """
+
+    def __init__(self, num_shards: int):
+        self.replies: List[Tuple | None] = [None] * num_shards
+        self.error: ShardWorkerError | None = None
+        self.done = threading.Event()
+        self._left = num_shards
+        self._lock = threading.Lock()
+
+    def reply(self, shard: int, reply: Tuple) -> None:
+        with self._lock:
+            if self.replies[shard] is None:
+                self.replies[shard] = reply
+                self._left -= 1
+            if self._left == 0:
+                self.done.set()
+
+    def fail(self, error: ShardWorkerError) -> None:
+        with self._lock:
+            if self.error is None:
+                self.error = error
+        self.done.set()
+
+
+class ShardedIndex:
+    """
+    Embeddings partitioned across N local worker processes.
+
+    Queries are broadcast to every shard, each shard returns its local
+    top-k, and the coordinator merges them into a global top-k.
+    Row indices returned by search() are global (same as the chunks list).
+
+    search() can be called from several threads: requests carry an id, a
+    reader thread per shard routes the replies, and each worker works
+    through its queue while the others move on to the next query. If a
+    worker exits, searches waiting on it and all later ones raise
+    ShardWorkerError (rebuild the index to recover); a search whose
+    replies take longer than timeout_s raises it too.
+
+    After each search, last_report holds per-shard latency and the
+    slowest shard of the calling thread's latest search:
+    {"per_shard_ms": [...], "slowest_shard": 2, "slowest_ms": 4.1, "total_ms": 5.0}
+    """
+
+    def __init__(self, embeddings: np.ndarray, num_shards: int, timeout_s: float = SHARD_TIMEOUT_S):
+        if num_shards < 1:
+            raise ValueError("num_shards must be >= 1")
+
+        num_rows = embeddings.shape[0]
+        num_shards = min(num_shards, max(1, num_rows))
+        bounds = np.linspace(0, num_rows, num_shards + 1).astype(int)
+
+        self.num_rows = num_rows
+        self.dim = embeddings.shape[1]
+        self.offsets: List[int] = bounds[:-1].tolist()
+        self.sizes: List[int] = np.diff(bounds).tolist()
+        self.timeout_s = timeout_s
+        self._reports = threading.local()
+
+        # spawn (not fork) so workers don't inherit Streamlit / router threads
+        ctx = mp.get_context("spawn")
+        self._conns = []
+        self._procs = []
+        self._send_locks = []
+        for start, end in zip(bounds[:-1], bounds[1:]):
+            parent_conn, child_conn = ctx.Pipe()
+            proc = ctx.Process(
+                target=_shard_worker,
+                args=(child_conn, np.ascontiguousarray(embeddings[start:end])),
+                daemon=True,
+            )
+            proc.start()
+            child_conn.close()
+            self._conns.append(parent_conn)
+            self._procs.append(proc)
+            self._send_locks.append(threading.Lock())
+
+        # Guards the in-flight searches and the dead shards
+        self._lock = threading.Lock()
+        self._request_ids = itertools.count()
+        self._pending: Dict[int, _PendingSearch] = {}
+        self._dead: Dict[int, str] = {}
+        self._closed = False
+        self._readers = [
+            threading.Thread(
+                target=self._read_replies, args=(shard,), name=f"shard-{shard}-replies", daemon=True
+            )
+            for shard in range(len(self._conns))
+        ]
+        for reader in self._readers:
+            reader.start()
+
+    @property
+    def last_report(self) -> Dict:
+        return getattr(self._reports, "last", {})
+
+    @property
+    def num_shards(self) -> int:
+        return len(self._procs)
+
+    def _read_replies(self, shard: int) -> None:
+        """
+        Reader thread: hand each reply of one shard to its search.
+        """
+        conn = self._conns[shard]
+        while True:
+            try:
+                request_id, idx, scores, elapsed, error = conn.recv()
+            except (EOFError, OSError):
+                break
+            with self._lock:
+                pending = self._pending.get(request_id)
+            if pending is None:
+                continue
+            if error is not None:
+                pending.fail(ShardWorkerError(f"Shard {shard} failed: {error}"))
+            else:
+                pending.reply(shard, (idx, scores, elapsed))
+
+        # The worker exited (or the index was closed)
+        proc = self._procs[shard]
+        proc.join(timeout=1.0)
+        with self._lock:
+            if self._closed:
+                reason = "index closed"
+            else:
+                reason = f"worker exited with code {proc.exitcode}"
+                print(f"[ShardedIndex] Shard {shard} {reason}")
+            self._dead[shard] = reason
+            waiting = list(self._pending.values())
+        for pending in waiting:
+            pending.fail(ShardWorkerError(f"Shard {shard} unavailable: {reason}"))
+
+    def _local_rows(self, rows: np.ndarray | None) -> List[np.ndarray | None]:
+        """
+        Split global row indices into per-shard local row indices.
+        """
+        if rows is None:
+            return [None] * self.num_shards
+
+        rows = np.asarray(rows, dtype=np.int64)
+        local: List[np.ndarray | None] = []
+        for offset, size in zip(self.offsets, self.sizes):
+            mask = (rows >= offset) & (rows < offset + size)
+            local.append(rows[mask] - offset)
+        return local
+
+    def search(
+        self,
+        query_vec: np.ndarray,
+        top_k: int,
+        rows: np.ndarray | None = None,
+        timeout_s: float | None = None,
+    ) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        Scatter the query to all shards and gather the merged global top_k.
+
+        rows: optional global row indices to restrict scoring to.
+        timeout_s: wait for the replies at most this long (default: the
+        index's timeout_s), e.g. the request's remaining budget.
+        Returns (global_indices, scores), sorted by descending score.
+        """
+        q = np.asarray(query_vec, dtype="float32")
+        start = time.perf_counter()
+
+        pending = _PendingSearch(self.num_shards)
+        with self._lock:
+            if self._dead:
+                shard, reason = next(iter(self._dead.items()))
+                raise ShardWorkerError(f"Shard {shard} unavailable: {reason}")
+            request_id = next(self._request_ids)
+            self._pending[request_id] = pending
+
+        try:
+            for shard, local_rows in enumerate(self._local_rows(rows)):
+                with self._send_locks[shard]:
+                    self._conns[shard].send((request_id, q, top_k, local_rows))
+            timeout_s = self.timeout_s if timeout_s is None else timeout_s
+            if not pending.done.wait(timeout_s):
+                missing = [i for i, reply in enumerate(pending.replies) if reply is None]
+                raise ShardWorkerError(
+                    f"Shards {missing} did not answer within {timeout_s * 1000:.0f} ms"
+                )
+        except (BrokenPipeError, OSError) as e:
+            raise ShardWorkerError(f"Shard {shard} unavailable: {e}") from e
+        finally:
+            with self._lock:
+                self._pending.pop(request_id, None)
+
+        if pending.error is not None:
+            raise pending.error
+        replies = pending.replies
+
+        all_idx = np.concatenate(
+            [idx + offset for (idx, _, _), offset in zip(replies, self.offsets)]
+        )
+        all_scores = np.concatenate([scores for (_, scores, _) in replies])
+        order = np.argsort(-all_scores)[:top_k]
+
+        per_shard_ms = [elapsed * 1000 for (_, _, elapsed) in replies]
+        slowest = int(np.argmax(per_shard_ms))
+        self._reports.last = {
+            "per_shard_ms": per_shard_ms,
+            "slowest_shard": slowest,
+            "slowest_ms": per_shard_ms[slowest],
+            "total_ms": (time.perf_counter() - start) * 1000,
+        }
+
+        return all_idx[order], all_scores[order]
+
+    def close(self) -> None:
+        """
+        Stop all worker processes.
+        """
+        with self._lock:
+            if self._closed:
+                return
+            self._closed = True
+        for conn, send_lock in zip(self._conns, self._send_locks):
+            with send_lock:
+                try:
+                    conn.send(None)
+                except (BrokenPipeError, OSError):
+                    pass
+        for proc in self._procs:
+            proc.join(timeout=1.0)
+            if proc.is_alive():
+                proc.terminate()
+        # Workers have closed their ends, so the readers see EOF and exit
+        for reader in self._readers:
+            reader.join(timeout=1.0)
+        for conn in self._conns:
+            conn.close()
@@ -0,0 +1,418 @@
+# utils/shared_index.py
+"""
+Vectorstores shared by all worker processes on a host.
+
+publish_vectorstore writes a built index (embeddings, chunk text and
+arrays, postings, projection) once into a single file under a shared
+directory, ideally on tmpfs (/dev/shm, i.e. OS shared memory).
+attach_vectorstore maps that file read-only: every array of the
+returned vectorstore is a zero-copy view of the mapping, so the pages
+are held once by the OS and N workers cost about as much memory as one.
+
+Each published file starts with a fixed header (magic, format,
+generation, built_at, meta length) followed by a JSON table of the
+arrays. Publishing writes the next generation to a new file and then
+atomically replaces the <name>.current pointer; readers compare the
+generation they are attached to with the pointer and re-attach, without
+a restart. Files of older generations are unlinked; mappings still held
+by readers stay valid until dropped.
+
+Usage:
+    python -m utils.shared_index publish --dir /dev/shm/smartassist --name default
+    python -m utils.shared_index bench --dir /dev/shm/smartassist --workers 4
+
+--name is a tenant (see TENANTS); its index is built from the tenant's
+docs with the app's settings (CHUNKING, DEDUP_ENABLED, PROJECTION_*).
+"""
+
+from typing import Dict, List, Tuple
+import argparse
+import json
+import mmap
+import multiprocessing as mp
+import os
+import re
+import struct
+import time
+
+import numpy as np
+
+from utils.chunk_table import ChunkTable
+from utils.vector_store import NumpyStore
+
+try:
+    import fcntl
+except ImportError:  # not on POSIX: publishers are not serialized across processes
+    fcntl = None
+
+
+MAGIC = b"SAIDX\x00\x00\x00"
+FORMAT = 1
+_HEADER = struct.Struct("<8sIIqdQ")  # magic, format, reserved, generation, built_at, meta_len
+ALIGN = 64
+KEEP_GENERATIONS = 2  # the current file and the one before it
+ATTACH_RETRIES = 3
+
+_CHUNK_ARRAYS = (
+    "doc_ids",
+    "offsets",
+    "lengths",
+    "source_ids",
+    "doc_source_ids",
+    "prov_rows",
+    "prov_doc_ids",
+)
+_PROJECTION_ARRAYS = ("mean", "components", "reduced", "reduced_norms")
+
+
+def _pointer_path(shared_dir: str, name: str) -> str:
+    return os.path.join(shared_dir, f"{name}.current")
+
+
+def _file_name(name: str, generation: int) -> str:
+    return f"{name}.g{generation}.idx"
+
+
+def published_generation(shared_dir: str, name: str) -> int | None:
+    """
+    Generation the pointer currently names, or None if nothing is published.
+    """
+    try:
+        with open(_pointer_path(shared_dir, name), "r", encoding="utf-8") as f:
+            return int(json.load(f)["generation"])
+    except (FileNotFoundError, ValueError, KeyError):
+        return None
+
+
+def _generations(shared_dir: str, name: str) -> List[int]:
+    pattern = re.compile(rf"^{re.escape(name)}\.g(\d+)\.idx$")
+    gens = []
+    for fname in os.listdir(shared_dir):
+        m = pattern.match(fname)
+        if m:
+            gens.append(int(m.group(1)))
+    return sorted(gens)
+
+
+def _align(n: int) -> int:
+    return -(-n // ALIGN) * ALIGN
+
+
+def _index_arrays(vectorstore: Dict) -> Tuple[Dict[str, np.ndarray], Dict]:
+    """
+    Arrays to publish and the JSON-serializable rest of the vectorstore.
+    """
+    chunks: ChunkTable = vectorstore["chunks"]
+    ids, vectors, norms = vectorstore["store"]._arrays()
+    arrays: Dict[str, np.ndarray] = {
+        "store.ids": ids,
+        "store.vectors": vectors,
+        "store.norms": norms,
+        "chunks.text": np.frombuffer(b"".join(chunks.buffers), dtype=np.uint8),
+        "chunks.buffer_lengths": np.array([len(b) for b in chunks.buffers], dtype=np.int64),
+    }
+    for name in _CHUNK_ARRAYS:
+        arrays[f"chunks.{name}"] = getattr(chunks, name)
+
+    postings_index: List[Tuple[str, str, str]] = []
+    for field, values in vectorstore.get("postings", {}).items():
+        for value, rows in values.items():
+            key = f"postings.{len(postings_index)}"
+            postings_index.append((field, value, key))
+            arrays[key] = rows
+
+    projection = vectorstore.get("projection")
+    projection_meta = None
+    if projection is not None:
+        for k in _PROJECTION_ARRAYS:
+            if projection.get(k) is not None:
+                arrays[f"projection.{k}"] = projection[k]
+        projection_meta = {k: projection[k] for k in ("method", "dims", "candidates")}
+
+    meta = {
+        "version": vectorstore.get("version", 1),
+        "dedup_report": vectorstore.get("dedup_report", {}),
+        "sources": chunks.sources,
+        "postings": postings_index,
+        "projection": projection_meta,
+        "dim": int(vectors.shape[1]),
+    }
+    return arrays, meta
+
+
+def _write_index(path: str, generation: int, built_at: float, arrays: Dict, meta: Dict) -> int:
+    """
+    Write header, meta and arrays to path. Array offsets in the meta are
+    relative to the data section, which starts at the first ALIGN
+    boundary after the meta. Returns the file size.
+    """
+    table = {}
+    offset = 0
+    for key, arr in arrays.items():
+        table[key] = [offset, arr.dtype.str, list(arr.shape)]
+        offset = _align(offset + arr.nbytes)
+    meta_json = json.dumps(dict(meta, arrays=table)).encode("utf-8")
+    data_start = _align(_HEADER.size + len(meta_json))
+
+    with open(path, "wb") as f:
+        f.write(_HEADER.pack(MAGIC, FORMAT, 0, generation, built_at, len(meta_json)))
+        f.write(meta_json)
+        for key, arr in arrays.items():
+            f.seek(data_start + table[key][0])
+            np.ascontiguousarray(arr).tofile(f)
+        f.truncate(data_start + offset)
+    return data_start + offset
+
+
+def publish_vectorstore(
+    vectorstore: Dict,
+    shared_dir: str,
+    name: str,
+    embedding_model: str | None = None,
+    build_settings: Dict | None = None,
+) -> int:
+    """
+    Publish an (unsharded) vectorstore as the next generation of `name`
+    and point readers at it. Returns the new generation.
+
+    embedding_model and build_settings (the chunking / dedup / projection
+    it was built with) are recorded so that readers can reject an index
+    built differently from theirs.
+    """
+    if "store" not in vectorstore:
+        raise ValueError("Only unsharded vectorstores can be shared.")
+    os.makedirs(shared_dir, exist_ok=True)
+    arrays, meta = _index_arrays(vectorstore)
+    meta["embedding_model"] = embedding_model
+    meta["build_settings"] = build_settings
+    built_at = vectorstore.get("built_at", time.time())
+
+    with open(os.path.join(shared_dir, f"{name}.lock"), "a") as lock:
+        if fcntl is not None:
+            fcntl.flock(lock, fcntl.LOCK_EX)
+
+        existing = _generations(shared_dir, name)
+        generation = max(existing + [published_generation(shared_dir, name) or 0]) + 1
+        final = os.path.join(shared_dir, _file_name(name, generation))
+        tmp = f"{final}.tmp-{os.getpid()}"
+        nbytes = _write_index(tmp, generation, built_at, arrays, meta)
+        os.replace(tmp, final)
+
+        pointer = _pointer_path(shared_dir, name)
+        with open(f"{pointer}.tmp-{os.getpid()}", "w", encoding="utf-8") as f:
+            json.dump({"generation": generation, "file": os.path.basename(final)}, f)
+        os.replace(f"{pointer}.tmp-{os.getpid()}", pointer)
+
+        for old in existing[: max(0, len(existing) + 1 - KEEP_GENERATIONS)]:
+            try:
+                os.unlink(os.path.join(shared_dir, _file_name(name, old)))
+            except FileNotFoundError:
+                pass
+
+    print(
+        f"[publish_vectorstore] Published {name} generation {generation} "
+        f"({nbytes / 1e6:.1f} MB) to {shared_dir}"
+    )
+    return generation
+
+
+def _map(path: str) -> mmap.mmap:
+    with open(path, "rb") as f:
+        return mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+
+def attach_vectorstore(shared_dir: str, name: str) -> Dict:
+    """
+    Map the current generation of `name` read-only. All arrays (and the
+    chunk text) are views of the shared mapping; the result has a
+    "shared" entry with the generation, file, size, embedding model and
+    build settings.
+    """
+    for _ in range(ATTACH_RETRIES):
+        generation = published_generation(shared_dir, name)
+        if generation is None:
+            raise FileNotFoundError(f"Nothing published as {name} in {shared_dir}")
+        path = os.path.join(shared_dir, _file_name(name, generation))
+        try:
+            mm = _map(path)
+            break
+        except FileNotFoundError:
+            continue  # superseded and unlinked while we read the pointer
+    else:
+        raise FileNotFoundError(f"{name} changed too fast to attach in {shared_dir}")
+
+    magic, fmt, _, file_generation, built_at, meta_len = _HEADER.unpack_from(mm, 0)
+    if magic != MAGIC or fmt != FORMAT or file_generation != generation:
+        raise ValueError(f"Not a format {FORMAT} shared index for generation {generation}: {path}")
+    meta = json.loads(mm[_HEADER.size : _HEADER.size + meta_len])
+    data_start = _align(_HEADER.size + meta_len)
+
+    def array(key: str) -> np.ndarray:
+        offset, dtype, shape = meta["arrays"][key]
+        count = int(np.prod(shape))
+        if count == 0:
+            return np.empty(shape, dtype=np.dtype(dtype))
+        return np.frombuffer(
+            mm, dtype=np.dtype(dtype), count=count, offset=data_start + offset
+        ).reshape(shape)
+
+    text = memoryview(array("chunks.text"))
+    ends = np.cumsum(array("chunks.buffer_lengths"))
+    starts = ends - array("chunks.buffer_lengths")
+    chunks = ChunkTable(
+        buffers=[text[s:e] for s, e in zip(starts, ends)],
+        sources=meta["sources"],
+        **{k: array(f"chunks.{k}") for k in _CHUNK_ARRAYS},
+    )
+
+    postings: Dict[str, Dict[str, np.ndarray]] = {"source": {}, "tags": {}, "date": {}}
+    for field, value, key in meta["postings"]:
+        postings.setdefault(field, {})[value] = array(key)
+
+    vectorstore = {
+        "chunks": chunks,
+        "postings": postings,
+        "version": meta["version"],
+        "built_at": built_at,
+        "dedup_report": meta["dedup_report"],
+        "store": NumpyStore.wrap(
+            array("store.ids"), array("store.vectors"), array("store.norms")
+        ),
+        "shared": {
+            "generation": generation,
+            "path": path,
+            "bytes": len(mm),
+            "embedding_model": meta.get("embedding_model"),
+            "build_settings": meta.get("build_settings"),
+        },
+    }
+    if meta.get("projection"):
+        projection = dict(meta["projection"], mean=None, components=None)
+        for k in _PROJECTION_ARRAYS:
+            if f"projection.{k}" in meta["arrays"]:
+                projection[k] = array(f"projection.{k}")
+        vectorstore["projection"] = projection
+    return vectorstore
+
+
+def is_stale(vectorstore: Dict, shared_dir: str, name: str) -> bool:
+    """
+    True if a newer generation than the attached one has been published.
+    """
+    shared = vectorstore.get("shared")
+    return bool(shared) and published_generation(shared_dir, name) not in (
+        None,
+        shared["generation"],
+    )
+
+
+def process_memory() -> Dict[str, int]:
+    """
+    This process's resident memory split into private and shared bytes
+    (Linux /proc; zeros elsewhere).
+    """
+    fields = {"Rss": 0, "Pss": 0, "Private_Clean": 0, "Private_Dirty": 0, "Shared_Clean": 0}
+    try:
+        with open("/proc/self/smaps_rollup", "r") as f:
+            for line in f:
+                key, _, rest = line.partition(":")
+                if key in fields:
+                    fields[key] = int(rest.split()[0]) * 1024
+    except OSError:
+        pass
+    return {
+        "rss": fields["Rss"],
+        "pss": fields["Pss"],
+        "private": fields["Private_Clean"] + fields["Private_Dirty"],
+        "shared": fields["Shared_Clean"],
+    }
+
+
+def _bench_worker(shared_dir: str, name: str, queries: np.ndarray, barrier, out) -> None:
+    before = process_memory()
+    start = time.perf_counter()
+    vectorstore = attach_vectorstore(shared_dir, name)
+    attach_ms = (time.perf_counter() - start) * 1000
+    store = vectorstore["store"]
+    for q in queries:
+        store.search(q, 5)
+    texts = sum(len(vectorstore["chunks"].view(i)) for i in range(len(vectorstore["chunks"])))
+    # A page mapped by a single process counts as private: measure once all are attached
+    barrier.wait()
+    after = process_memory()
+    barrier.wait()
+    out.put(
+        {
+            "pid": os.getpid(),
+            "generation": vectorstore["shared"]["generation"],
+            "attach_ms": attach_ms,
+            "text_bytes": texts,
+            "private_growth": after["private"] - before["private"],
+            "pss": after["pss"],
+        }
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Publish / attach host-shared vectorstores.")
+    sub = parser.add_subparsers(dest="command", required=True)
+    for cmd in ("publish", "bench"):
+        p = sub.add_parser(cmd)
+        p.add_argument("--dir", default="/dev/shm/smartassist", help="shared directory (tmpfs)")
+        p.add_argument("--name", default="default", help="tenant")
+        p.add_argument("--fake-embeddings", action="store_true")
+    sub.choices["bench"].add_argument("--workers", type=int, default=4)
+    args = parser.parse_args()
+
+    if args.command == "publish" or published_generation(args.dir, args.name) is None:
+        from utils.index_manager import index_manager_from_config
+        from utils.rag import build_knowledge_base
+
+        # Same docs, model and build settings as the app's IndexManager
+        manager = index_manager_from_config()
+        if args.fake_embeddings:
+            from models.fakes import FakeEmbeddingClient
+
+            # Recorded under the fake's own model name: never attached by the app
+            embed_client = FakeEmbeddingClient()
+            model = embed_client.model_name
+        else:
+            embed_client = manager.embed_client(args.name)
+            model = manager.embedding_model(args.name)
+        build_kwargs = dict(manager.build_kwargs_for(args.name), store_backend="numpy", store_dir=None)
+        vectorstore = build_knowledge_base(manager.docs_dir(args.name), embed_client, **build_kwargs)
+        publish_vectorstore(vectorstore, args.dir, args.name, model, manager.index_settings())
+        del vectorstore
+        if args.command == "publish":
+            return
+
+    attached = attach_vectorstore(args.dir, args.name)
+    size = attached["shared"]["bytes"]
+    queries = np.random.RandomState(0).randn(20, attached["store"].dim).astype("float32")
+    del attached
+    # Fresh interpreters, like separate app workers (nothing inherited by fork)
+    ctx = mp.get_context("spawn")
+    out = ctx.Queue()
+    barrier = ctx.Barrier(args.workers)
+    workers = [
+        ctx.Process(target=_bench_worker, args=(args.dir, args.name, queries, barrier, out))
+        for _ in range(args.workers)
+    ]
+    for w in workers:
+        w.start()
+    rows = [out.get() for _ in workers]
+    for w in workers:
+        w.join()
+
+    print(f"Shared index: {size / 1e6:.2f} MB, {args.workers} workers")
+    print(f"{'pid':>8}{'gen':>5}{'attach ms':>11}{'private +KB':>13}{'PSS MB':>9}")
+    for r in rows:
+        print(
+            f"{r['pid']:>8}{r['generation']:>5}{r['attach_ms']:>11.2f}"
+            f"{r['private_growth'] / 1024:>13.0f}{r['pss'] / 1e6:>9.1f}"
+        )
+    print(f"Total PSS of all workers: {sum(r['pss'] for r in rows) / 1e6:.1f} MB")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,193 @@
+# utils/snapshot.py
+
+from typing import Dict, List, Tuple
+import json
+import os
+import shutil
+import time
+
+import numpy as np
+
+from utils.chunk_table import ChunkTable
+from utils.vector_store import load_store
+
+
+SNAPSHOT_FORMAT = 1
+META_FILE = "meta.json"
+
+_STORE_FILES = {
+    "numpy": "store.npz",
+    "mmap": "store",
+    "sqlite": "store.sqlite",
+    "segmented": "store.npz",
+}
+_CHUNK_ARRAYS = (
+    "doc_ids",
+    "offsets",
+    "lengths",
+    "source_ids",
+    "doc_source_ids",
+    "prov_rows",
+    "prov_doc_ids",
+)
+
+
+def save_vectorstore(
+    vectorstore: Dict,
+    path: str,
+    embedding_model: str | None = None,
+    build_settings: Dict | None = None,
+) -> None:
+    """
+    Persist an (unsharded) vectorstore to the directory `path`.
+
+    embedding_model and build_settings (the chunking / dedup / projection
+    kwargs it was built with) are recorded in its meta so loaders can
+    reject a snapshot built differently.
+
+    Written to a sibling temp directory first and renamed into place, so
+    a reader never sees a half-written snapshot.
+    """
+    if "store" not in vectorstore:
+        raise ValueError("Only unsharded vectorstores can be snapshotted.")
+
+    tmp = f"{path}.tmp-{os.getpid()}"
+    shutil.rmtree(tmp, ignore_errors=True)
+    os.makedirs(tmp)
+
+    chunks: ChunkTable = vectorstore["chunks"]
+    buffer_lengths = np.array([len(b) for b in chunks.buffers], dtype=np.int64)
+    with open(os.path.join(tmp, "chunks.npz"), "wb") as f:
+        np.savez(
+            f,
+            text=np.frombuffer(b"".join(chunks.buffers), dtype=np.uint8),
+            buffer_lengths=buffer_lengths,
+            **{name: getattr(chunks, name) for name in _CHUNK_ARRAYS},
+        )
+
+    postings_index: List[Tuple[str, str, str]] = []
+    posting_arrays: Dict[str, np.ndarray] = {}
+    for field, values in vectorstore.get("postings", {}).items():
+        for value, rows in values.items():
+            key = f"p{len(postings_index)}"
+            postings_index.append((field, value, key))
+            posting_arrays[key] = rows
+    with open(os.path.join(tmp, "postings.npz"), "wb") as f:
+        np.savez(f, **posting_arrays)
+
+    store = vectorstore["store"]
+    store.save(os.path.join(tmp, _STORE_FILES[store.backend]))
+
+    projection = vectorstore.get("projection")
+    projection_meta = None
+    if projection is not None:
+        arrays = {
+            k: projection[k]
+            for k in ("mean", "components", "reduced", "reduced_norms")
+            if projection[k] is not None
+        }
+        with open(os.path.join(tmp, "projection.npz"), "wb") as f:
+            np.savez(f, **arrays)
+        projection_meta = {k: projection[k] for k in ("method", "dims", "candidates")}
+
+    meta = {
+        "format": SNAPSHOT_FORMAT,
+        "version": vectorstore.get("version", 1),
+        "built_at": vectorstore.get("built_at", time.time()),
+        "saved_at": time.time(),
+        "dedup_report": vectorstore.get("dedup_report", {}),
+        "sources": chunks.sources,
+        "postings": postings_index,
+        "store_backend": store.backend,
+        "projection": projection_meta,
+        "embedding_model": embedding_model,
+        "build_settings": build_settings,
+    }
+    with open(os.path.join(tmp, META_FILE), "w", encoding="utf-8") as f:
+        json.dump(meta, f)
+
+    old = f"{path}.old-{os.getpid()}"
+    if os.path.exists(path):
+        os.rename(path, old)
+    os.rename(tmp, path)
+    shutil.rmtree(old, ignore_errors=True)
+
+
+def read_snapshot_meta(path: str) -> Dict | None:
+    """
+    The snapshot's meta.json, or None if there is no (valid) snapshot.
+    """
+    meta_path = os.path.join(path, META_FILE)
+    if not os.path.isfile(meta_path):
+        return None
+    try:
+        with open(meta_path, "r", encoding="utf-8") as f:
+            meta = json.load(f)
+    except Exception as e:
+        print(f"[read_snapshot_meta] Failed to read {meta_path}: {e}")
+        return None
+    return meta if meta.get("format") == SNAPSHOT_FORMAT else None
+
+
+def load_vectorstore(path: str) -> Dict:
+    """
+    Load a vectorstore saved by save_vectorstore. mmap stores are mapped
+    in place, other backends are read into memory.
+    """
+    meta = read_snapshot_meta(path)
+    if meta is None:
+        raise FileNotFoundError(f"No snapshot at {path}")
+
+    with np.load(os.path.join(path, "chunks.npz")) as data:
+        text = data["text"].tobytes()
+        ends = np.cumsum(data["buffer_lengths"])
+        starts = ends - data["buffer_lengths"]
+        chunks = ChunkTable(
+            buffers=[text[s:e] for s, e in zip(starts, ends)],
+            sources=meta["sources"],
+            **{name: data[name] for name in _CHUNK_ARRAYS},
+        )
+
+    postings: Dict[str, Dict[str, np.ndarray]] = {"source": {}, "tags": {}, "date": {}}
+    with np.load(os.path.join(path, "postings.npz")) as data:
+        for field, value, key in meta["postings"]:
+            postings.setdefault(field, {})[value] = data[key]
+
+    backend = meta["store_backend"]
+    vectorstore = {
+        "chunks": chunks,
+        "postings": postings,
+        "version": meta["version"],
+        "built_at": meta["built_at"],
+        "dedup_report": meta["dedup_report"],
+        "store": load_store(backend, os.path.join(path, _STORE_FILES[backend])),
+    }
+
+    if meta.get("projection"):
+        with np.load(os.path.join(path, "projection.npz")) as data:
+            projection = dict(meta["projection"], mean=None, components=None)
+            projection.update({k: data[k] for k in data.files})
+        vectorstore["projection"] = projection
+
+    return vectorstore
+
+
+def vectorstore_nbytes(vectorstore: Dict) -> int:
+    """
+    Approximate process memory held by a vectorstore (mapped files excluded).
+    """
+    if "shared" in vectorstore:
+        return 0  # views of a host-wide mapping (utils.shared_index)
+    total = vectorstore["chunks"].nbytes()
+    for values in vectorstore.get("postings", {}).values():
+        total += sum(rows.nbytes for rows in values.values())
+    if "store" in vectorstore:
+        total += vectorstore["store"].stats()["memory_bytes"]
+    projection = vectorstore.get("projection")
+    if projection:
+        total += sum(
+            projection[k].nbytes
+            for k in ("mean", "components", "reduced", "reduced_norms")
+            if projection.get(k) is not None
+        )
+    return int(total)
@@ -0,0 +1,1144 @@
+# utils/vector_store.py
+
+from typing import Dict, List, Tuple
+import json
+import os
+import shutil
+import sqlite3
+import sys
+import tempfile
+import threading
+import time
+
+import numpy as np
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '../..')))
+from config.config import get_config
+
+
+# Filters matching at most this fraction of rows score only those rows
+# (pre-filter); broader filters scan everything and mask (post-filter).
+PREFILTER_MAX_SELECTIVITY = 0.3
+
+SearchResult = Tuple[np.ndarray, np.ndarray]
+
+
+def _empty_result() -> SearchResult:
+    return np.empty(0, dtype=np.int64), np.empty(0, dtype=np.float32)
+
+
+class VectorStore:
+    """
+    Storage engine for chunk embeddings, keyed by integer id (the chunk's
+    row in the ChunkTable).
+
+    Backends implement add / delete / _arrays / stats / save / load;
+    search and search_batch are shared, so every backend scores the same
+    way (cosine similarity, ties broken by position).
+
+    Readers of a store that may be replaced (a rebuild, an eviction) pin
+    it with acquire() / release(); retire() closes it once the last of
+    them has released it.
+    """
+
+    backend = "base"
+
+    def __init__(self):
+        self._readers_lock = threading.Lock()
+        self._readers = 0
+        self._retired: str | None = None  # "close" or "drop" once retired
+        self._closed = False
+
+    def acquire(self) -> bool:
+        """
+        Pin the store for a reader until release(). False if it has been
+        retired and closed already: look up the current store instead.
+        """
+        with self._readers_lock:
+            if self._closed:
+                return False
+            self._readers += 1
+            return True
+
+    def release(self) -> None:
+        with self._readers_lock:
+            self._readers -= 1
+            action = self._retired if self._readers == 0 else None
+            self._closed = self._closed or action is not None
+        if action is not None:
+            self._finish_retire(action)
+
+    def retire(self, drop: bool = False) -> None:
+        """
+        Close the store (drop=True: also delete its files) as soon as no
+        reader holds it: now, or when the last one releases it.
+        """
+        action = "drop" if drop else "close"
+        with self._readers_lock:
+            if self._closed:
+                return
+            self._retired = action
+            self._closed = self._readers == 0
+        if self._closed:
+            self._finish_retire(action)
+
+    def _finish_retire(self, action: str) -> None:
+        try:
+            if action == "drop":
+                self.drop()
+            else:
+                self.close()
+        except Exception as e:
+            print(f"[VectorStore] Closing retired {self.backend} store failed: {e}")
+
+    def add(self, ids: np.ndarray, vectors: np.ndarray) -> None:
+        """
+        Insert vectors [len(ids), dim]; existing ids are replaced.
+        """
+        raise NotImplementedError
+
+    def delete(self, ids: np.ndarray) -> int:
+        """
+        Remove ids (unknown ids are ignored). Returns the number removed.
+        """
+        raise NotImplementedError
+
+    def _arrays(self) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+        """
+        (ids, vectors, norms), sorted by id. Must be a consistent snapshot.
+        """
+        raise NotImplementedError
+
+    def stats(self) -> Dict:
+        raise NotImplementedError
+
+    def save(self, path: str) -> None:
+        raise NotImplementedError
+
+    @classmethod
+    def load(cls, path: str) -> "VectorStore":
+        raise NotImplementedError
+
+    def close(self) -> None:
+        pass
+
+    def drop(self) -> None:
+        """
+        Close the store and delete its files (if any).
+        """
+        self.close()
+
+    def __len__(self) -> int:
+        return len(self._arrays()[0])
+
+    def vectors(self) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        (ids, vectors) sorted by id, e.g. for fitting a projection.
+        """
+        ids, vectors, _ = self._arrays()
+        return ids, vectors
+
+    def take(self, ids: np.ndarray) -> np.ndarray:
+        """
+        Vectors [len(ids), dim] of ids, in the given order, e.g. the
+        candidates of a two-stage search. Backends whose _arrays() builds
+        a copy read only these rows. Raises KeyError for unknown (or
+        deleted) ids.
+        """
+        all_ids, vectors, _ = self._arrays()
+        ids = np.asarray(ids, dtype=np.int64)
+        pos = np.minimum(np.searchsorted(all_ids, ids), max(len(all_ids) - 1, 0))
+        found = all_ids[pos] == ids if len(all_ids) else np.zeros(len(ids), dtype=bool)
+        _check_found(ids, found)
+        return vectors[pos]
+
+    def search(self, q_vec: np.ndarray, top_k: int, rows: np.ndarray | None = None) -> SearchResult:
+        """
+        Top-k ids by cosine similarity, optionally restricted to ids in rows.
+        Returns (ids, scores), sorted by descending score.
+        """
+        return self.search_batch(np.asarray(q_vec).reshape(1, -1), top_k, rows=rows)[0]
+
+    def search_batch(
+        self,
+        q_matrix: np.ndarray,
+        top_k: int,
+        rows: np.ndarray | None = None,
+    ) -> List[SearchResult]:
+        """
+        search() for several queries with one matrix-matrix product.
+        """
+        ids, vectors, norms = self._arrays()
+        q_matrix = np.asarray(q_matrix, dtype="float32").reshape(-1, vectors.shape[1])
+
+        mask = None
+        if rows is not None:
+            pos = _positions(ids, rows)
+            if len(pos) <= len(ids) * PREFILTER_MAX_SELECTIVITY:
+                ids, vectors, norms = ids[pos], vectors[pos], norms[pos]
+            else:
+                mask = np.zeros(len(ids), dtype=bool)
+                mask[pos] = True
+            limit = min(top_k, len(pos))
+        else:
+            limit = min(top_k, len(ids))
+
+        if limit <= 0:
+            return [_empty_result() for _ in q_matrix]
+
+        q_norms = np.linalg.norm(q_matrix, axis=1, keepdims=True) + 1e-8
+        sims = (q_matrix @ vectors.T) / (q_norms * norms)
+        if mask is not None:
+            sims = np.where(mask, sims, -np.inf)
+
+        results: List[SearchResult] = []
+        for row in sims:
+            if limit < len(row):
+                top = np.argpartition(-row, limit - 1)[:limit]
+                top = top[np.argsort(-row[top], kind="stable")]
+            else:
+                top = np.argsort(-row, kind="stable")
+            results.append((ids[top], row[top]))
+        return results
+
+
+def _positions(ids: np.ndarray, rows: np.ndarray) -> np.ndarray:
+    """
+    Positions in the sorted ids array of the ids listed in rows.
+    """
+    rows = np.asarray(rows, dtype=np.int64)
+    n = len(ids)
+    if n and ids[0] == 0 and ids[-1] == n - 1:
+        # Dense ids (the usual case for a freshly built index): id == position
+        return rows[(rows >= 0) & (rows < n)]
+    pos = np.searchsorted(ids, rows)
+    found = pos < n
+    pos, rows = pos[found], rows[found]
+    return pos[ids[pos] == rows]
+
+
+def _check_found(ids: np.ndarray, found: np.ndarray) -> None:
+    if not found.all():
+        missing = ids[~found]
+        raise KeyError(f"{len(missing)} unknown ids, e.g. {missing[:5].tolist()}")
+
+
+def _prepare(ids: np.ndarray, vectors: np.ndarray, dim: int) -> Tuple[np.ndarray, np.ndarray]:
+    ids = np.asarray(ids, dtype=np.int64).reshape(-1)
+    vectors = np.asarray(vectors, dtype="float32").reshape(len(ids), -1)
+    if vectors.shape[1] != dim:
+        raise ValueError(f"Expected {dim}-d vectors, got {vectors.shape[1]}-d")
+    if len(np.unique(ids)) != len(ids):
+        raise ValueError("Duplicate ids in add()")
+    return ids, vectors
+
+
+def _row_norms(vectors: np.ndarray) -> np.ndarray:
+    return (np.linalg.norm(vectors, axis=1) + 1e-8).astype("float32")
+
+
+class NumpyStore(VectorStore):
+    """
+    Reference backend: everything in one in-process float32 matrix.
+
+    Writes build new arrays and swap them in with one assignment, so
+    concurrent searches always see a consistent snapshot.
+    """
+
+    backend = "numpy"
+
+    def __init__(self, dim: int):
+        super().__init__()
+        self.dim = dim
+        self._lock = threading.Lock()  # serializes writers only
+        self._data = (
+            np.empty(0, dtype=np.int64),
+            np.empty((0, dim), dtype="float32"),
+            np.empty(0, dtype="float32"),
+        )
+
+    @classmethod
+    def wrap(cls, ids: np.ndarray, vectors: np.ndarray, norms: np.ndarray) -> "NumpyStore":
+        """
+        Store over existing arrays (sorted by id) without copying them,
+        e.g. read-only views of shared memory. Writes build new arrays
+        and leave the wrapped ones untouched.
+        """
+        store = cls(int(vectors.shape[1]))
+        store._data = (ids, vectors, norms)
+        return store
+
+    def _arrays(self) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+        return self._data
+
+    def add(self, ids: np.ndarray, vectors: np.ndarray) -> None:
+        ids, vectors = _prepare(ids, vectors, self.dim)
+        with self._lock:
+            old_ids, old_vectors, old_norms = self._data
+            keep = ~np.isin(old_ids, ids)
+
+            all_ids = np.concatenate([old_ids[keep], ids])
+            order = np.argsort(all_ids, kind="stable")
+            self._data = (
+                all_ids[order],
+                np.ascontiguousarray(np.vstack([old_vectors[keep], vectors])[order]),
+                np.concatenate([old_norms[keep], _row_norms(vectors)])[order],
+            )
+
+    def delete(self, ids: np.ndarray) -> int:
+        with self._lock:
+            old_ids, old_vectors, old_norms = self._data
+            keep = ~np.isin(old_ids, np.asarray(ids, dtype=np.int64))
+            self._data = (old_ids[keep], old_vectors[keep], old_norms[keep])
+        return int(len(keep) - keep.sum())
+
+    def stats(self) -> Dict:
+        ids, vectors, norms = self._data
+        return {
+            "backend": self.backend,
+            "count": int(len(ids)),
+            "dim": self.dim,
+            # Wrapped views of memory owned elsewhere (e.g. shared) are not counted
+            "memory_bytes": int(sum(a.nbytes for a in (ids, vectors, norms) if a.flags.owndata)),
+            "disk_bytes": 0,
+        }
+
+    def save(self, path: str) -> None:
+        ids, vectors, _ = self._data
+        with open(path, "wb") as f:
+            np.savez(f, ids=ids, vectors=vectors)
+
+    @classmethod
+    def load(cls, path: str) -> "NumpyStore":
+        with np.load(path) as data:
+            store = cls(int(data["vectors"].shape[1]))
+            store.add(data["ids"], data["vectors"])
+        return store
+
+
+class MmapStore(VectorStore):
+    """
+    On-disk backend: ids, vectors and norms are flat files in a directory,
+    memory-mapped read-only, so the OS page cache holds the hot parts and
+    the process heap holds almost nothing.
+
+    Searches are exact but out-of-core: the mapped matrix is scanned in
+    blocks of block_rows rows (MMAP_BLOCK_ROWS by default), each block is
+    scored against all queries of the batch while it is in cache, and a
+    running top-k is kept per query. Resident memory is one block plus
+    the scores of one block, whatever the size of the file. stats()
+    reports bytes scanned and the time spent reading vs computing.
+
+    Appending ids larger than every existing id appends to the files;
+    any other write rewrites them (to temp files, then os.replace), so
+    it is meant for bulk builds rather than many small updates.
+    """
+
+    backend = "mmap"
+    _FILES = {
+        "ids": ("ids.i64", np.int64),
+        "vectors": ("vectors.f32", np.float32),
+        "norms": ("norms.f32", np.float32),
+    }
+
+    def __init__(self, path: str, dim: int | None = None, block_rows: int | None = None):
+        super().__init__()
+        self.path = path
+        self.block_rows = block_rows or get_config().get("MMAP_BLOCK_ROWS", 4096)
+        self._lock = threading.Lock()
+        self._scan = {"searches": 0, "blocks": 0, "bytes_read": 0, "io_ms": 0.0, "compute_ms": 0.0}
+        meta_path = os.path.join(path, "meta.json")
+
+        if os.path.exists(meta_path):
+            with open(meta_path, "r", encoding="utf-8") as f:
+                self.dim = int(json.load(f)["dim"])
+        else:
+            if dim is None:
+                raise ValueError(f"No store at {path}; pass dim to create one")
+            os.makedirs(path, exist_ok=True)
+            self.dim = dim
+            self._write(
+                np.empty(0, dtype=np.int64),
+                np.empty((0, dim), dtype="float32"),
+                np.empty(0, dtype="float32"),
+            )
+        self._open()
+
+    def _file(self, name: str) -> str:
+        return os.path.join(self.path, self._FILES[name][0])
+
+    def _open(self) -> None:
+        with open(os.path.join(self.path, "meta.json"), "r", encoding="utf-8") as f:
+            count = int(json.load(f)["count"])
+
+        def mapped(name: str, shape) -> np.ndarray:
+            dtype = self._FILES[name][1]
+            if count == 0:
+                return np.empty(shape, dtype=dtype)
+            return np.memmap(self._file(name), dtype=dtype, mode="r", shape=shape)
+
+        self._data = (
+            mapped("ids", (count,)),
+            mapped("vectors", (count, self.dim)),
+            mapped("norms", (count,)),
+        )
+
+    def _write_meta(self, count: int) -> None:
+        tmp = os.path.join(self.path, "meta.json.tmp")
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump({"dim": self.dim, "count": count}, f)
+        os.replace(tmp, os.path.join(self.path, "meta.json"))
+
+    def _write(self, ids: np.ndarray, vectors: np.ndarray, norms: np.ndarray) -> None:
+        for name, arr in (("ids", ids), ("vectors", vectors), ("norms", norms)):
+            tmp = self._file(name) + ".tmp"
+            np.ascontiguousarray(arr, dtype=self._FILES[name][1]).tofile(tmp)
+            os.replace(tmp, self._file(name))
+        self._write_meta(len(ids))
+
+    def _arrays(self) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+        return self._data
+
+    def add(self, ids: np.ndarray, vectors: np.ndarray) -> None:
+        ids, vectors = _prepare(ids, vectors, self.dim)
+        if not len(ids):
+            return
+        order = np.argsort(ids, kind="stable")
+        ids, vectors = ids[order], vectors[order]
+
+        with self._lock:
+            old_ids, old_vectors, old_norms = self._data
+            if not len(old_ids) or ids[0] > old_ids[-1]:
+                # Fast path: append to the end of every file
+                for name, arr in (("ids", ids), ("vectors", vectors), ("norms", _row_norms(vectors))):
+                    with open(self._file(name), "ab") as f:
+                        f.write(np.ascontiguousarray(arr).tobytes())
+                self._write_meta(len(old_ids) + len(ids))
+            else:
+                keep = ~np.isin(old_ids, ids)
+                all_ids = np.concatenate([old_ids[keep], ids])
+                merged = np.argsort(all_ids, kind="stable")
+                self._write(
+                    all_ids[merged],
+                    np.vstack([old_vectors[keep], vectors])[merged],
+                    np.concatenate([old_norms[keep], _row_norms(vectors)])[merged],
+                )
+            self._open()
+
+    def delete(self, ids: np.ndarray) -> int:
+        with self._lock:
+            old_ids, old_vectors, old_norms = self._data
+            keep = ~np.isin(old_ids, np.asarray(ids, dtype=np.int64))
+            removed = int(len(keep) - keep.sum())
+            if removed:
+                self._write(old_ids[keep], old_vectors[keep], old_norms[keep])
+                self._open()
+        return removed
+
+    def search_batch(
+        self,
+        q_matrix: np.ndarray,
+        top_k: int,
+        rows: np.ndarray | None = None,
+    ) -> List[SearchResult]:
+        """
+        Exact blocked scan (see the class docstring); same results as the
+        in-memory backends.
+        """
+        ids, vectors, norms = self._data
+        q_matrix = np.asarray(q_matrix, dtype="float32").reshape(-1, self.dim)
+        pos = _positions(ids, rows) if rows is not None else None
+        if top_k <= 0 or not len(ids) or (pos is not None and not len(pos)):
+            return [_empty_result() for _ in q_matrix]
+
+        q_norms = np.linalg.norm(q_matrix, axis=1, keepdims=True) + 1e-8
+        num_q = len(q_matrix)
+        best_scores = np.empty((num_q, 0), dtype="float32")
+        best_pos = np.empty((num_q, 0), dtype=np.int64)
+        block = np.empty((min(self.block_rows, len(ids)), self.dim), dtype="float32")
+        block_norms = np.empty(len(block), dtype="float32")
+        scan = {"blocks": 0, "bytes_read": 0, "io_ms": 0.0, "compute_ms": 0.0}
+
+        for start in range(0, len(ids), self.block_rows):
+            end = min(start + self.block_rows, len(ids))
+            if pos is None:
+                local = None
+                m = end - start
+            else:
+                lo, hi = np.searchsorted(pos, [start, end])
+                if lo == hi:
+                    continue
+                local = pos[lo:hi] - start
+                m = len(local)
+
+            # Read: page the block in (copy into the reused buffer)
+            t0 = time.perf_counter()
+            if local is None:
+                np.copyto(block[:m], vectors[start:end])
+                np.copyto(block_norms[:m], norms[start:end])
+            else:
+                block[:m] = vectors[start:end][local]
+                block_norms[:m] = norms[start:end][local]
+            t1 = time.perf_counter()
+
+            # Compute: score the block for every query, merge into the top-k
+            sims = (q_matrix @ block[:m].T) / (q_norms * block_norms[:m])
+            block_pos = np.arange(start, end) if local is None else local + start
+            if m > top_k:
+                top = np.argpartition(-sims, top_k - 1, axis=1)[:, :top_k]
+                sims = np.take_along_axis(sims, top, axis=1)
+                block_pos = block_pos[top]
+            else:
+                block_pos = np.broadcast_to(block_pos, sims.shape)
+            best_scores = np.hstack([best_scores, sims])
+            best_pos = np.hstack([best_pos, block_pos])
+            if best_scores.shape[1] > top_k:
+                top = np.argpartition(-best_scores, top_k - 1, axis=1)[:, :top_k]
+                best_scores = np.take_along_axis(best_scores, top, axis=1)
+                best_pos = np.take_along_axis(best_pos, top, axis=1)
+            t2 = time.perf_counter()
+
+            scan["blocks"] += 1
+            scan["bytes_read"] += m * (self.dim + 1) * 4
+            scan["io_ms"] += (t1 - t0) * 1000
+            scan["compute_ms"] += (t2 - t1) * 1000
+
+        with self._lock:
+            self._scan["searches"] += 1
+            for key, value in scan.items():
+                self._scan[key] += value
+
+        results: List[SearchResult] = []
+        for scores, positions in zip(best_scores, best_pos):
+            order = np.lexsort((positions, -scores))
+            results.append((ids[positions[order]], scores[order]))
+        return results
+
+    def stats(self) -> Dict:
+        files = [self._file(name) for name in self._FILES] + [os.path.join(self.path, "meta.json")]
+        with self._lock:
+            scan = dict(self._scan)
+        return {
+            "backend": self.backend,
+            "count": int(len(self._data[0])),
+            "dim": self.dim,
+            "memory_bytes": 0,  # mapped; resident pages belong to the page cache
+            "disk_bytes": int(sum(os.path.getsize(f) for f in files if os.path.exists(f))),
+            "path": self.path,
+            "block_rows": self.block_rows,
+            "block_bytes": int(min(self.block_rows, len(self._data[0])) * (self.dim + 1) * 4),
+            "scan": scan,
+        }
+
+    def save(self, path: str) -> None:
+        if os.path.abspath(path) == os.path.abspath(self.path):
+            return  # already persisted
+        os.makedirs(path, exist_ok=True)
+        with self._lock:
+            for name in self._FILES:
+                shutil.copyfile(self._file(name), os.path.join(path, self._FILES[name][0]))
+            shutil.copyfile(os.path.join(self.path, "meta.json"), os.path.join(path, "meta.json"))
+
+    @classmethod
+    def load(cls, path: str) -> "MmapStore":
+        return cls(path)
+
+    def close(self) -> None:
+        # Dropping the last reference unmaps the files
+        self._data = (
+            np.empty(0, dtype=np.int64),
+            np.empty((0, self.dim), dtype="float32"),
+            np.empty(0, dtype="float32"),
+        )
+
+    def drop(self) -> None:
+        self.close()
+        shutil.rmtree(self.path, ignore_errors=True)
+
+
+class SQLiteStore(VectorStore):
+    """
+    SQLite backend: one row per vector (float32 BLOB), durable and
+    updatable in place. Searches run on a NumPy copy of the table that is
+    loaded on first use and dropped after every write.
+
+    path=":memory:" keeps the database in memory.
+    """
+
+    backend = "sqlite"
+
+    def __init__(self, path: str = ":memory:", dim: int | None = None):
+        super().__init__()
+        self.path = path
+        self._lock = threading.Lock()
+        self._cache: Tuple[np.ndarray, np.ndarray, np.ndarray] | None = None
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS vectors "
+            "(id INTEGER PRIMARY KEY, vector BLOB NOT NULL, norm REAL NOT NULL)"
+        )
+        self._conn.execute("CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT)")
+
+        row = self._conn.execute("SELECT value FROM meta WHERE key = 'dim'").fetchone()
+        if row is not None:
+            self.dim = int(row[0])
+        elif dim is None:
+            raise ValueError(f"No store at {path}; pass dim to create one")
+        else:
+            self.dim = dim
+            self._conn.execute("INSERT INTO meta VALUES ('dim', ?)", (str(dim),))
+        self._conn.commit()
+
+    def _arrays(self) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+        cache = self._cache
+        if cache is not None:
+            return cache
+
+        with self._lock:
+            rows = self._conn.execute("SELECT id, vector, norm FROM vectors ORDER BY id").fetchall()
+            ids = np.fromiter((r[0] for r in rows), dtype=np.int64, count=len(rows))
+            vectors = np.frombuffer(b"".join(r[1] for r in rows), dtype="float32")
+            norms = np.fromiter((r[2] for r in rows), dtype="float32", count=len(rows))
+            self._cache = (ids, vectors.reshape(-1, self.dim), norms)
+            return self._cache
+
+    def take(self, ids: np.ndarray) -> np.ndarray:
+        if self._cache is not None:
+            return super().take(ids)
+        # No copy of the table loaded (e.g. after a write): read just these rows
+        ids = np.asarray(ids, dtype=np.int64)
+        found: Dict[int, bytes] = {}
+        with self._lock:
+            for start in range(0, len(ids), 500):
+                batch = ids[start : start + 500].tolist()
+                found.update(
+                    self._conn.execute(
+                        f"SELECT id, vector FROM vectors WHERE id IN ({','.join('?' * len(batch))})",
+                        batch,
+                    ).fetchall()
+                )
+        _check_found(ids, np.fromiter((i in found for i in ids.tolist()), dtype=bool, count=len(ids)))
+        return np.frombuffer(b"".join(found[i] for i in ids.tolist()), dtype="float32").reshape(
+            len(ids), self.dim
+        )
+
+    def add(self, ids: np.ndarray, vectors: np.ndarray) -> None:
+        ids, vectors = _prepare(ids, vectors, self.dim)
+        norms = _row_norms(vectors)
+        with self._lock:
+            self._conn.executemany(
+                "INSERT OR REPLACE INTO vectors (id, vector, norm) VALUES (?, ?, ?)",
+                ((int(i), v.tobytes(), float(n)) for i, v, n in zip(ids, vectors, norms)),
+            )
+            self._conn.commit()
+            self._cache = None
+
+    def delete(self, ids: np.ndarray) -> int:
+        with self._lock:
+            before = self._conn.total_changes
+            self._conn.executemany(
+                "DELETE FROM vectors WHERE id = ?",
+                ((int(i),) for i in np.asarray(ids, dtype=np.int64)),
+            )
+            self._conn.commit()
+            self._cache = None
+            return self._conn.total_changes - before
+
+    def stats(self) -> Dict:
+        with self._lock:
+            count = self._conn.execute("SELECT COUNT(*) FROM vectors").fetchone()[0]
+            pages = self._conn.execute("PRAGMA page_count").fetchone()[0]
+            page_size = self._conn.execute("PRAGMA page_size").fetchone()[0]
+        cache = self._cache
+        return {
+            "backend": self.backend,
+            "count": int(count),
+            "dim": self.dim,
+            "memory_bytes": int(sum(a.nbytes for a in cache)) if cache else 0,
+            "disk_bytes": int(pages * page_size) if self.path != ":memory:" else 0,
+            "path": self.path,
+        }
+
+    def save(self, path: str) -> None:
+        if os.path.abspath(path) == os.path.abspath(self.path):
+            return  # already persisted
+        dest = sqlite3.connect(path)
+        try:
+            with self._lock:
+                self._conn.backup(dest)
+        finally:
+            dest.close()
+
+    @classmethod
+    def load(cls, path: str) -> "SQLiteStore":
+        if not os.path.exists(path):
+            raise FileNotFoundError(path)
+        return cls(path)
+
+    def close(self) -> None:
+        with self._lock:
+            self._conn.close()
+
+    def drop(self) -> None:
+        self.close()
+        if self.path != ":memory:":
+            for suffix in ("", "-journal", "-wal", "-shm"):
+                if os.path.exists(self.path + suffix):
+                    os.remove(self.path + suffix)
+
+
+# SegmentedStore: rows buffered before the memtable becomes a segment, and
+# how many segments of one size tier are merged into one by compaction.
+MEMTABLE_ROWS = 1024
+COMPACTION_FANIN = 4
+
+
+class _Segment:
+    """
+    Immutable rows of a SegmentedStore (ids sorted unless it is a view of
+    the memtable). Deletes replace the segment with a copy that shares
+    the arrays and has a new tombstone mask.
+    """
+
+    __slots__ = ("seq", "ids", "vectors", "norms", "deleted", "sorted", "live")
+
+    def __init__(self, seq, ids, vectors, norms, deleted=None, sorted=True):
+        self.seq = seq
+        self.ids = ids
+        self.vectors = vectors
+        self.norms = norms
+        self.deleted = deleted if deleted is not None and deleted.any() else None
+        self.sorted = sorted
+        self.live = len(ids) - (int(self.deleted.sum()) if self.deleted is not None else 0)
+
+    def with_deleted(self, deleted: np.ndarray) -> "_Segment":
+        return _Segment(self.seq, self.ids, self.vectors, self.norms, deleted, self.sorted)
+
+    def live_rows(self) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+        if self.deleted is None:
+            return self.ids, self.vectors, self.norms
+        keep = ~self.deleted
+        return self.ids[keep], self.vectors[keep], self.norms[keep]
+
+
+class SegmentedStore(VectorStore):
+    """
+    LSM-style in-memory backend for continuous ingestion.
+
+    - add() appends to a preallocated memtable (no copy of the index);
+      a full memtable is sorted into an immutable segment. Batches of at
+      least MEMTABLE_ROWS become a segment directly.
+    - Replacing or deleting an id sets a tombstone on the segment that
+      holds it; the rows themselves are never modified.
+    - Searches fan out over all segments plus the memtable and merge
+      their top-k.
+    - A background compactor merges COMPACTION_FANIN segments of the same
+      size tier into one, dropping tombstoned rows.
+
+    stats() reports write amplification (rows written to segments,
+    including by compaction, per row added) and the average query fan-out.
+    """
+
+    backend = "segmented"
+
+    def __init__(
+        self,
+        dim: int,
+        memtable_rows: int = MEMTABLE_ROWS,
+        fanin: int = COMPACTION_FANIN,
+        background: bool = True,
+    ):
+        super().__init__()
+        self.dim = dim
+        self.memtable_rows = memtable_rows
+        self.fanin = fanin
+        self._lock = threading.Lock()  # serializes writers and compaction swaps
+
+        self._next_seq = 0
+        self._segments: Dict[int, _Segment] = {}
+        self._location: Dict[int, int] = {}  # live id -> seq of the segment holding it
+        self._new_memtable()
+
+        self._counters = {"rows_added": 0, "rows_written": 0, "compactions": 0}
+        # Searches count under their own lock, never waiting on writers
+        self._query_lock = threading.Lock()
+        self._query_counters = {"queries": 0, "segments_searched": 0}
+        self._publish()
+
+        self._wake = threading.Event()
+        self._stop = threading.Event()
+        self._compactor: threading.Thread | None = None
+        if background:
+            self._compactor = threading.Thread(
+                target=self._compact_loop, name="segment-compactor", daemon=True
+            )
+            self._compactor.start()
+
+    # ----- writes (caller holds self._lock) -----
+
+    def _seq(self) -> int:
+        self._next_seq += 1
+        return self._next_seq
+
+    def _new_memtable(self) -> None:
+        self._mem_seq = self._seq()
+        self._mem_ids = np.empty(self.memtable_rows, dtype=np.int64)
+        self._mem_vectors = np.empty((self.memtable_rows, self.dim), dtype="float32")
+        self._mem_norms = np.empty(self.memtable_rows, dtype="float32")
+        self._mem_deleted = np.zeros(self.memtable_rows, dtype=bool)
+        self._mem_slots: Dict[int, int] = {}
+        self._mem_count = 0
+
+    def _publish(self) -> None:
+        n = self._mem_count
+        memtable = _Segment(
+            self._mem_seq,
+            self._mem_ids[:n],
+            self._mem_vectors[:n],
+            self._mem_norms[:n],
+            self._mem_deleted[:n].copy(),
+            sorted=False,
+        )
+        self._view = (tuple(self._segments.values()), memtable)  # atomic swap
+
+    def _tombstone(self, ids: np.ndarray) -> int:
+        # Drop the live version of each id; returns how many were live
+        by_seq: Dict[int, List[int]] = {}
+        for i in ids.tolist():
+            seq = self._location.pop(i, None)
+            if seq is not None:
+                by_seq.setdefault(seq, []).append(i)
+
+        for seq, seq_ids in by_seq.items():
+            if seq == self._mem_seq:
+                self._mem_deleted[[self._mem_slots.pop(i) for i in seq_ids]] = True
+                continue
+            seg = self._segments[seq]
+            if seg.deleted is not None:
+                deleted = seg.deleted.copy()
+            else:
+                deleted = np.zeros(len(seg.ids), dtype=bool)
+            deleted[np.searchsorted(seg.ids, seq_ids)] = True
+            self._segments[seq] = seg.with_deleted(deleted)
+        return sum(len(v) for v in by_seq.values())
+
+    def _flush(self) -> None:
+        n = self._mem_count
+        if n:
+            keep = ~self._mem_deleted[:n]
+            ids = self._mem_ids[:n][keep]
+            order = np.argsort(ids, kind="stable")
+            if len(ids):
+                # Same seq as the memtable, so _location stays valid
+                self._segments[self._mem_seq] = _Segment(
+                    self._mem_seq,
+                    ids[order],
+                    self._mem_vectors[:n][keep][order],
+                    self._mem_norms[:n][keep][order],
+                )
+                self._counters["rows_written"] += len(ids)
+            self._new_memtable()
+            self._wake.set()
+
+    def add(self, ids: np.ndarray, vectors: np.ndarray) -> None:
+        ids, vectors = _prepare(ids, vectors, self.dim)
+        if not len(ids):
+            return
+        norms = _row_norms(vectors)
+        with self._lock:
+            self._tombstone(ids)
+            self._counters["rows_added"] += len(ids)
+
+            if len(ids) >= self.memtable_rows:
+                # Bulk load: the batch becomes a segment of its own
+                self._flush()
+                order = np.argsort(ids, kind="stable")
+                seq = self._seq()
+                self._segments[seq] = _Segment(seq, ids[order], vectors[order], norms[order])
+                self._location.update(dict.fromkeys(ids.tolist(), seq))
+                self._counters["rows_written"] += len(ids)
+                self._wake.set()
+            else:
+                start = 0
+                while start < len(ids):
+                    n = self._mem_count
+                    take = min(len(ids) - start, self.memtable_rows - n)
+                    part = slice(start, start + take)
+                    self._mem_ids[n : n + take] = ids[part]
+                    self._mem_vectors[n : n + take] = vectors[part]
+                    self._mem_norms[n : n + take] = norms[part]
+                    for slot, i in enumerate(ids[part].tolist(), n):
+                        self._mem_slots[i] = slot
+                        self._location[i] = self._mem_seq
+                    self._mem_count += take
+                    start += take
+                    if self._mem_count == self.memtable_rows:
+                        self._flush()
+            self._publish()
+
+    def delete(self, ids: np.ndarray) -> int:
+        with self._lock:
+            removed = self._tombstone(np.asarray(ids, dtype=np.int64).reshape(-1))
+            self._publish()
+        return removed
+
+    # ----- compaction -----
+
+    def _tier(self, seg: _Segment) -> int:
+        tier, size = 0, self.memtable_rows
+        while seg.live > size:
+            tier += 1
+            size *= self.fanin
+        return tier
+
+    def compact(self, force: bool = False) -> int:
+        """
+        Run compaction rounds until no tier has fanin segments (force=True:
+        merge everything into one segment). Returns the number of merges.
+        Normally the background compactor does this.
+        """
+        merges = 0
+        while True:
+            segments = self._view[0]
+            if force:
+                dirty = len(segments) > 1 or any(seg.deleted is not None for seg in segments)
+                sources = list(segments) if dirty else []
+            else:
+                tiers: Dict[int, List[_Segment]] = {}
+                for seg in segments:
+                    tiers.setdefault(self._tier(seg), []).append(seg)
+                sources = next((t[: self.fanin] for t in tiers.values() if len(t) >= self.fanin), [])
+            if not sources:
+                return merges
+            self._merge(sources)
+            merges += 1
+            if force:
+                return merges
+
+    def _merge(self, sources: List[_Segment]) -> None:
+        # Merge outside the lock; deletes that happen meanwhile are
+        # re-checked against _location before the swap
+        parts = [seg.live_rows() for seg in sources]
+        ids = np.concatenate([p[0] for p in parts])
+        order = np.argsort(ids, kind="stable")
+        ids = ids[order]
+        vectors = np.vstack([p[1] for p in parts])[order]
+        norms = np.concatenate([p[2] for p in parts])[order]
+        source_seqs = np.concatenate(
+            [np.full(len(p[0]), seg.seq, dtype=np.int64) for p, seg in zip(parts, sources)]
+        )[order]
+
+        with self._lock:
+            seq = self._seq()
+            current = np.array([self._location.get(i, -1) for i in ids.tolist()], dtype=np.int64)
+            live = current == source_seqs
+            merged = _Segment(seq, ids, vectors, norms, ~live)
+            for src in sources:
+                self._segments.pop(src.seq, None)
+            if merged.live:
+                self._segments[seq] = merged
+            self._location.update(dict.fromkeys(ids[live].tolist(), seq))
+            self._counters["rows_written"] += merged.live
+            self._counters["compactions"] += 1
+            self._publish()
+
+    def _compact_loop(self) -> None:
+        while not self._stop.is_set():
+            self._wake.wait()
+            self._wake.clear()
+            if self._stop.is_set():
+                return
+            try:
+                self.compact()
+            except Exception as e:
+                print(f"[SegmentedStore] Compaction failed: {e}")
+
+    # ----- reads -----
+
+    def _arrays(self) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+        segments, memtable = self._view
+        parts = [seg.live_rows() for seg in segments + (memtable,)]
+        ids = np.concatenate([p[0] for p in parts])
+        order = np.argsort(ids, kind="stable")
+        return (
+            ids[order],
+            np.vstack([p[1] for p in parts])[order],
+            np.concatenate([p[2] for p in parts])[order],
+        )
+
+    def __len__(self) -> int:
+        segments, memtable = self._view
+        return sum(seg.live for seg in segments) + memtable.live
+
+    def take(self, ids: np.ndarray) -> np.ndarray:
+        # Gather from the segments holding the ids, without merging them
+        ids = np.asarray(ids, dtype=np.int64)
+        out = np.zeros((len(ids), self.dim), dtype="float32")
+        found = np.zeros(len(ids), dtype=bool)
+        segments, memtable = self._view
+        for seg in segments + (memtable,):
+            if not seg.live:
+                continue
+            order = None if seg.sorted else np.argsort(seg.ids, kind="stable")
+            seg_ids = seg.ids if order is None else seg.ids[order]
+            pos = np.minimum(np.searchsorted(seg_ids, ids), len(seg_ids) - 1)
+            pos_in_seg = pos if order is None else order[pos]
+            hit = seg_ids[pos] == ids
+            if seg.deleted is not None:
+                hit &= ~seg.deleted[pos_in_seg]
+            out[hit] = seg.vectors[pos_in_seg[hit]]
+            found |= hit
+        _check_found(ids, found)
+        return out
+
+    def search_batch(
+        self,
+        q_matrix: np.ndarray,
+        top_k: int,
+        rows: np.ndarray | None = None,
+    ) -> List[SearchResult]:
+        """
+        Per-segment top-k for every query, merged (ties broken by id, as
+        in the other backends).
+        """
+        segments, memtable = self._view
+        parts = [seg for seg in segments + (memtable,) if seg.live]
+        q_matrix = np.asarray(q_matrix, dtype="float32").reshape(-1, self.dim)
+        with self._query_lock:
+            self._query_counters["queries"] += len(q_matrix)
+            self._query_counters["segments_searched"] += len(parts) * len(q_matrix)
+        if top_k <= 0 or not parts:
+            return [_empty_result() for _ in q_matrix]
+
+        q_norms = np.linalg.norm(q_matrix, axis=1, keepdims=True) + 1e-8
+        candidates: List[List[SearchResult]] = [[] for _ in q_matrix]
+        for seg in parts:
+            pos = None
+            if rows is not None:
+                pos = (
+                    _positions(seg.ids, rows)
+                    if seg.sorted
+                    else np.flatnonzero(np.isin(seg.ids, rows))
+                )
+            if seg.deleted is not None:
+                pos = np.flatnonzero(~seg.deleted) if pos is None else pos[~seg.deleted[pos]]
+            if pos is not None and not len(pos):
+                continue
+
+            ids, vectors, norms = seg.ids, seg.vectors, seg.norms
+            mask = None
+            if pos is not None:
+                if len(pos) <= len(ids) * PREFILTER_MAX_SELECTIVITY:
+                    ids, vectors, norms = ids[pos], vectors[pos], norms[pos]
+                else:
+                    mask = np.zeros(len(ids), dtype=bool)
+                    mask[pos] = True
+            limit = min(top_k, len(pos) if pos is not None else len(ids))
+
+            sims = (q_matrix @ vectors.T) / (q_norms * norms)
+            if mask is not None:
+                sims = np.where(mask, sims, -np.inf)
+            for q, row in enumerate(sims):
+                if limit < len(row):
+                    top = np.argpartition(-row, limit - 1)[:limit]
+                else:
+                    top = np.arange(len(row))
+                candidates[q].append((ids[top], row[top]))
+
+        results: List[SearchResult] = []
+        for parts_q in candidates:
+            if not parts_q:
+                results.append(_empty_result())
+                continue
+            ids = np.concatenate([c[0] for c in parts_q])
+            scores = np.concatenate([c[1] for c in parts_q])
+            top = np.lexsort((ids, -scores))[:top_k]
+            results.append((ids[top], scores[top]))
+        return results
+
+    def stats(self) -> Dict:
+        segments, memtable = self._view
+        counters = dict(self._counters)
+        with self._query_lock:
+            counters.update(self._query_counters)
+        all_segments = segments + (memtable,)
+        return {
+            "backend": self.backend,
+            "count": sum(seg.live for seg in all_segments),
+            "dim": self.dim,
+            "memory_bytes": int(
+                sum(seg.ids.nbytes + seg.vectors.nbytes + seg.norms.nbytes for seg in segments)
+                + self._mem_vectors.nbytes
+                + self._mem_ids.nbytes
+                + self._mem_norms.nbytes
+            ),
+            "disk_bytes": 0,
+            "segments": len(segments),
+            "segment_rows": [len(seg.ids) for seg in segments],
+            "memtable_rows": len(memtable.ids),
+            "tombstones": sum(len(seg.ids) - seg.live for seg in all_segments),
+            "compactions": counters["compactions"],
+            "write_amplification": (
+                counters["rows_written"] / counters["rows_added"] if counters["rows_added"] else 0.0
+            ),
+            "avg_fanout": (
+                counters["segments_searched"] / counters["queries"] if counters["queries"] else 0.0
+            ),
+        }
+
+    def save(self, path: str) -> None:
+        ids, vectors, _ = self._arrays()
+        with open(path, "wb") as f:
+            np.savez(f, ids=ids, vectors=vectors)
+
+    @classmethod
+    def load(cls, path: str) -> "SegmentedStore":
+        with np.load(path) as data:
+            store = cls(int(data["vectors"].shape[1]))
+            store.add(data["ids"], data["vectors"])
+        return store
+
+    def close(self) -> None:
+        self._stop.set()
+        self._wake.set()
+        if self._compactor is not None:
+            self._compactor.join(timeout=5.0)
+            self._compactor = None
+
+
+STORE_BACKENDS = {
+    "numpy": NumpyStore,
+    "mmap": MmapStore,
+    "sqlite": SQLiteStore,
+    "segmented": SegmentedStore,
+}
+
+
+def create_store(backend: str, dim: int, path: str | None = None) -> VectorStore:
+    """
+    New, empty store. Without a path, mmap uses a fresh temp directory
+    and sqlite an in-memory database.
+    """
+    if backend not in STORE_BACKENDS:
+        raise ValueError(f"Unknown vectorstore backend: {backend}")
+    if backend == "numpy":
+        return NumpyStore(dim)
+    if backend == "segmented":
+        return SegmentedStore(dim)
+    if backend == "mmap":
+        return MmapStore(path or tempfile.mkdtemp(prefix="vectorstore-mmap-"), dim)
+    return SQLiteStore(path or ":memory:", dim)
+
+
+def retire_store(store: VectorStore, drop: bool = False) -> None:
+    """
+    Close a store that has been replaced (drop=True: also delete its
+    files) once the readers that pinned it have released it.
+    """
+    store.retire(drop=drop)
+
+
+def load_store(backend: str, path: str) -> VectorStore:
+    if backend not in STORE_BACKENDS:
+        raise ValueError(f"Unknown vectorstore backend: {backend}")
+    return STORE_BACKENDS[backend].load(path)
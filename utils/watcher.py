@@ -0,0 +1,262 @@
+# utils/watcher.py
+
+from typing import Dict, Tuple
+import hashlib
+import os
+import threading
+import time
+
+from models.embeddings import EmbeddingBackend
+from utils.rag import (
+    METADATA_FILE,
+    assemble_vectorstore,
+    embed_document_segments,
+    load_document,
+    load_metadata,
+    segment_embeddings_by_key,
+)
+from utils.vector_store import retire_store
+
+
+MAX_RETRY_BACKOFF_S = 60.0  # longest wait before retrying a failed rebuild
+
+
+def _text_hash(text: str) -> str:
+    return hashlib.sha1(text.encode("utf-8")).hexdigest()
+
+
+class DocsWatcher:
+    """
+    Background watcher that keeps a vectorstore in sync with a docs directory.
+
+    - Polls file signatures (mtime, size) every poll_interval seconds.
+    - Waits until no change has been seen for `debounce` seconds, then
+      rebuilds on its worker thread, re-chunking only documents whose text
+      changed (unchanged documents reuse their embeddings). Chunks of a
+      changed document that are identical to an old chunk keep their
+      embedding too; with chunking="cdc" that is all but the chunks near
+      the edit.
+    - Publishes the new vectorstore by swapping a single reference, so
+      readers of .vectorstore never see a half-built index and never wait.
+      The previous version's store is closed and its files deleted once
+      the readers that pinned it (see utils.rag.pin_vectorstore) have
+      released it.
+    - A failed rebuild is retried with exponential backoff (up to
+      MAX_RETRY_BACKOFF_S); the changes count as stale until it succeeds.
+
+    Builds are always unsharded (num_shards=0); dedup, projection_dims /
+    projection_method and store_backend / store_dir are as in
+    build_knowledge_base.
+    """
+
+    def __init__(
+        self,
+        docs_dir: str,
+        embed_client: EmbeddingBackend,
+        poll_interval: float = 2.0,
+        debounce: float = 1.0,
+        store_backend: str = "numpy",
+        store_dir: str | None = None,
+        chunking: str | None = None,
+        dedup: bool = False,
+        projection_dims: int = 0,
+        projection_method: str = "pca",
+    ):
+        self.docs_dir = docs_dir
+        self.embed_client = embed_client
+        self.poll_interval = poll_interval
+        self.debounce = debounce
+        self.store_backend = store_backend
+        self.store_dir = store_dir
+        self.chunking = chunking
+        self.dedup = dedup
+        self.projection_dims = projection_dims
+        self.projection_method = projection_method
+
+        self._vectorstore: Dict | None = None
+        self._segments: Dict[str, Tuple[str, Dict]] = {}  # source -> (text hash, segment)
+        self._seen: Dict[str, Tuple[int, int]] = {}  # fname -> (mtime_ns, size)
+        self._first_change_at: float | None = None
+        self._last_change_at: float | None = None
+        self._last_rebuild: Dict = {}
+        self._error: str | None = None
+        self._failures = 0
+        self._retry_at = 0.0
+
+        self._stop = threading.Event()
+        self._thread: threading.Thread | None = None
+
+    @property
+    def vectorstore(self) -> Dict | None:
+        """
+        The latest published vectorstore (None until the first build is done).
+        """
+        return self._vectorstore
+
+    def start(self) -> "DocsWatcher":
+        if self._thread is None:
+            self._thread = threading.Thread(
+                target=self._run, name="docs-watcher", daemon=True
+            )
+            self._thread.start()
+        return self
+
+    def stop(self) -> None:
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(timeout=self.poll_interval + 1.0)
+            self._thread = None
+
+    def _scan(self) -> Dict[str, Tuple[int, int]]:
+        """
+        Signatures of all watched files (.txt docs and metadata.json).
+        """
+        signatures: Dict[str, Tuple[int, int]] = {}
+        try:
+            names = os.listdir(self.docs_dir)
+        except FileNotFoundError:
+            return signatures
+
+        for fname in names:
+            if not (fname.lower().endswith(".txt") or fname == METADATA_FILE):
+                continue
+            try:
+                st = os.stat(os.path.join(self.docs_dir, fname))
+            except FileNotFoundError:
+                continue  # deleted between listdir and stat
+            signatures[fname] = (st.st_mtime_ns, st.st_size)
+        return signatures
+
+    def _run(self) -> None:
+        # Initial build right away, then poll
+        self._first_change_at = time.time()
+        self._rebuild(self._scan())
+
+        while not self._stop.wait(self.poll_interval):
+            signatures = self._scan()
+            now = time.time()
+
+            if signatures != self._seen:
+                if self._first_change_at is None:
+                    self._first_change_at = now
+                self._last_change_at = now
+                self._seen = signatures
+                continue
+
+            if (
+                self._first_change_at is not None
+                and now - (self._last_change_at or 0) >= self.debounce
+                and now >= self._retry_at
+            ):
+                self._rebuild(signatures)
+
+    def _rebuild(self, signatures: Dict[str, Tuple[int, int]]) -> None:
+        """
+        Re-embed changed documents and publish a new vectorstore version.
+        """
+        start = time.perf_counter()
+        self._seen = signatures
+
+        try:
+            metadata = load_metadata(self.docs_dir)
+            docs = []
+            for fname in sorted(signatures):
+                if fname == METADATA_FILE:
+                    continue
+                doc = load_document(self.docs_dir, fname, metadata)
+                if doc is not None:
+                    docs.append(doc)
+
+            changed = [
+                d
+                for d in docs
+                if self._segments.get(d["source"], ("",))[0] != _text_hash(d["text"])
+            ]
+            # Chunks of changed documents that already existed keep their vectors
+            reuse = segment_embeddings_by_key(
+                [seg for _, seg in self._segments.values()] if changed else []
+            )
+            embed_stats: Dict = {}
+            fresh = {
+                seg["doc"]["source"]: seg
+                for seg in embed_document_segments(
+                    changed,
+                    self.embed_client,
+                    dedup=self.dedup,
+                    stats=embed_stats,
+                    chunking=self.chunking,
+                    reuse=reuse,
+                )
+            }
+
+            segments: Dict[str, Tuple[str, Dict]] = {}
+            for d in docs:
+                if d["source"] in fresh:
+                    seg = fresh[d["source"]]
+                else:
+                    # Reuse embeddings; refresh metadata (tags/date may have changed)
+                    seg = dict(self._segments[d["source"]][1], doc=d)
+                segments[d["source"]] = (_text_hash(d["text"]), seg)
+
+            previous = self._vectorstore
+            version = previous["version"] + 1 if previous else 1
+            vectorstore = assemble_vectorstore(
+                [seg for _, seg in segments.values()],
+                version=version,
+                dedup=self.dedup,
+                projection_dims=self.projection_dims,
+                projection_method=self.projection_method,
+                store_backend=self.store_backend,
+                store_dir=self.store_dir,
+            )
+        except Exception as e:
+            # Changes stay pending (and stale): retry after a backoff
+            self._failures += 1
+            backoff = min(MAX_RETRY_BACKOFF_S, max(self.debounce, 1.0) * 2 ** (self._failures - 1))
+            self._retry_at = time.time() + backoff
+            self._error = str(e)
+            print(f"[DocsWatcher] Rebuild failed (retrying in {backoff:.0f}s): {e}")
+            return
+
+        removed = set(self._segments) - set(segments)
+        embedded = embed_stats.get("chunks_embedded", 0)
+        reused = embed_stats.get("chunks_reused", 0)
+
+        # Atomic publish: a single reference assignment
+        self._segments = segments
+        self._vectorstore = vectorstore
+        self._error = None
+        self._failures = 0
+        self._retry_at = 0.0
+        self._first_change_at = None
+        if previous is not None:
+            # The store is this watcher's own (temp dir or store_dir): delete it
+            retire_store(previous["store"], drop=True)
+        self._last_rebuild = {
+            "docs_total": len(docs),
+            "docs_reembedded": len(changed),
+            "docs_removed": len(removed),
+            "chunks_reembedded": embedded,
+            "chunks_reused": reused,
+            "chunk_reuse_rate": reused / (embedded + reused) if embedded + reused else 0.0,
+            "duration_ms": (time.perf_counter() - start) * 1000,
+        }
+
+    def status(self) -> Dict:
+        """
+        Index version and staleness, for display in the UI.
+
+        stale_seconds: how long changes on disk have been waiting to be
+        published (0 when the index is up to date).
+        """
+        vs = self._vectorstore
+        now = time.time()
+        return {
+            "version": vs["version"] if vs else 0,
+            "built_at": vs["built_at"] if vs else None,
+            "age_seconds": now - vs["built_at"] if vs else None,
+            "stale_seconds": now - self._first_change_at if self._first_change_at else 0.0,
+            "last_rebuild": dict(self._last_rebuild),
+            "error": self._error,
+            "failures": self._failures,
+        }